@@ -0,0 +1,221 @@
+"""
+Онлайн-бэкап SQLite без остановки бота.
+
+Копия снимается через sqlite3 backup API небольшими шагами (BACKUP_PAGES
+страниц) с паузой между ними: между шагами база не заблокирована, бот и
+отправщик продолжают писать. Если базу изменили во время копирования, SQLite
+начинает его заново (после нескольких перезапусков докопируем одним шагом) —
+копия всегда целостная. Копия проверяется
+PRAGMA integrity_check, по желанию сжимается gzip и кладётся в BACKUP_DIR;
+хранятся последние BACKUP_KEEP штук.
+
+    python -m src.backup backup             # снять копию сейчас
+    python -m src.backup list
+    python -m src.backup restore backups/workout_bot-20260101-040000.db.gz
+
+Восстанавливать лучше при остановленном боте. В боте копия снимается
+ежедневно в BACKUP_HOUR (job планировщика, выполняется в потоке) и по /backup.
+"""
+from datetime import datetime
+from pathlib import Path
+import argparse
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import time
+
+from .config import DATABASE_URL, BACKUP_DIR, BACKUP_KEEP, BACKUP_PAGES, BACKUP_SLEEP, BACKUP_COMPRESS
+
+logger = logging.getLogger(__name__)
+
+CHUNK = 1024 * 1024
+MAX_RESTARTS = 3
+
+
+def database_path(url: str = DATABASE_URL) -> Path:
+    """Путь к файлу SQLite из DATABASE_URL. Бросает ValueError для других БД."""
+    from sqlalchemy.engine import make_url
+
+    u = make_url(url)
+    if not u.drivername.startswith("sqlite") or not u.database or u.database == ":memory:":
+        raise ValueError("онлайн-бэкап есть только для файловой SQLite")
+    return Path(u.database)
+
+
+class _Restarted(Exception):
+    pass
+
+
+def _copy(src: Path, dst: Path, pages: int, sleep: float) -> int:
+    """
+    Постраничное копирование src -> dst. Возвращает число страниц.
+
+    Запись в src из другого соединения начинает копирование заново. Если это
+    случилось MAX_RESTARTS раз (база пишется непрерывно), докопируем одним шагом:
+    в WAL это одна читающая транзакция, писателей она не блокирует.
+    """
+    restarts = 0
+    left = None
+
+    def progress(status, remaining, count):
+        nonlocal restarts, left
+        if left is not None and remaining > left:
+            restarts += 1
+            if restarts >= MAX_RESTARTS:
+                raise _Restarted()
+        left = remaining
+
+    source = sqlite3.connect(f"file:{src}?mode=ro", uri=True, timeout=30)
+    target = sqlite3.connect(dst)
+    try:
+        try:
+            source.backup(target, pages=pages, progress=progress, sleep=sleep)
+        except _Restarted:
+            logger.info(f"Backup of {src} restarted {restarts} times by writers, copying in one step")
+            source.backup(target, pages=-1)
+        ok = target.execute("PRAGMA integrity_check").fetchone()[0]
+        if ok != "ok":
+            raise RuntimeError(f"integrity_check: {ok}")
+        return target.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        target.close()
+        source.close()
+
+
+def backup(dest_dir: str | Path = BACKUP_DIR, keep: int = BACKUP_KEEP, pages: int = BACKUP_PAGES,
+           sleep: float = BACKUP_SLEEP, compress: bool = BACKUP_COMPRESS,
+           db_path: Path | None = None) -> dict:
+    """Снять копию. Возвращает {'path', 'pages', 'db_bytes', 'file_bytes', 'seconds', 'mb_per_s'}."""
+    src = db_path or database_path()
+    dest_dir = Path(dest_dir)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    name = f"{src.stem}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.db"
+    tmp = dest_dir / f".{name}.tmp"
+
+    started = time.perf_counter()
+    try:
+        n_pages = _copy(src, tmp, pages, sleep)
+        db_bytes = tmp.stat().st_size
+        if compress:
+            final = dest_dir / f"{name}.gz"
+            with open(tmp, "rb") as f_in, gzip.open(f"{final}.tmp", "wb", compresslevel=6) as f_out:
+                shutil.copyfileobj(f_in, f_out, CHUNK)
+            os.replace(f"{final}.tmp", final)
+            tmp.unlink()
+        else:
+            final = dest_dir / name
+            os.replace(tmp, final)
+    except Exception:
+        tmp.unlink(missing_ok=True)
+        raise
+    seconds = time.perf_counter() - started
+
+    removed = rotate(dest_dir, src.stem, keep)
+    result = {
+        "path": str(final), "pages": n_pages, "db_bytes": db_bytes,
+        "file_bytes": final.stat().st_size, "seconds": seconds,
+        "mb_per_s": db_bytes / 1024 / 1024 / seconds if seconds else 0.0,
+    }
+    logger.info(f"Backup {final}: {db_bytes / 1024 / 1024:.1f} MB, {n_pages} pages in {seconds:.1f}s "
+                f"({result['mb_per_s']:.1f} MB/s), removed {removed} old")
+    return result
+
+
+def list_backups(dest_dir: str | Path = BACKUP_DIR, stem: str | None = None) -> list[Path]:
+    """Копии от новых к старым."""
+    stem = stem or database_path().stem
+    dest_dir = Path(dest_dir)
+    if not dest_dir.is_dir():
+        return []
+    files = [p for p in dest_dir.glob(f"{stem}-*.db*") if p.name.endswith((".db", ".db.gz"))]
+    return sorted(files, key=lambda p: p.name, reverse=True)
+
+
+def rotate(dest_dir: str | Path, stem: str, keep: int) -> int:
+    old = list_backups(dest_dir, stem)[keep:] if keep > 0 else []
+    for p in old:
+        p.unlink(missing_ok=True)
+    return len(old)
+
+
+def restore(archive: str | Path, db_path: Path | None = None, pages: int = BACKUP_PAGES) -> dict:
+    """
+    Записать копию поверх рабочей базы (через тот же backup API, поэтому открытые
+    соединения увидят целостную базу). Перед этим текущая база сохраняется рядом.
+    """
+    archive = Path(archive)
+    target = db_path or database_path()
+    started = time.perf_counter()
+
+    work = archive
+    if archive.suffix == ".gz":
+        work = target.with_name(f".{target.name}.restore.tmp")
+        with gzip.open(archive, "rb") as f_in, open(work, "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out, CHUNK)
+    try:
+        check = sqlite3.connect(f"file:{work}?mode=ro", uri=True)
+        try:
+            ok = check.execute("PRAGMA integrity_check").fetchone()[0]
+        finally:
+            check.close()
+        if ok != "ok":
+            raise RuntimeError(f"копия повреждена: {ok}")
+
+        saved = None
+        if target.exists():
+            saved = target.with_name(f"{target.name}.before-restore-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+            _copy(target, saved, pages, 0)
+        n_pages = _copy(work, target, pages, 0)
+    finally:
+        if work is not archive:
+            work.unlink(missing_ok=True)
+    seconds = time.perf_counter() - started
+    logger.info(f"Restored {target} from {archive}: {n_pages} pages in {seconds:.1f}s")
+    return {"path": str(target), "previous": str(saved) if saved else None,
+            "pages": n_pages, "seconds": seconds}
+
+
+def format_result(r: dict) -> str:
+    return (
+        f"💾 Бэкап: {r['path']}\n"
+        f"{r['db_bytes'] / 1024 / 1024:.1f} МБ → {r['file_bytes'] / 1024 / 1024:.1f} МБ, "
+        f"{r['pages']} стр. за {r['seconds']:.1f} с ({r['mb_per_s']:.1f} МБ/с)"
+    )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Online SQLite backup")
+    sub = parser.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("backup", help="take a backup now")
+    b.add_argument("--dir", default=BACKUP_DIR)
+    b.add_argument("--keep", type=int, default=BACKUP_KEEP)
+    b.add_argument("--pages", type=int, default=BACKUP_PAGES, help="pages per step")
+    b.add_argument("--sleep", type=float, default=BACKUP_SLEEP, help="pause between steps, seconds")
+    b.add_argument("--no-compress", action="store_true")
+    ls = sub.add_parser("list", help="list backups")
+    ls.add_argument("--dir", default=BACKUP_DIR)
+    r = sub.add_parser("restore", help="restore the database from a backup (stop the bot first)")
+    r.add_argument("archive")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.command == "backup":
+        res = backup(args.dir, args.keep, args.pages, args.sleep, compress=not args.no_compress)
+        print(format_result(res))
+    elif args.command == "list":
+        for p in list_backups(args.dir):
+            print(f"{p}  {p.stat().st_size / 1024 / 1024:.1f} МБ")
+    else:
+        res = restore(args.archive)
+        print(f"Восстановлено: {res['path']} ({res['pages']} стр. за {res['seconds']:.1f} с)")
+        if res["previous"]:
+            print(f"Прежняя база сохранена в {res['previous']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,26 +1,53 @@
 import asyncio
 import logging
-import re
+import os
 from datetime import datetime
 import pytz
 
 from aiogram import Bot, Dispatcher, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, FSInputFile, BufferedInputFile
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command, CommandStart
 from aiogram.fsm.storage.memory import MemoryStorage
-
-from .config import BOT_TOKEN, TIMEZONE, LOG_LEVEL
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+
+from .config import (
+    TENANTS, LOG_LEVEL, ADMIN_IDS, SLOW_UPDATE_MS,
+    HEAVY_COMMANDS, THROTTLE_CHEAP_RATE, THROTTLE_CHEAP_BURST,
+    THROTTLE_HEAVY_RATE, THROTTLE_HEAVY_BURST, THROTTLE_MAX_USERS, THROTTLE_IDLE_TTL,
+    SEND_RATE, SEND_CONCURRENCY, BROADCAST_CHUNK, USE_OUTBOX, BACKUP_HOUR, PROFILE_SECONDS
+)
 from .db import (
     init_db, get_or_create_user, create_reminder,
     get_active_reminders, get_reminder_by_id, delete_reminder,
-    mark_workout_completed, get_user_stats, get_db, rename_reminder,
-    get_any_reminder_by_id   # ищем напоминание без фильтра is_active
+    mark_workout_completed, get_user_stats, rename_reminder,
+    get_any_reminder_by_id,  # ищем напоминание без фильтра is_active
+    set_reminder_job_id, count_active_reminders, set_reminders_inactive,
+    create_broadcast, cancel_broadcast, bulk_create_reminders, get_reminders_by_ids,
+    get_streak, get_challenge, get_user_challenges, get_challenge_top, search_enabled,
+    set_user_timezone, get_outbox_stats, text_cache, count_active_users_by_tenant
 )
 from .scheduler import (
-    set_bot_instance, start_scheduler, stop_scheduler,
+    start_scheduler, stop_scheduler,
     restore_reminders_from_db, schedule_once_reminder,
-    schedule_everyday_reminder, schedule_days_reminder, remove_job
+    schedule_everyday_reminder, schedule_days_reminder, remove_job,
+    schedule_many, coalescer, start_heartbeat, snoozes, snooze_reminders,
+    schedule_day_close, schedule_projections, reschedule_user, schedule_backup,
+    schedule_snapshots, save_schedule_snapshot, schedule_load_planner
 )
+from . import streaks, challenges, search, training
+from .catchup import read_heartbeat, write_heartbeat, catch_up_missed
+from .middlewares import QueryStatsMiddleware, ThrottlingMiddleware, TaskTimingMiddleware, register_commands
+from .parsing import validate_time_format, parse_days, days_list_to_str, parse_once_args
+from .importer import parse_import_lines
+from .ratelimit import BucketRegistry
+from .delivery import RateLimitedSender
+from .broadcast import start_broadcast, resume_broadcasts
+from .timezones import get_tz, local_now, parse_tz, describe
+from .session import create_session, metrics as api_metrics, format_metrics
+from .loadplan import planner
+from . import querystats, profiler, export, heatmap, tenants
 
 # ---------------- Logging ----------------
 logging.basicConfig(
@@ -30,39 +57,68 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # ---------------- Bot/DP -----------------
-bot = Bot(token=BOT_TOKEN)
+# Один Dispatcher опрашивает все боты из BOT_TOKENS (tenants.py); HTTP-сессия общая.
+# bot — первый из них (бот по умолчанию).
+session = create_session()
+bots = [Bot(token=token, session=session) for _, token in TENANTS]
+bot = bots[0]
 dp = Dispatcher(storage=MemoryStorage())
+dp.update.outer_middleware(tenants.TenantMiddleware())
+dp.update.outer_middleware(QueryStatsMiddleware(slow_ms=SLOW_UPDATE_MS))
+dp.update.outer_middleware(TaskTimingMiddleware())
+
+throttling = ThrottlingMiddleware(
+    heavy_commands=HEAVY_COMMANDS,
+    cheap=BucketRegistry(THROTTLE_CHEAP_RATE, THROTTLE_CHEAP_BURST,
+                         max_size=THROTTLE_MAX_USERS, idle_ttl=THROTTLE_IDLE_TTL),
+    heavy=BucketRegistry(THROTTLE_HEAVY_RATE, THROTTLE_HEAVY_BURST,
+                         max_size=THROTTLE_MAX_USERS, idle_ttl=THROTTLE_IDLE_TTL),
+)
+dp.message.outer_middleware(throttling)
+dp.callback_query.outer_middleware(throttling)
+
+# у каждого бота свой лимитированный отправитель для массовых сообщений (лимит
+# Telegram — на бота); все уступают напоминаниям
+for (name, _), b in zip(TENANTS, bots):
+    tenants.register(tenants.Tenant(name, b, RateLimitedSender(
+        b, rate=SEND_RATE, concurrency=SEND_CONCURRENCY, admit=planner.admit)))
 
 
 # --------------- Helpers -----------------
-def validate_time_format(time_str: str) -> bool:
-    return bool(re.match(r'^([01]?[0-9]|2[0-3]):([0-5][0-9])$', time_str))
-
-
-def parse_days(days_str: str):
-    mapping = {
-        'пн': 0, 'вт': 1, 'ср': 2, 'чт': 3, 'пт': 4, 'сб': 5, 'вс': 6,
-        'mon': 0, 'tue': 1, 'wed': 2, 'thu': 3, 'fri': 4, 'sat': 5, 'sun': 6
-    }
-    items = [d.strip().lower() for d in days_str.split(',') if d.strip()]
-    if not items:
-        return False, "Не указаны дни недели."
-    nums = []
-    for d in items:
-        if d not in mapping:
-            return False, f"Неизвестный день недели: {d}"
-        nums.append(mapping[d])
-    seen, out = set(), []
-    for x in nums:
-        if x not in seen:
-            out.append(x)
-            seen.add(x)
-    return True, out
-
-
-def days_list_to_str(days: list[int]) -> str:
-    back = ['пн', 'вт', 'ср', 'чт', 'пт', 'сб', 'вс']
-    return ",".join(back[d] for d in days)
+class LogStates(StatesGroup):
+    # после «✅» ждём необязательную запись подходов
+    after_done = State()
+
+
+ADD_USAGE = (
+    "Формат: /add [когда] HH:MM текст\n"
+    "Когда: завтра, послезавтра, +3d, 25.12 — или /add +2h текст, /add +30m текст"
+)
+
+
+def format_fire_at(fire_at_utc: datetime, tz: str | None = None) -> str:
+    """naive UTC -> 'ДД.ММ HH:MM' в зоне пользователя."""
+    local = fire_at_utc.replace(tzinfo=pytz.utc).astimezone(get_tz(tz))
+    return local.strftime("%d.%m %H:%M")
+
+
+def is_admin(user_id: int) -> bool:
+    return user_id in ADMIN_IDS
+
+
+async def notify_admin(chat_id: int, text: str) -> None:
+    """Сообщение админу от бота текущего арендатора."""
+    tenant = tenants.get(tenants.current())
+    try:
+        await (tenant.bot if tenant else bot).send_message(chat_id=chat_id, text=text)
+    except Exception as e:
+        logger.error(f"Failed to notify admin {chat_id}: {e}")
+
+
+async def notify_profile(path, sampler) -> None:
+    """Профиль по SIGUSR1 готов — сводку админам."""
+    for admin_id in ADMIN_IDS:
+        await notify_admin(admin_id, f"📄 {path}\n" + sampler.summary()[:3500])
 
 
 # --------------- Commands ----------------
@@ -78,39 +134,32 @@ async def start_command(message: Message):
         f"💪 Привет, {message.from_user.first_name}!\n\n"
         "Я твой помощник-напоминалка о тренировках 🏋️‍♂️\n\n"
         "Команды:\n"
-        "• /add HH:MM текст — разовое на сегодня\n"
+        "• /add [завтра|+3d|25.12] HH:MM текст — разовое\n"
         "• /everyday HH:MM текст — каждый день\n"
         "• /days пн,ср,пт HH:MM текст — по дням недели\n"
+        "• /import + строки команд — много напоминаний разом\n"
         "• /rename ID новый_текст — переименовать\n"
         "• /list — список активных\n"
+        "• /find слова — поиск по напоминаниям и истории\n"
         "• /delete ID — удалить\n"
         "• /done ID — отметить выполненным\n"
-        "• /stats — статистика за 7 дней\n\n"
-        "• /weeks [N] — недельные итоги (последние N недель, по умолчанию 8)\n\n"
-        "Пример: /add 18:00 Тренировка в спортзале 💪"
+        "• /log жим 3x8 80кг — записать упражнения, /progress — рекорды\n"
+        "• /export [csv|json] [gz] — выгрузить всю историю файлом\n"
+        "• /stats — статистика за 7 дней, /heatmap — календарь за год\n"
+        "• /tz Europe/Moscow — твой часовой пояс\n\n"
+        "• /weeks [N] — недельные итоги (последние N недель, по умолчанию 8)\n"
+        "• /challenge 30d Название — групповой челлендж, /join КОД, /top\n\n"
+        "Пример: /add завтра 18:00 Тренировка в спортзале 💪"
     )
 
 
 @dp.message(Command("add"))
 async def add_reminder(message: Message):
-    """Create one-time reminder for today."""
+    """Create one-time reminder: /add [завтра|+3d|25.12] HH:MM текст или /add +2h текст."""
     try:
-        args = message.text.split(' ', 2)
-        if len(args) < 3:
-            await message.answer("❌ Формат: /add HH:MM текст")
-            return
-
-        time_str, text = args[1].strip(), args[2].strip()
-        if not validate_time_format(time_str):
-            await message.answer("❌ Время должно быть в формате HH:MM, напр. 18:00")
-            return
-
-        tz = pytz.timezone(TIMEZONE)
-        now = datetime.now(tz)
-        h, m = map(int, time_str.split(":"))
-        target = now.replace(hour=h, minute=m, second=0, microsecond=0)
-        if target <= now:
-            await message.answer("❌ Это время уже прошло сегодня. Укажи более позднее.")
+        args = message.text.split(maxsplit=1)
+        if len(args) < 2:
+            await message.answer(ADD_USAGE)
             return
 
         user = get_or_create_user(
@@ -119,17 +168,25 @@ async def add_reminder(message: Message):
             first_name=message.from_user.first_name,
             last_name=message.from_user.last_name
         )
+        try:
+            spec = parse_once_args(args[1], local_now(user.timezone))
+        except ValueError as e:
+            await message.answer(f"❌ {str(e).capitalize()}.\n\n{ADD_USAGE}")
+            return
 
-        reminder = create_reminder(user_id=user.id, reminder_type="once", time=time_str, text=text)
-        job_id = schedule_once_reminder(reminder.id, message.from_user.id, time_str, text)
+        reminder = create_reminder(user_id=user.id, reminder_type="once", time=spec.time,
+                                   text=spec.text, fire_at=spec.fire_at)
+        job_id = schedule_once_reminder(reminder.id, message.from_user.id, spec.time, spec.text,
+                                        fire_at=spec.fire_at, tz=user.timezone)
 
         if job_id:
-            with get_db() as dbs:
-                db_rem = dbs.get(reminder.__class__, reminder.id)
-                db_rem.job_id = job_id
-                dbs.commit()
-            await message.answer(f"✅ Напоминание создано!\n🕐 {time_str}\n📝 {text}\n🆔 ID: {reminder.id}")
+            set_reminder_job_id(reminder.id, job_id)
+            await message.answer(
+                f"✅ Напоминание создано!\n🕐 {format_fire_at(spec.fire_at, user.timezone)}\n📝 {spec.text}\n🆔 ID: {reminder.id}"
+            )
         else:
+            # не осталось активной строки без job'а (списки, догонялка, прогноз нагрузки)
+            set_reminders_inactive([reminder.id])
             await message.answer("❌ Не удалось запланировать напоминание.")
     except Exception as e:
         logger.exception("Error in /add: %s", e)
@@ -157,15 +214,13 @@ async def everyday_reminder(message: Message):
         )
 
         reminder = create_reminder(user_id=user.id, reminder_type="everyday", time=time_str, text=text)
-        job_id = schedule_everyday_reminder(reminder.id, message.from_user.id, time_str, text)
+        job_id = schedule_everyday_reminder(reminder.id, message.from_user.id, time_str, text, user.timezone)
 
         if job_id:
-            with get_db() as dbs:
-                db_rem = dbs.get(reminder.__class__, reminder.id)
-                db_rem.job_id = job_id
-                dbs.commit()
+            set_reminder_job_id(reminder.id, job_id)
             await message.answer(f"✅ Ежедневное напоминание создано!\n🕐 {time_str}\n📝 {text}\n🆔 ID: {reminder.id}")
         else:
+            set_reminders_inactive([reminder.id])
             await message.answer("❌ Не удалось запланировать ежедневное напоминание.")
     except Exception as e:
         logger.exception("Error in /everyday: %s", e)
@@ -204,23 +259,106 @@ async def days_reminder(message: Message):
         reminder = create_reminder(
             user_id=user.id, reminder_type="days", time=time_str, text=text, days=days_str_norm
         )
-        job_id = schedule_days_reminder(reminder.id, message.from_user.id, time_str, days_str_norm, text)
+        job_id = schedule_days_reminder(reminder.id, message.from_user.id, time_str, days_str_norm, text,
+                                        user.timezone)
 
         if job_id:
-            with get_db() as dbs:
-                db_rem = dbs.get(reminder.__class__, reminder.id)
-                db_rem.job_id = job_id
-                dbs.commit()
+            set_reminder_job_id(reminder.id, job_id)
             await message.answer(
                 f"✅ Напоминание по дням создано!\n📅 Дни: {days_str_norm}\n🕐 {time_str}\n📝 {text}\n🆔 ID: {reminder.id}"
             )
         else:
+            set_reminders_inactive([reminder.id])
             await message.answer("❌ Не удалось запланировать напоминание по дням.")
     except Exception as e:
         logger.exception("Error in /days: %s", e)
         await message.answer("❌ Ошибка при создании напоминания.")
 
 
+@dp.message(Command("import"))
+async def import_reminders(message: Message):
+    """
+    Много напоминаний одним сообщением, по одному на строку:
+    /import
+    /days пн,ср,пт 07:00 Пресс
+    /everyday 21:00 Растяжка
+    """
+    try:
+        body = message.text.split(maxsplit=1)
+        lines = body[1].splitlines() if len(body) > 1 else []
+        user = get_or_create_user(
+            telegram_id=message.from_user.id,
+            username=message.from_user.username,
+            first_name=message.from_user.first_name,
+            last_name=message.from_user.last_name
+        )
+        specs, errors = parse_import_lines(lines, local_now(user.timezone))
+        if errors:
+            await message.answer("❌ Ничего не импортировано:\n" + "\n".join(errors[:20]))
+            return
+        if not specs:
+            await message.answer(
+                "❌ Формат: /import и дальше по строке на напоминание:\n"
+                "/days пн,ср,пт 07:00 Пресс\n/everyday 21:00 Растяжка"
+            )
+            return
+
+        _, ids = bulk_create_reminders(
+            telegram_id=message.from_user.id,
+            specs=specs,
+            username=message.from_user.username,
+            first_name=message.from_user.first_name,
+            last_name=message.from_user.last_name
+        )
+        scheduled = schedule_many(ids, message.from_user.id, specs, user.timezone)
+
+        lines = [f"✅ Импортировано напоминаний: {len(ids)} (запланировано {scheduled})\n"]
+        for rid, sp in zip(ids, specs):
+            when = sp.days + " " + sp.time if sp.days else sp.time
+            lines.append(f"🆔 {rid} · {when} · {sp.text}")
+        await message.answer("\n".join(lines))
+    except Exception as e:
+        logger.exception("Error in /import: %s", e)
+        await message.answer("❌ Ошибка при импорте напоминаний.")
+
+
+@dp.message(Command("tz"))
+async def tz_command(message: Message):
+    """/tz [зона] — показать или сменить часовой пояс (Europe/Moscow, Москва, UTC+3)."""
+    try:
+        user = get_or_create_user(
+            telegram_id=message.from_user.id,
+            username=message.from_user.username,
+            first_name=message.from_user.first_name,
+            last_name=message.from_user.last_name
+        )
+        parts = message.text.split(maxsplit=1)
+        if len(parts) < 2 or not parts[1].strip():
+            await message.answer(
+                f"🌍 Твой часовой пояс: {describe(user.timezone)}\n"
+                f"Сейчас у тебя: {local_now(user.timezone).strftime('%H:%M')}\n\n"
+                "Сменить: /tz Europe/Moscow, /tz Москва или /tz UTC+3"
+            )
+            return
+        try:
+            tz = parse_tz(parts[1])
+        except ValueError as e:
+            await message.answer(f"❌ {str(e).capitalize()}.\nПримеры: /tz Europe/Moscow, /tz Алматы, /tz UTC+5:30")
+            return
+
+        set_user_timezone(user.id, tz)
+        moved = reschedule_user(get_active_reminders(user_id=user.id), tz)
+        await message.answer(
+            f"✅ Часовой пояс: {describe(tz)}\n"
+            f"Сейчас у тебя: {local_now(tz).strftime('%H:%M')}\n"
+            f"Повторяющихся напоминаний перенесено: {moved}.\n"
+            "Разовые сработают в уже назначенный момент."
+        )
+    except Exception as e:
+        logger.exception("Error in /tz: %s", e)
+        await message.answer("❌ Ошибка при смене часового пояса.")
+
+
 @dp.message(Command("list"))
 async def list_reminders(message: Message):
     try:
@@ -242,9 +380,10 @@ async def list_reminders(message: Message):
                 'Разовое' if r.reminder_type == 'once'
                 else ('Ежедневно' if r.reminder_type == 'everyday' else f"По дням: {r.days}")
             )
+            when = format_fire_at(r.fire_at, r.tz) if r.reminder_type == 'once' and r.fire_at else r.time
             lines.append(
                 f"{type_emoji.get(r.reminder_type, '🔔')} **ID {r.id}**\n"
-                f"⏰ {r.time}\n"
+                f"⏰ {when}\n"
                 f"📝 {r.text}\n"
                 f"📊 {type_text}\n"
                 f"📅 Создано: {r.created_at.strftime('%d.%m.%Y %H:%M')}\n"
@@ -255,6 +394,59 @@ async def list_reminders(message: Message):
         await message.answer("❌ Произошла ошибка при получении списка.")
 
 
+@dp.message(Command("find"))
+async def find_command(message: Message):
+    """/find слова — поиск по текстам напоминаний и выполненных тренировок."""
+    try:
+        parts = message.text.split(maxsplit=1)
+        query = parts[1].strip() if len(parts) > 1 else ""
+        if not search.build_match(query):
+            await message.answer("❌ Формат: /find слова (например: /find бег парк)")
+            return
+        if not search_enabled():
+            await message.answer("😕 Поиск сейчас недоступен.")
+            return
+
+        user = get_or_create_user(
+            telegram_id=message.from_user.id,
+            username=message.from_user.username,
+            first_name=message.from_user.first_name,
+            last_name=message.from_user.last_name
+        )
+        rows, has_next = search.find_page(user.id, query, 0)
+        search.remember_query(message.chat.id, query)
+        await message.answer(search.format_page(query, rows, 0, user.timezone),
+                             reply_markup=search.page_keyboard(0, has_next))
+    except Exception as e:
+        logger.exception("Error in /find: %s", e)
+        await message.answer("❌ Ошибка поиска.")
+
+
+@dp.callback_query(F.data.startswith("find_"))
+async def handle_find_page(callback: CallbackQuery):
+    """Кнопки «◀ Назад / Дальше ▶» под результатами /find."""
+    try:
+        page = max(0, int(callback.data.split("_")[1]))
+        query = search.last_query(callback.message.chat.id)
+        if not query:
+            await callback.answer("Повтори поиск: /find слова", show_alert=True)
+            return
+
+        user = get_or_create_user(
+            telegram_id=callback.from_user.id,
+            username=callback.from_user.username,
+            first_name=callback.from_user.first_name,
+            last_name=callback.from_user.last_name
+        )
+        rows, has_next = search.find_page(user.id, query, page)
+        await callback.message.edit_text(search.format_page(query, rows, page, user.timezone),
+                                         reply_markup=search.page_keyboard(page, has_next))
+        await callback.answer()
+    except Exception as e:
+        logger.exception("Error in find callback: %s", e)
+        await callback.answer("❌ Ошибка.", show_alert=True)
+
+
 @dp.message(Command("delete"))
 async def delete_reminder_command(message: Message):
     try:
@@ -332,17 +524,17 @@ async def rename_reminder_command(message: Message):
             remove_job(reminder.job_id)
 
         if reminder.reminder_type == "once":
-            job_id = schedule_once_reminder(reminder.id, message.from_user.id, reminder.time, new_text)
+            job_id = schedule_once_reminder(reminder.id, message.from_user.id, reminder.time, new_text,
+                                            fire_at=reminder.fire_at, tz=reminder.tz)
         elif reminder.reminder_type == "everyday":
-            job_id = schedule_everyday_reminder(reminder.id, message.from_user.id, reminder.time, new_text)
+            job_id = schedule_everyday_reminder(reminder.id, message.from_user.id, reminder.time, new_text,
+                                                reminder.tz)
         else:
-            job_id = schedule_days_reminder(reminder.id, message.from_user.id, reminder.time, reminder.days, new_text)
+            job_id = schedule_days_reminder(reminder.id, message.from_user.id, reminder.time, reminder.days,
+                                            new_text, reminder.tz)
 
         if job_id:
-            with get_db() as dbs:
-                db_rem = dbs.get(reminder.__class__, reminder.id)
-                db_rem.job_id = job_id
-                dbs.commit()
+            set_reminder_job_id(reminder.id, job_id)
 
         await message.answer(f"✏ Напоминание {reminder_id} изменено на: {new_text}")
     except Exception as e:
@@ -351,7 +543,7 @@ async def rename_reminder_command(message: Message):
 
 
 @dp.message(Command("done"))
-async def mark_done_command(message: Message):
+async def mark_done_command(message: Message, state: FSMContext):
     """Manual /done ID (optional, кнопка обычно удобнее)."""
     try:
         args = message.text.split()
@@ -378,8 +570,14 @@ async def mark_done_command(message: Message):
             await message.answer("❌ Напоминание не найдено.")
             return
 
-        mark_workout_completed(reminder_id, user.id, reminder.text)
-        await message.answer(f"🎉 Отлично! Тренировка выполнена!\n💪 {reminder.text}\n⭐ Так держать!")
+        completed_id = mark_workout_completed(reminder_id, user.id, reminder.text)
+        snoozes.cancel(message.from_user.id, reminder_id)
+        streaks.on_workout_completed(user.id, user.timezone)
+        challenges.on_workout_completed(user.id, user.timezone)
+        await state.set_state(LogStates.after_done)
+        await state.update_data(completed_id=completed_id)
+        await message.answer(f"🎉 Отлично! Тренировка выполнена!\n💪 {reminder.text}\n⭐ Так держать!\n\n"
+                             f"📝 Можешь записать, что сделал — просто ответь: жим 3x8 80кг")
     except Exception as e:
         logger.exception("Error in /done: %s", e)
         await message.answer("❌ Ошибка при отметке выполнения.")
@@ -391,7 +589,7 @@ async def stats_command(message: Message):
     Статистика за 7 дней:
     - по дням: 'ДД.ММ.ГГГГ — X из Y' + прогресс-бар + ✅ для 100%
     - лучший и слабый день
-    - текущая серия 100%-дней (streak)
+    - текущая и лучшая серия 100%-дней (streak)
     - среднее выполнение за день
     - активные напоминания сейчас
     """
@@ -404,8 +602,8 @@ async def stats_command(message: Message):
         )
 
         # Посуточные данные за 7 дней (сегодня, вчера, ...)
-        from .db import get_daily_7d_ratio, get_active_reminders
-        items = get_daily_7d_ratio(user.id, tz_str=TIMEZONE)
+        from .db import get_daily_7d_ratio
+        items = get_daily_7d_ratio(user.id, tz_str=user.timezone)
 
         if not items:
             await message.answer("📊 Пока нет данных за последние 7 дней. Начнём с первой тренировки! 💪")
@@ -424,15 +622,8 @@ async def stats_command(message: Message):
         best_line = max(planned_days, key=ratio) if planned_days else None
         worst_line = min(planned_days, key=ratio) if planned_days else None
 
-        # Серия 100% от сегодняшнего дня назад (дни без плана пропускаем)
-        streak = 0
-        for it in items:
-            if it["planned"] == 0:
-                continue
-            if it["done"] >= it["planned"]:
-                streak += 1
-            else:
-                break
+        # Серия 100%: хранится у пользователя и ведётся инкрементально
+        streak = get_streak(user.id)
 
         # Строки по дням
         lines = [f"📊 Статистика за {len(items)} дней:\n"]
@@ -467,11 +658,13 @@ async def stats_command(message: Message):
             lines.append(f"⚠️ Сложный день: {worst_line['date']} — {worst_line['done']}/{worst_line['planned']} ({wpct}%)")
 
         # Серия 100%
-        if streak > 0:
-            lines.append(f"🔥 Серия 100% дней подряд: {streak}")
+        if streak["current"] > 0:
+            lines.append(f"🔥 Серия 100% дней подряд: {streak['current']}")
+        if streak["best"] > 0:
+            lines.append(f"🏅 Рекорд серии: {streak['best']}")
 
         # Активные напоминания сейчас
-        active_now = len(get_active_reminders(user_id=user.id))
+        active_now = count_active_reminders(user.id)
         lines.append(f"\n🔔 Активных напоминаний сейчас: {active_now}")
 
         # Мотивашка
@@ -517,9 +710,9 @@ async def weeks_command(message: Message):
 
         from .db import finalize_past_weeks, get_week_summaries
         # На всякий случай перед показом пересчитаем незакрытые прошлые недели
-        finalize_past_weeks(user.id, tz_str=TIMEZONE)
+        finalize_past_weeks(user.id, tz_str=user.timezone)
 
-        weeks = get_week_summaries(user.id, tz_str=TIMEZONE)
+        weeks = get_week_summaries(user.id, tz_str=user.timezone)
         if not weeks:
             await message.answer("🗂 Пока нет недельных итогов. Дай хотя бы одной неделе завершиться 😉")
             return
@@ -539,7 +732,7 @@ async def weeks_command(message: Message):
 
 
 @dp.callback_query(F.data.startswith("done_"))
-async def handle_done_callback(callback: CallbackQuery):
+async def handle_done_callback(callback: CallbackQuery, state: FSMContext):
     """Inline button '✅ Выполнено'."""
     try:
         reminder_id = int(callback.data.split("_")[1])
@@ -559,14 +752,66 @@ async def handle_done_callback(callback: CallbackQuery):
             await callback.answer("❌ Напоминание не найдено!", show_alert=True)
             return
 
-        mark_workout_completed(reminder_id, user.id, reminder.text)
-        await callback.message.edit_text(
-            f"✅ Тренировка выполнена!\n\n{reminder.text}\n\n🎉 Отлично! Так держать! 💪"
-        )
+        completed_id = mark_workout_completed(reminder_id, user.id, reminder.text)
+        snoozes.cancel(callback.from_user.id, reminder_id)
+        streaks.on_workout_completed(user.id, user.timezone)
+        challenges.on_workout_completed(user.id, user.timezone)
+        await state.set_state(LogStates.after_done)
+        await state.update_data(completed_id=completed_id)
+
+        # склеенное сообщение: убираем только нажатую кнопку, остальные оставляем
+        markup = callback.message.reply_markup
+        rows = markup.inline_keyboard if markup else []
+        rest = [row for row in rows if all(b.callback_data != callback.data for b in row)]
+        if any(b.callback_data.startswith("done_") for row in rest for b in row):
+            await callback.message.edit_text(
+                f"{callback.message.text}\n\n✅ {reminder.text} — выполнено!",
+                reply_markup=InlineKeyboardMarkup(inline_keyboard=rest)
+            )
+        else:
+            await callback.message.edit_text(
+                f"✅ Тренировка выполнена!\n\n{reminder.text}\n\n🎉 Отлично! Так держать! 💪\n\n"
+                f"📝 Можешь записать, что сделал — просто ответь: жим 3x8 80кг"
+            )
         await callback.answer("🎉 Отмечено!")
     except Exception as e:
         logger.exception("Error in done callback: %s", e)
         await callback.answer("❌ Ошибка.", show_alert=True)
+
+
+@dp.callback_query(F.data.startswith("snooze_"))
+async def handle_snooze_callback(callback: CallbackQuery):
+    """Inline button '⏰ +N мин': отложить все неотмеченные напоминания сообщения."""
+    try:
+        minutes = int(callback.data.split("_")[1])
+        markup = callback.message.reply_markup
+        rows = markup.inline_keyboard if markup else []
+        ids = [
+            int(b.callback_data.split("_")[1])
+            for row in rows for b in row
+            if b.callback_data and b.callback_data.startswith("done_")
+        ]
+
+        user = get_or_create_user(
+            telegram_id=callback.from_user.id,
+            username=callback.from_user.username,
+            first_name=callback.from_user.first_name,
+            last_name=callback.from_user.last_name
+        )
+        reminders = get_reminders_by_ids(ids, user_id=user.id)
+        if not reminders:
+            await callback.answer("❌ Напоминание не найдено!", show_alert=True)
+            return
+
+        if not snooze_reminders(callback.from_user.id, reminders, minutes):
+            await callback.answer("❌ Сейчас нельзя отложить, попробуй позже.", show_alert=True)
+            return
+
+        await callback.message.edit_text(f"{callback.message.text}\n\n⏰ Отложено на {minutes} мин.")
+        await callback.answer(f"⏰ Напомню через {minutes} мин.")
+    except Exception as e:
+        logger.exception("Error in snooze callback: %s", e)
+        await callback.answer("❌ Ошибка.", show_alert=True)
 @dp.message(Command("weeks"))
 async def weeks_command(message: Message):
     """
@@ -595,8 +840,8 @@ async def weeks_command(message: Message):
 
         from .db import finalize_past_weeks, get_week_summaries
         # пересчитаем незакрытые недели и достанем сводку
-        finalize_past_weeks(user.id, tz_str=TIMEZONE)
-        weeks = get_week_summaries(user.id, tz_str=TIMEZONE)
+        finalize_past_weeks(user.id, tz_str=user.timezone)
+        weeks = get_week_summaries(user.id, tz_str=user.timezone)
 
         if not weeks:
             await message.answer("🗂 Пока нет недельных итогов — начнём с первой недели! 💪")
@@ -664,36 +909,474 @@ async def weeks_command(message: Message):
         await message.answer("❌ Ошибка при получении недельных итогов.")
 
 
+@dp.message(Command("challenge"))
+async def challenge_command(message: Message):
+    """/challenge ДД.ММ ДД.ММ Название  или  /challenge 30d Название."""
+    try:
+        parts = message.text.split(maxsplit=3)
+        user = get_or_create_user(
+            telegram_id=message.from_user.id,
+            username=message.from_user.username,
+            first_name=message.from_user.first_name,
+            last_name=message.from_user.last_name
+        )
+        today = challenges.local_today(user.timezone)
+        # две даты или одна длительность, дальше — название
+        n = 2 if len(parts) > 2 and "." in parts[1] and "." in parts[2] else 1
+        period = parts[1:1 + n]
+        title = " ".join(parts[1 + n:]).strip()
+        if len(period) < n or not title:
+            await message.answer("❌ Формат: /challenge 30d Название или /challenge 01.11 30.11 Название")
+            return
+        try:
+            start, end = challenges.parse_period(period, today)
+        except ValueError as e:
+            await message.answer(f"❌ {e}")
+            return
+
+        c = await asyncio.to_thread(challenges.new_challenge, title[:255], start, end, user.id, user.timezone)
+        await message.answer(
+            f"🏁 Челлендж «{c['title']}» создан: {start.strftime('%d.%m')}–{end.strftime('%d.%m.%Y')}\n"
+            f"Код для друзей: {c['code']}  (/join {c['code']})\n"
+            f"Таблица: /top {c['code']}"
+        )
+    except Exception as e:
+        logger.exception("Error in /challenge: %s", e)
+        await message.answer("❌ Не удалось создать челлендж.")
+
+
+@dp.message(Command("join"))
+async def join_command(message: Message):
+    try:
+        args = message.text.split()
+        if len(args) != 2:
+            await message.answer("❌ Формат: /join КОД")
+            return
+        c = get_challenge(code=args[1].upper(), tenant=tenants.current())
+        if not c:
+            await message.answer("❌ Челлендж с таким кодом не найден.")
+            return
+        user = get_or_create_user(
+            telegram_id=message.from_user.id,
+            username=message.from_user.username,
+            first_name=message.from_user.first_name,
+            last_name=message.from_user.last_name
+        )
+        if c["end_date"] < challenges.local_today(user.timezone):
+            await message.answer("❌ Этот челлендж уже закончился.")
+            return
+
+        if not challenges.join(c, user.id, user.timezone):
+            await message.answer(f"ℹ️ Ты уже участвуешь в «{c['title']}». /top {c['code']}")
+            return
+        await message.answer(f"✅ Ты в челлендже «{c['title']}»! Таблица: /top {c['code']}")
+    except Exception as e:
+        logger.exception("Error in /join: %s", e)
+        await message.answer("❌ Ошибка при вступлении в челлендж.")
+
+
+@dp.message(Command("top"))
+async def top_command(message: Message):
+    """/top [КОД] — таблица лидеров (без кода — последний челлендж пользователя)."""
+    try:
+        args = message.text.split()
+        user = get_or_create_user(
+            telegram_id=message.from_user.id,
+            username=message.from_user.username,
+            first_name=message.from_user.first_name,
+            last_name=message.from_user.last_name
+        )
+        if len(args) >= 2:
+            c = get_challenge(code=args[1].upper(), tenant=tenants.current())
+        else:
+            mine = get_user_challenges(user.id)
+            c = mine[0] if mine else None
+        if not c:
+            await message.answer("🏁 Челлендж не найден. Создай: /challenge 30d Название или вступи: /join КОД")
+            return
+
+        top = get_challenge_top(c["id"], 10)
+        board = challenges.leaderboard(c["id"])
+        lines = [f"🏆 {c['title']} ({c['start_date'].strftime('%d.%m')}–{c['end_date'].strftime('%d.%m')}), "
+                 f"участников: {len(board)}\n"]
+        medals = {1: "🥇", 2: "🥈", 3: "🥉"}
+        for place, (uid, name, done, planned, score) in enumerate(top, start=1):
+            me = " ← ты" if uid == user.id else ""
+            lines.append(f"{medals.get(place, f'{place}.')} {name or 'Без имени'} — "
+                         f"{challenges.format_score(score)} ({done}/{planned}){me}")
+
+        rank = board.rank(user.id)
+        if rank and rank > len(top):
+            lines.append(f"\n…\nТы на {rank}-м месте из {len(board)}.")
+        await message.answer("\n".join(lines))
+    except Exception as e:
+        logger.exception("Error in /top: %s", e)
+        await message.answer("❌ Ошибка при получении таблицы.")
+
+
+@dp.message(Command("log"))
+async def log_command(message: Message, state: FSMContext):
+    """/log жим 3x8 80кг; подтягивания 4x10"""
+    try:
+        parts = message.text.split(maxsplit=1)
+        if len(parts) < 2 or not parts[1].strip():
+            await message.answer(f"❌ Формат: /log упражнение подходыxповторы [вес]\n{training.LOG_HINT}")
+            return
+
+        user = get_or_create_user(
+            telegram_id=message.from_user.id,
+            username=message.from_user.username,
+            first_name=message.from_user.first_name,
+            last_name=message.from_user.last_name
+        )
+        # сразу после «✅» — привязываем запись к этой тренировке
+        data = await state.get_data() if await state.get_state() == LogStates.after_done.state else {}
+        try:
+            entries, records = training.log(user.id, parts[1], data.get("completed_id"), user.timezone)
+        except ValueError as e:
+            await message.answer(f"❌ {e}\n{training.LOG_HINT}")
+            return
+        await state.clear()
+        await message.answer(training.format_logged(entries, records))
+    except Exception as e:
+        logger.exception("Error in /log: %s", e)
+        await message.answer("❌ Ошибка при записи.")
+
+
+@dp.message(Command("progress"))
+async def progress_command(message: Message):
+    """/progress [упражнение] — рекорды и объём по неделям."""
+    try:
+        user = get_or_create_user(
+            telegram_id=message.from_user.id,
+            username=message.from_user.username,
+            first_name=message.from_user.first_name,
+            last_name=message.from_user.last_name
+        )
+        parts = message.text.split(maxsplit=1)
+        if len(parts) < 2 or not parts[1].strip():
+            text = training.format_overview(user.id)
+            await message.answer(text or f"📈 Пока нет записей. {training.LOG_HINT}")
+            return
+
+        exercise, options = training.resolve_exercise(user.id, parts[1])
+        if exercise is None:
+            if options:
+                await message.answer("🤔 Уточни упражнение:\n" + "\n".join(f"• /progress {o}" for o in options))
+            else:
+                await message.answer("❌ Нет записей по такому упражнению. /progress — список")
+            return
+        await message.answer(training.format_progress(user.id, exercise, user.timezone))
+    except Exception as e:
+        logger.exception("Error in /progress: %s", e)
+        await message.answer("❌ Ошибка при получении прогресса.")
+
+
+@dp.message(Command("export"))
+async def export_command(message: Message):
+    """/export [csv|json] [gz] — вся история файлом (читается и пишется потоком)."""
+    try:
+        fmt, compress = export.parse_args(message.text.split()[1:])
+    except ValueError as e:
+        await message.answer(f"❌ {str(e).capitalize()}.\nФормат: /export [csv|json] [gz]")
+        return
+    path = None
+    try:
+        user = get_or_create_user(
+            telegram_id=message.from_user.id,
+            username=message.from_user.username,
+            first_name=message.from_user.first_name,
+            last_name=message.from_user.last_name
+        )
+        path, name, n = await asyncio.to_thread(export.export_user, user.id, fmt, compress, user.timezone)
+        if n == 0:
+            await message.answer("📭 Пока нечего выгружать: нет выполненных тренировок.")
+            return
+        if os.path.getsize(path) > export.MAX_DOCUMENT_BYTES:
+            await message.answer("❌ Файл больше 50 МБ. Попробуй со сжатием: /export csv gz")
+            return
+        await message.answer_document(FSInputFile(path, filename=name), caption=f"📦 Записей: {n}")
+    except Exception as e:
+        logger.exception("Error in /export: %s", e)
+        await message.answer("❌ Ошибка при выгрузке.")
+    finally:
+        if path:
+            os.unlink(path)
+
+
+@dp.message(Command("heatmap"))
+async def heatmap_command(message: Message):
+    """/heatmap — календарь тренировок за год картинкой (готовые берутся из кеша по file_id)."""
+    try:
+        user = get_or_create_user(
+            telegram_id=message.from_user.id,
+            username=message.from_user.username,
+            first_name=message.from_user.first_name,
+            last_name=message.from_user.last_name
+        )
+        start, counts = heatmap.year_counts(user.id, user.timezone, user.created_at)
+        # file_id действителен только для загрузившего бота
+        key = f"{tenants.current()}:{heatmap.digest(start, counts)}"
+        caption = heatmap.caption(counts)
+
+        file_id = heatmap.cache.get(key)
+        if file_id:
+            try:
+                await message.answer_photo(file_id, caption=caption)
+                return
+            except TelegramBadRequest:
+                # file_id больше не принимается — нарисуем заново
+                heatmap.cache.forget(key)
+        png = heatmap.render(start, counts)
+        sent = await message.answer_photo(BufferedInputFile(png, filename="heatmap.png"), caption=caption)
+        heatmap.cache.put(key, sent.photo[-1].file_id)
+    except Exception as e:
+        logger.exception("Error in /heatmap: %s", e)
+        await message.answer("❌ Ошибка при построении календаря.")
+
+
+@dp.message(LogStates.after_done, F.text, ~F.text.startswith("/"))
+async def log_after_done(message: Message, state: FSMContext):
+    """Ответ после «✅»: если похоже на запись подходов — сохраняем."""
+    data = await state.get_data()
+    await state.clear()
+    try:
+        user = get_or_create_user(
+            telegram_id=message.from_user.id,
+            username=message.from_user.username,
+            first_name=message.from_user.first_name,
+            last_name=message.from_user.last_name
+        )
+        entries, records = training.log(user.id, message.text, data.get("completed_id"), user.timezone)
+    except ValueError:
+        await handle_unknown_command(message)
+        return
+    except Exception as e:
+        logger.exception("Error logging after done: %s", e)
+        await message.answer("❌ Ошибка при записи.")
+        return
+    await message.answer(training.format_logged(entries, records))
+
+
+@dp.message(Command("dbstats"))
+async def dbstats_command(message: Message):
+    """Админам: SQL-статистика по командам (с момента запуска)."""
+    if not is_admin(message.from_user.id):
+        await handle_unknown_command(message)
+        return
+    aggs = querystats.get_aggregates()
+    if not aggs:
+        await message.answer("📉 Пока нет данных.")
+        return
+    lines = ["📉 SQL по командам (среднее на апдейт):\n"]
+    for cmd, a in sorted(aggs.items(), key=lambda kv: -kv[1]["avg_statements"]):
+        lines.append(
+            f"{cmd}: {a['updates']} апд., {a['avg_statements']:.1f} запр. (макс {a['max_statements']}), "
+            f"БД {a['avg_db_ms']:.1f} мс, всего {a['avg_wall_ms']:.1f} мс, медленных {a['slow_updates']}"
+        )
+    lines.append(f"\n📚 Словарь текстов: {len(text_cache)} в кеше, "
+                 f"попаданий {text_cache.hits}, промахов {text_cache.misses}")
+    await message.answer("\n".join(lines))
+
+
+@dp.message(Command("sendstats"))
+async def sendstats_command(message: Message):
+    """Админам: счётчики отправки напоминаний."""
+    if not is_admin(message.from_user.id):
+        await handle_unknown_command(message)
+        return
+    c = coalescer.stats()
+    p = planner.stats()
+    peak = format_fire_at(p["peak_minute"]) if p["peak_minute"] else "—"
+    await message.answer(
+        "📤 Отправка напоминаний:\n"
+        f"🔔 Напоминаний: {c['reminders']}\n"
+        f"✉️ Сообщений: {c['messages']}\n"
+        f"💾 Сэкономлено вызовов API: {c['api_calls_saved']}\n"
+        f"⏳ Ожидают склейки: {c['pending_chats']}\n\n"
+        f"📈 Пик на сутки: {p['peak_due']} в {peak}\n"
+        f"Растянуто: {p['spread']}, макс. задержка {p['max_delay']:.0f} с\n"
+        f"Рассылок ждали напоминаний: {p['held']}"
+        + (_outbox_stats_text() if USE_OUTBOX else "")
+    )
+
+
+def _outbox_stats_text() -> str:
+    o = get_outbox_stats()
+    return (
+        "\n\n📬 Outbox (python -m src.sender):\n"
+        f"В очереди: {o.get('pending', 0)}, самому старому {o['oldest_pending_s']:.0f} с\n"
+        f"Отправлено: {o.get('sent', 0)}, не доставлено: {o.get('failed', 0)}, "
+        f"заблокировали: {o.get('blocked', 0)}"
+    )
+
+
+@dp.message(Command("tenants"))
+async def tenants_command(message: Message):
+    """Админам: боты этого процесса — пользователи, апдейты, отправки."""
+    if not is_admin(message.from_user.id):
+        await handle_unknown_command(message)
+        return
+    await message.answer(tenants.format_stats(count_active_users_by_tenant()))
+
+
+@dp.message(Command("httpstats"))
+async def httpstats_command(message: Message):
+    """Админам: задержки и соединения Bot API по методам."""
+    if not is_admin(message.from_user.id):
+        await handle_unknown_command(message)
+        return
+    await message.answer(format_metrics(api_metrics.snapshot()))
+
+@dp.message(Command("backup"))
+async def backup_command(message: Message):
+    """Админам: снять онлайн-бэкап базы сейчас."""
+    from . import backup
+
+    if not is_admin(message.from_user.id):
+        await handle_unknown_command(message)
+        return
+    try:
+        result = await asyncio.to_thread(backup.backup)
+        await message.answer(backup.format_result(result))
+    except Exception as e:
+        logger.exception("Error in /backup: %s", e)
+        await message.answer(f"❌ Бэкап не удался: {e}")
+
+@dp.message(Command("profile"))
+async def profile_command(message: Message):
+    """Админам: /profile [секунд] — сэмплирующий профиль; /profile timings — wall/CPU задач."""
+    if not is_admin(message.from_user.id):
+        await handle_unknown_command(message)
+        return
+    parts = message.text.split()
+    if len(parts) > 1 and parts[1].lower() == "timings":
+        await message.answer(profiler.format_timings())
+        return
+    try:
+        seconds = float(parts[1]) if len(parts) > 1 else PROFILE_SECONDS
+    except ValueError:
+        await message.answer("Использование: /profile [секунд] или /profile timings")
+        return
+    seconds = min(max(seconds, 1.0), 600.0)
+    if profiler.is_running():
+        await message.answer("⏳ Профиль уже снимается.")
+        return
+
+    await message.answer(f"🔥 Снимаю профиль {seconds:.0f} с…")
+    result = await profiler.profile(seconds)
+    if result is None:
+        await message.answer("⏳ Профиль уже снимается.")
+        return
+    path, sampler = result
+    await message.answer(sampler.summary()[:4000])
+    await message.answer_document(FSInputFile(path), caption="collapsed stacks: flamegraph.pl / speedscope")
+
+@dp.message(Command("rebuild_streaks"))
+async def rebuild_streaks_command(message: Message):
+    """Админам: пересчитать серии всех пользователей по истории."""
+    if not is_admin(message.from_user.id):
+        await handle_unknown_command(message)
+        return
+    try:
+        await message.answer("⏳ Пересчитываю серии по всей истории…")
+        n = await asyncio.to_thread(streaks.rebuild)
+        await message.answer(f"🔥 Серии пересчитаны для {n} пользователей.")
+    except Exception as e:
+        logger.exception("Error in /rebuild_streaks: %s", e)
+        await message.answer("❌ Ошибка при пересчёте серий.")
+
+
+@dp.message(Command("broadcast"))
+async def broadcast_command(message: Message):
+    """Админам: /broadcast текст — разослать всем активным пользователям."""
+    if not is_admin(message.from_user.id):
+        await handle_unknown_command(message)
+        return
+    try:
+        parts = message.text.split(maxsplit=1)
+        if len(parts) < 2 or not parts[1].strip():
+            await message.answer("❌ Формат: /broadcast текст")
+            return
+
+        broadcast_id = create_broadcast(parts[1].strip(), created_by=message.from_user.id)
+        start_broadcast(broadcast_id, notify_admin, chunk_size=BROADCAST_CHUNK)
+        await message.answer(
+            f"📣 Рассылка #{broadcast_id} запущена. Остановить: /broadcast_stop {broadcast_id}"
+        )
+    except Exception as e:
+        logger.exception("Error in /broadcast: %s", e)
+        await message.answer("❌ Не удалось запустить рассылку.")
+
+
+@dp.message(Command("broadcast_stop"))
+async def broadcast_stop_command(message: Message):
+    if not is_admin(message.from_user.id):
+        await handle_unknown_command(message)
+        return
+    args = message.text.split()
+    if len(args) != 2 or not args[1].isdigit():
+        await message.answer("❌ Формат: /broadcast_stop ID")
+        return
+    if cancel_broadcast(int(args[1])):
+        await message.answer(f"⏹ Рассылка #{args[1]} будет остановлена после текущей пачки.")
+    else:
+        await message.answer("❌ Активная рассылка с таким ID не найдена.")
+
+
 @dp.message()
 async def handle_unknown_command(message: Message):
     await message.answer(
         "🤔 Не понимаю эту команду.\n\n"
         "Команды:\n"
-        "• /add HH:MM текст — разовое\n"
+        "• /add [завтра] HH:MM текст — разовое\n"
         "• /everyday HH:MM текст — ежедневное\n"
         "• /days пн,ср,пт HH:MM текст — по дням\n"
+        "• /import + строки — много разом\n"
         "• /rename ID новый_текст — переименовать\n"
         "• /list — список\n"
+        "• /find слова — поиск\n"
         "• /delete ID — удалить\n"
         "• /done ID — выполнено\n"
-        "• /stats — статистика\n\n"
+        "• /log, /progress — журнал упражнений\n"
+        "• /export — выгрузка истории\n"
+        "• /stats — статистика, /heatmap — календарь\n"
+        "• /tz — часовой пояс\n"
+        "• /challenge, /join КОД, /top — челленджи\n\n"
         "Нужна помощь? /start 😊"
     )
 
 
+# метки для /dbstats и /profile timings: зарегистрированные выше команды и колбэки
+register_commands(dp, callbacks={"done", "snooze", "find"})
+
+
 # --------------- App entry ----------------
 async def main():
     try:
         init_db()
-        set_bot_instance(bot)
         start_scheduler()
+        last_heartbeat = read_heartbeat()
         restore_reminders_from_db()
-        logger.info("Bot starting...")
-        await dp.start_polling(bot)
+        schedule_snapshots()
+        schedule_load_planner()
+        snoozes.start()
+        schedule_day_close()
+        schedule_projections()
+        schedule_backup(BACKUP_HOUR)
+        profiler.install_signal_handler(PROFILE_SECONDS, notify_profile)
+        start_heartbeat()
+        asyncio.create_task(catch_up_missed(last_heartbeat))
+        resume_broadcasts(notify_admin, chunk_size=BROADCAST_CHUNK)
+        logger.info(f"Bot starting ({', '.join(tenants.registry)})...")
+        await dp.start_polling(*bots)
     except Exception as e:
         logger.error(f"Error starting bot: {e}")
     finally:
+        await snoozes.stop()
+        await save_schedule_snapshot()
         stop_scheduler()
+        write_heartbeat()
         logger.info("Bot stopped")
 
 
@@ -0,0 +1,133 @@
+"""
+Рассылка сообщения всем активным пользователям.
+
+Пользователи читаются keyset-страницами по users.id (память не зависит от их
+числа), каждая страница уходит через RateLimitedSender, после страницы
+прогресс сохраняется в таблицу broadcasts — после рестарта рассылка
+продолжается с последнего обработанного id.
+
+Рассылка принадлежит боту (broadcasts.tenant): идёт его пользователям через
+его RateLimitedSender и выполняется в его контексте (tenants.use), так что
+notify отвечает админу тем же ботом.
+"""
+from typing import Awaitable, Callable
+import asyncio
+import logging
+import time
+
+from .db import (
+    get_active_user_chunk, deactivate_users, get_broadcast,
+    get_running_broadcast_ids, save_broadcast_progress
+)
+from .delivery import RateLimitedSender, DeliveryResult
+from . import tenants
+
+logger = logging.getLogger(__name__)
+
+# куда слать отчёт о прогрессе: notify(chat_id, text)
+Notify = Callable[[int, str], Awaitable[None]]
+
+_tasks: dict[int, asyncio.Task] = {}
+
+
+def format_progress(b: dict, elapsed: float, done_now: int) -> str:
+    processed = b["sent"] + b["failed"] + b["blocked"]
+    rate = done_now / elapsed if elapsed > 0 else 0.0
+    remaining = max(0, b["total"] - processed)
+    eta = f"{int(remaining / rate // 60)} мин {int(remaining / rate % 60)} сек" if rate > 0 else "—"
+    return (
+        f"📣 Рассылка #{b['id']}: {processed}/{b['total']}\n"
+        f"✅ {b['sent']}  🚫 {b['blocked']}  ❌ {b['failed']}\n"
+        f"⚡ {rate:.1f} сообщ./сек, осталось ≈ {eta}"
+    )
+
+
+async def run_broadcast(broadcast_id: int, notify: Notify,
+                        chunk_size: int = 500, report_every: float = 30.0) -> None:
+    b = get_broadcast(broadcast_id)
+    if not b or b["status"] != "running":
+        return
+    sender = tenants.sender_for(b["tenant"])
+    if sender is None:
+        logger.warning(f"Broadcast {broadcast_id}: bot {b['tenant']} is not running, skipped")
+        return
+    with tenants.use(b["tenant"]):
+        await _run_broadcast(b, sender, notify, chunk_size, report_every)
+
+
+async def _run_broadcast(b: dict, sender: RateLimitedSender, notify: Notify, chunk_size: int,
+                         report_every: float) -> None:
+    broadcast_id = b["id"]
+
+    started = time.monotonic()
+    last_report = started
+    done_now = 0  # обработано в этом запуске (для скорости)
+
+    while True:
+        chunk = get_active_user_chunk(b["last_user_id"], chunk_size, b["tenant"])
+        if not chunk:
+            break
+
+        results = await asyncio.gather(
+            *(sender.send(tg_id, b["text"]) for _, tg_id in chunk)
+        )
+        blocked_ids = []
+        for (user_id, _), res in zip(chunk, results):
+            if res == DeliveryResult.OK:
+                b["sent"] += 1
+            elif res == DeliveryResult.BLOCKED:
+                b["blocked"] += 1
+                blocked_ids.append(user_id)
+            else:
+                b["failed"] += 1
+        deactivate_users(blocked_ids)
+
+        b["last_user_id"] = chunk[-1][0]
+        done_now += len(chunk)
+        save_broadcast_progress(broadcast_id, b["last_user_id"], b["sent"], b["failed"], b["blocked"])
+
+        # остановлена командой /broadcast_stop
+        if get_broadcast(broadcast_id)["status"] != "running":
+            logger.info(f"Broadcast {broadcast_id} cancelled")
+            await notify(b["created_by"], f"⏹ Рассылка #{broadcast_id} остановлена.\n"
+                         + format_progress(b, time.monotonic() - started, done_now))
+            return
+
+        now = time.monotonic()
+        if now - last_report >= report_every:
+            last_report = now
+            await notify(b["created_by"], format_progress(b, now - started, done_now))
+
+    save_broadcast_progress(broadcast_id, b["last_user_id"], b["sent"], b["failed"], b["blocked"],
+                            status="done")
+    elapsed = time.monotonic() - started
+    logger.info(f"Broadcast {broadcast_id} finished: sent={b['sent']} blocked={b['blocked']} "
+                f"failed={b['failed']} in {elapsed:.1f}s")
+    await notify(b["created_by"], "🏁 Рассылка завершена.\n" + format_progress(b, elapsed, done_now))
+
+
+def start_broadcast(broadcast_id: int, notify: Notify, chunk_size: int = 500) -> None:
+    """Запустить рассылку фоновой задачей (повторный запуск того же id игнорируется)."""
+    task = _tasks.get(broadcast_id)
+    if task and not task.done():
+        return
+
+    async def _run():
+        try:
+            await run_broadcast(broadcast_id, notify, chunk_size=chunk_size)
+        except Exception as e:
+            logger.exception(f"Broadcast {broadcast_id} failed: {e}")
+        finally:
+            _tasks.pop(broadcast_id, None)
+
+    _tasks[broadcast_id] = asyncio.create_task(_run())
+
+
+def resume_broadcasts(notify: Notify, chunk_size: int = 500) -> int:
+    """Продолжить рассылки (всех ботов), прерванные остановкой процесса."""
+    ids = get_running_broadcast_ids()
+    for bid in ids:
+        start_broadcast(bid, notify, chunk_size=chunk_size)
+    if ids:
+        logger.info(f"Resumed {len(ids)} broadcasts")
+    return len(ids)
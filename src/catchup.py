@@ -0,0 +1,187 @@
+"""
+Догоняем напоминания, пропущенные пока бот был выключен.
+
+Процесс раз в минуту пишет heartbeat в bot_state. При старте берём
+промежуток (последний heartbeat, сейчас] и по time/days каждого активного
+напоминания считаем, сколько раз оно должно было сработать. Считаем
+арифметикой по дням недели, поэтому стоимость не зависит от длины простоя:
+O(напоминаний × 7). Каждый пользователь получает один дайджест — от того
+бота, у которого он завёл напоминания, через его RateLimitedSender.
+"""
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+import asyncio
+import logging
+
+import pytz
+
+from .db import get_active_reminders, get_state, set_state, set_reminders_inactive
+from .delivery import DeliveryResult
+from .tenants import sender_for
+from .timezones import get_tz
+from .views import ReminderView
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_KEY = "last_heartbeat"
+RU_DAYS = {'пн': 0, 'вт': 1, 'ср': 2, 'чт': 3, 'пт': 4, 'сб': 5, 'вс': 6}
+MAX_BUTTONS = 10
+
+
+@dataclass(slots=True)
+class Missed:
+    reminder: ReminderView
+    count: int
+    last: datetime   # локальное время последнего пропущенного срабатывания
+
+
+def write_heartbeat(now_utc: datetime | None = None) -> None:
+    now_utc = now_utc or datetime.utcnow()
+    set_state(HEARTBEAT_KEY, now_utc.isoformat(timespec="seconds"))
+
+
+def read_heartbeat() -> datetime | None:
+    value = get_state(HEARTBEAT_KEY)
+    return datetime.fromisoformat(value) if value else None
+
+
+def _weekdays(r: ReminderView) -> set[int]:
+    if r.reminder_type == "everyday":
+        return set(range(7))
+    return {RU_DAYS[d.strip()] for d in (r.days or "").split(",") if d.strip() in RU_DAYS}
+
+
+def _weekday_counts(first: date, last: date) -> list[int]:
+    """Сколько раз каждый день недели встречается в [first, last] (без перебора дат)."""
+    counts = [0] * 7
+    if last < first:
+        return counts
+    n = (last - first).days + 1
+    full, extra = divmod(n, 7)
+    for wd in range(7):
+        counts[wd] = full
+    for i in range(extra):
+        counts[(first.weekday() + i) % 7] += 1
+    return counts
+
+
+def compute_missed(reminders: list[ReminderView], since_utc: datetime, until_utc: datetime,
+                   tz_str: str | None = None) -> list[Missed]:
+    """
+    Срабатывания в (since, until] для каждого напоминания; since/until — naive UTC.
+    Время напоминания — в зоне владельца (r.tz), tz_str — зона для тех, у кого она не задана.
+    """
+    by_tz: dict[str | None, list[ReminderView]] = defaultdict(list)
+    for r in reminders:
+        by_tz[r.tz or tz_str].append(r)
+    out = []
+    for name, group in by_tz.items():
+        out += _missed_in_tz(group, since_utc, until_utc, get_tz(name))
+    return out
+
+
+def _missed_in_tz(reminders: list[ReminderView], since_utc: datetime, until_utc: datetime,
+                  tz) -> list[Missed]:
+    since = pytz.utc.localize(since_utc).astimezone(tz)
+    until = pytz.utc.localize(until_utc).astimezone(tz)
+    if until <= since:
+        return []
+
+    first_day, last_day = since.date(), until.date()
+    interior = _weekday_counts(first_day + timedelta(days=1), last_day - timedelta(days=1))
+
+    out = []
+    for r in reminders:
+        h, m = map(int, r.time.split(":"))
+        t = time(h, m)
+
+        if r.reminder_type == "once":
+            if r.fire_at:
+                fire = pytz.utc.localize(r.fire_at).astimezone(tz)
+            elif r.created_at:
+                created = pytz.utc.localize(r.created_at).astimezone(tz)
+                fire = tz.localize(datetime.combine(created.date(), t))
+            else:
+                continue
+            if since < fire <= until:
+                out.append(Missed(r, 1, fire))
+            continue
+
+        wds = _weekdays(r)
+        if not wds:
+            continue
+
+        def fires_on(d: date) -> bool:
+            if d.weekday() not in wds:
+                return False
+            at = tz.localize(datetime.combine(d, t))
+            return since < at <= until
+
+        count = sum(interior[wd] for wd in wds)
+        count += fires_on(first_day)
+        if last_day != first_day:
+            count += fires_on(last_day)
+        if not count:
+            continue
+
+        # последнее срабатывание — не дальше недели назад от конца промежутка
+        d = last_day
+        while not fires_on(d):
+            d -= timedelta(days=1)
+        out.append(Missed(r, count, tz.localize(datetime.combine(d, t))))
+    return out
+
+
+def format_digest(items: list[Missed]) -> str:
+    lines = ["⏰ Пока я был недоступен, пропущены напоминания:\n"]
+    for it in sorted(items, key=lambda x: x.last):
+        times = f" ×{it.count}" if it.count > 1 else ""
+        lines.append(f"• {it.reminder.time} {it.reminder.text}{times} (последнее {it.last.strftime('%d.%m')})")
+    lines.append("\nЕсли что-то из этого уже сделал — отметь ниже 👇")
+    return "\n".join(lines)
+
+
+def digest_keyboard(items: list[Missed]):
+    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+    rows = [
+        [InlineKeyboardButton(text=f"✅ {it.reminder.text[:30]}", callback_data=f"done_{it.reminder.id}")]
+        for it in items[:MAX_BUTTONS]
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+async def catch_up_missed(since_utc: datetime | None, tz_str: str | None = None,
+                          min_gap: timedelta = timedelta(minutes=2)) -> int:
+    """Разослать дайджесты пропущенного. Возвращает число пользователей, получивших дайджест."""
+    now_utc = datetime.utcnow()
+    if since_utc is None or now_utc - since_utc < min_gap:
+        return 0
+
+    missed = compute_missed(get_active_reminders(), since_utc, now_utc, tz_str)
+    if not missed:
+        logger.info(f"No missed reminders since {since_utc}")
+        return 0
+
+    by_user: dict[tuple[str | None, int], list[Missed]] = defaultdict(list)
+    for m in missed:
+        by_user[m.reminder.tenant, m.reminder.tg_id].append(m)
+
+    # разовые больше не сработают — гасим сразу, чтобы не прислать их второй раз
+    set_reminders_inactive([m.reminder.id for m in missed if m.reminder.reminder_type == "once"])
+
+    sends = []
+    for (tenant, tg_id), items in by_user.items():
+        sender = sender_for(tenant)
+        if sender is None:
+            logger.warning(f"Bot {tenant} is not running, digest for {tg_id} skipped")
+            continue
+        sends.append(sender.send(tg_id, format_digest(items), reply_markup=digest_keyboard(items)))
+    # темп и число одновременных запросов держит RateLimitedSender бота, как в рассылке
+    results = await asyncio.gather(*sends)
+    n = sum(res == DeliveryResult.OK for res in results)
+
+    logger.info(f"Sent missed-reminder digests to {n} of {len(by_user)} users "
+                f"({len(missed)} reminders, gap {now_utc - since_utc})")
+    return n
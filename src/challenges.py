@@ -0,0 +1,197 @@
+"""
+Групповые челленджи и таблица лидеров (/top).
+
+Счёт участника — % выполнения плана за период челленджа (score = % × 100).
+done растёт на каждой отметке «✅», planned — раз в день: ночной job
+добавляет участникам план на начавшийся день. Обе операции трогают только
+строки одного пользователя/челленджа, полный пересчёт не нужен.
+
+Для места в таблице держим в памяти отсортированный список ключей
+(-score, -done, user_id): место — bisect, O(log n). Таблицы кешируются
+(LRU) и обновляются вместе с БД; первые места /top читает из БД по индексу
+(challenge_id, score).
+"""
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from datetime import date, timedelta
+import logging
+import re
+import secrets
+
+from .config import TIMEZONE
+from .db import (
+    create_challenge, get_challenge, add_challenge_member, get_member_rows,
+    get_challenge_member_chunk, save_challenge_members, get_challenges_to_plan,
+    set_challenge_planned_through, get_challenge_scores, get_plan_rows_for_users,
+    _planned_from_rows
+)
+from .timezones import local_today
+
+logger = logging.getLogger(__name__)
+
+CODE_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"   # без 0/O и 1/I
+CODE_LEN = 6
+MAX_DAYS = 366
+MAX_CACHED = 256
+
+
+def score_of(done: int, planned: int) -> int:
+    """% выполнения × 100, не больше 100%."""
+    if planned <= 0:
+        return 0
+    return min(10_000, done * 10_000 // planned)
+
+
+def format_score(score: int) -> str:
+    return f"{score / 100:.0f}%"
+
+
+class Leaderboard:
+    """Отсортированные ключи участников одного челленджа."""
+
+    __slots__ = ("_keys", "_by_user")
+
+    def __init__(self, rows: list[tuple[int, int, int]] = ()):
+        self._by_user = {uid: (-score, -done, uid) for uid, score, done in rows}
+        self._keys = sorted(self._by_user.values())
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def update(self, user_id: int, score: int, done: int) -> None:
+        old = self._by_user.get(user_id)
+        if old is not None:
+            del self._keys[bisect_left(self._keys, old)]
+        key = (-score, -done, user_id)
+        self._by_user[user_id] = key
+        insort(self._keys, key)
+
+    def rank(self, user_id: int) -> int | None:
+        key = self._by_user.get(user_id)
+        return None if key is None else bisect_left(self._keys, key) + 1
+
+
+_boards: "OrderedDict[int, Leaderboard]" = OrderedDict()
+
+
+def leaderboard(challenge_id: int) -> Leaderboard:
+    board = _boards.get(challenge_id)
+    if board is None:
+        board = Leaderboard(get_challenge_scores(challenge_id))
+        _boards[challenge_id] = board
+        if len(_boards) > MAX_CACHED:
+            _boards.popitem(last=False)
+    else:
+        _boards.move_to_end(challenge_id)
+    return board
+
+
+def _update_board(challenge_id: int, user_id: int, score: int, done: int) -> None:
+    # не загруженную таблицу не трогаем — при первом чтении она поднимется из БД
+    board = _boards.get(challenge_id)
+    if board is not None:
+        board.update(user_id, score, done)
+
+
+def parse_period(tokens: list[str], today: date) -> tuple[date, date]:
+    """'ДД.ММ ДД.ММ' (можно с годом) или 'Nд' — N дней с сегодняшнего. Бросает ValueError."""
+    def to_date(s: str) -> date:
+        m = re.fullmatch(r'(\d{1,2})\.(\d{1,2})(?:\.(\d{4}))?', s)
+        if not m:
+            raise ValueError(f"неверная дата: {s}")
+        try:
+            return date(int(m.group(3) or today.year), int(m.group(2)), int(m.group(1)))
+        except ValueError:
+            raise ValueError(f"неверная дата: {s}")
+
+    if len(tokens) == 1:
+        m = re.fullmatch(r'(\d{1,3})[dд]', tokens[0].lower())
+        if not m or int(m.group(1)) < 1:
+            raise ValueError("период: ДД.ММ ДД.ММ или 30d")
+        start, end = today, today + timedelta(days=int(m.group(1)) - 1)
+    elif len(tokens) == 2:
+        start, end = to_date(tokens[0]), to_date(tokens[1])
+        if end < start:
+            end = end.replace(year=end.year + 1)
+        if end < today:
+            raise ValueError("челлендж уже закончился")
+    else:
+        raise ValueError("период: ДД.ММ ДД.ММ или 30d")
+    if (end - start).days + 1 > MAX_DAYS:
+        raise ValueError(f"не длиннее {MAX_DAYS} дней")
+    return start, end
+
+
+def new_challenge(title: str, start: date, end: date, creator_id: int,
+                  tz_str: str = TIMEZONE) -> dict:
+    """Создать челлендж с уникальным кодом; создатель сразу участвует. Блокирующий — из бота через to_thread."""
+    while True:
+        code = "".join(secrets.choice(CODE_ALPHABET) for _ in range(CODE_LEN))
+        if get_challenge(code=code) is None:
+            break
+    challenge_id = create_challenge(code, title, start, end, creator_id)
+    if start <= local_today(tz_str):
+        open_day(local_today(tz_str), tz_str, challenge_id=challenge_id)
+    join(get_challenge(challenge_id), creator_id, tz_str)
+    return get_challenge(challenge_id)
+
+
+def join(challenge: dict, user_id: int, tz_str: str = TIMEZONE) -> bool:
+    """Вступить. Если план на сегодня остальным уже добавлен — добавляем и новичку."""
+    today = local_today(tz_str)
+    planned = 0
+    through = challenge["planned_through"]
+    if through and through >= today and challenge["start_date"] <= today <= challenge["end_date"]:
+        planned = _planned_from_rows(get_plan_rows_for_users([user_id])[user_id], today)
+    if not add_challenge_member(challenge["id"], user_id, planned):
+        return False
+    _update_board(challenge["id"], user_id, 0, 0)
+    return True
+
+
+def on_workout_completed(user_id: int, tz_str: str = TIMEZONE) -> None:
+    """+1 выполнение во всех идущих челленджах пользователя."""
+    rows = get_member_rows(user_id, local_today(tz_str))
+    if not rows:
+        return
+    out = []
+    for member_id, challenge_id, done, planned in rows:
+        done += 1
+        score = score_of(done, planned)
+        out.append({"id": member_id, "done": done, "score": score})
+        _update_board(challenge_id, user_id, score, done)
+    save_challenge_members(out)
+
+
+def open_day(today: date | None = None, tz_str: str = TIMEZONE, chunk_size: int = 500,
+             challenge_id: int | None = None) -> int:
+    """
+    Ночной job: добавить участникам план на дни по `today` включительно
+    (догоняет пропущенные, если бот был выключен). challenge_id — только один
+    челлендж (новый). Возвращает число челленджей.
+    """
+    today = today or local_today(tz_str)
+    challenges = get_challenges_to_plan(today, challenge_id)
+    for c in challenges:
+        first = c["planned_through"] + timedelta(days=1)
+        last = min(today, c["end_date"])
+        days = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+
+        after = 0
+        while days:
+            members = get_challenge_member_chunk(c["id"], after, chunk_size)
+            if not members:
+                break
+            after = members[-1][0]
+            plans = get_plan_rows_for_users([uid for _, uid, _, _ in members])
+            out = []
+            for member_id, uid, done, planned in members:
+                planned += sum(_planned_from_rows(plans[uid], d) for d in days)
+                out.append({"id": member_id, "planned": planned, "score": score_of(done, planned)})
+            save_challenge_members(out)
+
+        set_challenge_planned_through(c["id"], last)
+        _boards.pop(c["id"], None)
+    if challenges:
+        logger.info(f"Planned {len(challenges)} challenges through {today}")
+    return len(challenges)
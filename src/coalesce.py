@@ -0,0 +1,66 @@
+"""
+Склейка одновременных напоминаний одного чата в одно сообщение.
+
+Напоминания, которые сработали для одного чата (одного бота — tenants.py)
+в одну и ту же минуту, копятся `window` секунд и уходят одним сообщением с кнопкой «✅» на каждое
+(callback_data остаётся `done_{id}`).
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Awaitable, Callable
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True, frozen=True)
+class DueReminder:
+    reminder_id: int
+    text: str
+    reminder_type: str | None
+    snoozed: bool = False        # повтор «отложить»: reminder_sent за него уже записан
+
+
+# flush(chat_id, [DueReminder, ...], tenant) — отправить одно сообщение
+Flush = Callable[[int, list[DueReminder], str | None], Awaitable[None]]
+
+
+class ReminderCoalescer:
+    def __init__(self, flush: Flush, window: float = 1.5):
+        self.flush = flush
+        self.window = window
+        self._pending: dict[tuple[str | None, int, str], list[DueReminder]] = {}
+        # счётчики
+        self.reminders = 0   # сколько напоминаний прошло через склейку
+        self.messages = 0    # сколько сообщений реально отправлено
+
+    @property
+    def api_calls_saved(self) -> int:
+        return self.reminders - self.messages
+
+    def stats(self) -> dict:
+        return {
+            "reminders": self.reminders,
+            "messages": self.messages,
+            "api_calls_saved": self.api_calls_saved,
+            "pending_chats": len(self._pending),
+        }
+
+    async def add(self, chat_id: int, item: DueReminder, tenant: str | None = None,
+                  now: datetime | None = None) -> None:
+        minute = (now or datetime.utcnow()).strftime("%Y%m%d%H%M")
+        key = (tenant, chat_id, minute)
+        self.reminders += 1
+        batch = self._pending.get(key)
+        if batch is not None:
+            batch.append(item)
+            return
+        self._pending[key] = [item]
+        # первый в этой минуте — он и отправит всю пачку
+        await asyncio.sleep(self.window)
+        batch = self._pending.pop(key)
+        self.messages += 1
+        if len(batch) > 1:
+            logger.info(f"Coalesced {len(batch)} reminders for chat {chat_id}")
+        await self.flush(chat_id, batch, tenant)
@@ -4,9 +4,119 @@ from dotenv import load_dotenv
 load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+
+
+def _parse_tokens(spec: str) -> list[tuple[str, str]]:
+    """'main=123:AAA,gym2=456:BBB' -> [(имя, токен)]; без имени — id бота из токена."""
+    out = []
+    for item in (x.strip() for x in spec.split(",")):
+        if not item:
+            continue
+        name, sep, token = item.partition("=")
+        if not sep:
+            name, token = item.split(":", 1)[0], item
+        out.append((name.strip(), token.strip()))
+    names = [name for name, _ in out]
+    if len(set(names)) != len(names) or any(not n or len(n) > 32 for n in names):
+        raise ValueError("BOT_TOKENS: имена ботов должны быть уникальны и не длиннее 32 символов")
+    return out
+
+
+# Несколько ботов в одном процессе (см. tenants.py): BOT_TOKENS="main=123:AAA,gym2=456:BBB".
+# Имя — арендатор в БД (users.tenant). Однобот-режим пишет данные на main (старые
+# строки без арендатора при миграции достаются первому боту), поэтому прежний бот
+# должен и дальше называться main. Без BOT_TOKENS — один бот BOT_TOKEN.
+TENANTS = _parse_tokens(os.getenv("BOT_TOKENS", "")) or ([("main", BOT_TOKEN)] if BOT_TOKEN else [])
+DEFAULT_TENANT = TENANTS[0][0] if TENANTS else "main"
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///workout_bot.db")
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 TIMEZONE = "Asia/Almaty"
 
-if not BOT_TOKEN:
-    raise ValueError("BOT_TOKEN is required in .env file")
+# telegram_id администраторов через запятую: ADMIN_IDS=123,456
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip()}
+
+# апдейты дольше этого порога пишутся в лог вместе со статистикой SQL
+SLOW_UPDATE_MS = float(os.getenv("SLOW_UPDATE_MS", "500"))
+
+# Антиспам: token bucket на пользователя, отдельно для дешёвых и тяжёлых команд.
+# RATE — токенов в секунду, BURST — размер бакета.
+HEAVY_COMMANDS = {
+    c.strip().lower() for c in os.getenv("HEAVY_COMMANDS", "/stats,/weeks,/export,/heatmap").split(",") if c.strip()
+}
+THROTTLE_CHEAP_RATE = float(os.getenv("THROTTLE_CHEAP_RATE", "1"))
+THROTTLE_CHEAP_BURST = float(os.getenv("THROTTLE_CHEAP_BURST", "5"))
+THROTTLE_HEAVY_RATE = float(os.getenv("THROTTLE_HEAVY_RATE", "0.1"))
+THROTTLE_HEAVY_BURST = float(os.getenv("THROTTLE_HEAVY_BURST", "2"))
+THROTTLE_MAX_USERS = int(os.getenv("THROTTLE_MAX_USERS", "10000"))
+THROTTLE_IDLE_TTL = float(os.getenv("THROTTLE_IDLE_TTL", "600"))
+
+# Массовая отправка: общий лимит сообщений в секунду и число параллельных запросов
+SEND_RATE = float(os.getenv("SEND_RATE", "25"))
+SEND_CONCURRENCY = int(os.getenv("SEND_CONCURRENCY", "10"))
+BROADCAST_CHUNK = int(os.getenv("BROADCAST_CHUNK", "500"))
+
+# Сглаживание пиков напоминаний: отправок в секунду, на которые растягивается
+# минута, и максимальная задержка напоминания (с, 0 — отправлять сразу)
+LOAD_SEND_RATE = float(os.getenv("LOAD_SEND_RATE", "25"))
+LOAD_SPREAD_MAX = float(os.getenv("LOAD_SPREAD_MAX", "120"))
+
+# Склейка напоминаний одного чата за одну минуту в одно сообщение
+COALESCE_REMINDERS = os.getenv("COALESCE_REMINDERS", "1").lower() not in ("0", "false", "no")
+COALESCE_WINDOW = float(os.getenv("COALESCE_WINDOW", "1.5"))
+
+# Разовые напоминания дальше этого горизонта не держим в планировщике
+ONCE_HORIZON_HOURS = float(os.getenv("ONCE_HORIZON_HOURS", "24"))
+
+# Отложенные («⏰ +10 мин») напоминания: файл снимка и максимум таймеров в памяти
+SNOOZE_SNAPSHOT = os.getenv("SNOOZE_SNAPSHOT", "snoozes.json")
+SNOOZE_MAX = int(os.getenv("SNOOZE_MAX", "10000"))
+
+# Снимок корзин планировщика для быстрого рестарта (пусто — не использовать)
+# и как часто его сохранять, минуты (сохраняется только после изменений)
+SCHEDULE_SNAPSHOT = os.getenv("SCHEDULE_SNAPSHOT", "schedule.snapshot")
+SCHEDULE_SNAPSHOT_MINUTES = int(os.getenv("SCHEDULE_SNAPSHOT_MINUTES", "5"))
+
+# HTTP-сессия Bot API: размер пула, лимит на хост, keep-alive (с), кеш DNS (с),
+# таймауты соединения и запроса (с). TELEGRAM_API_URL — свой Bot API сервер
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+HTTP_LIMIT_PER_HOST = int(os.getenv("HTTP_LIMIT_PER_HOST", "50"))
+HTTP_KEEPALIVE = float(os.getenv("HTTP_KEEPALIVE", "75"))
+HTTP_DNS_TTL = int(os.getenv("HTTP_DNS_TTL", "3600"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "60"))
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL") or None
+
+# Outbox: бот только ставит напоминания в таблицу outbox, отправляет отдельный
+# процесс `python -m src.sender` (лимиты — SEND_RATE / SEND_CONCURRENCY)
+USE_OUTBOX = os.getenv("USE_OUTBOX", "0").lower() in ("1", "true", "yes")
+OUTBOX_BATCH = int(os.getenv("OUTBOX_BATCH", "100"))
+OUTBOX_LEASE = float(os.getenv("OUTBOX_LEASE", "60"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+
+# Онлайн-бэкап SQLite (python -m src.backup): каталог, сколько копий хранить,
+# страниц за шаг и пауза между шагами (с), сжатие; BACKUP_HOUR пусто — без расписания
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+BACKUP_PAGES = int(os.getenv("BACKUP_PAGES", "256"))
+BACKUP_SLEEP = float(os.getenv("BACKUP_SLEEP", "0.05"))
+BACKUP_COMPRESS = os.getenv("BACKUP_COMPRESS", "1").lower() not in ("0", "false", "no")
+BACKUP_HOUR = os.getenv("BACKUP_HOUR", "4").strip()
+BACKUP_HOUR = int(BACKUP_HOUR) if BACKUP_HOUR else None
+
+# Профилирование: куда писать профили (/profile, SIGUSR1), шаг сэмплера (с),
+# замер wall/CPU апдейтов и job'ов
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_SECONDS = float(os.getenv("PROFILE_SECONDS", "30"))
+TASK_TIMING = os.getenv("TASK_TIMING", "1").lower() not in ("0", "false", "no")
+
+# /heatmap: сколько file_id готовых картинок помнить (LRU по хешу данных)
+HEATMAP_CACHE_SIZE = int(os.getenv("HEATMAP_CACHE_SIZE", "1000"))
+
+# Словарь текстов (таблица texts): сколько текстов держать в LRU процесса,
+# по сколько строк переводить старую базу на text_id при старте
+TEXT_CACHE_SIZE = int(os.getenv("TEXT_CACHE_SIZE", "10000"))
+TEXT_MIGRATION_CHUNK = int(os.getenv("TEXT_MIGRATION_CHUNK", "5000"))
+
+if not TENANTS:
+    raise ValueError("BOT_TOKEN (or BOT_TOKENS) is required in .env file")
@@ -1,27 +1,408 @@
-from sqlalchemy import create_engine
+from sqlalchemy import (
+    create_engine, event, select, update, insert, inspect, func, case, or_, text as sql_text, MetaData
+)
+from sqlalchemy.schema import CreateTable
 from sqlalchemy.orm import sessionmaker, Session
+from collections import OrderedDict
 from contextlib import contextmanager
-from typing import Generator
+from typing import Generator, Iterable
+import hashlib
+import json
 import logging
 
-from .models import Base, User, Reminder, CompletedWorkout, WeeklySummary
-from .config import DATABASE_URL
+from .models import (
+    Base, User, Reminder, CompletedWorkout, WeeklySummary, Broadcast, BotState,
+    Challenge, ChallengeMember, WorkoutLog, ExerciseStats, ExerciseWeek,
+    Event, ProjReminder, ProjUser, ProjDaily, ProjWeekly, OutboxMessage, InternedText
+)
+from .views import ReminderView, PlanRow
+from .parsing import ReminderSpec, LogEntry
+from .config import DATABASE_URL, TIMEZONE, TEXT_CACHE_SIZE, TEXT_MIGRATION_CHUNK, DEFAULT_TENANT
+from .tenants import current as current_tenant
+from .timezones import get_tz, offset_periods
+from . import querystats
 
 logger = logging.getLogger(__name__)
 
 # DB
-engine = create_engine(DATABASE_URL, echo=False)
+_SQLITE = DATABASE_URL.startswith("sqlite")
+engine = create_engine(DATABASE_URL, echo=False, connect_args={"timeout": 30} if _SQLITE else {})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+querystats.install(engine)
+
+if _SQLITE:
+    @event.listens_for(engine, "connect")
+    def _sqlite_wal(dbapi_conn, _):
+        # бот и отправщик (python -m src.sender) работают с одним файлом:
+        # в WAL чтение не ждёт записи, а запись ждёт до timeout вместо ошибки
+        cur = dbapi_conn.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.close()
 
 
 def init_db():
     Base.metadata.create_all(bind=engine)
+    added = _add_missing_columns()
+    if "proj_users.timezone" in added:
+        _backfill_proj_zones()
+    _migrate_texts()
+    _migrate_tenants()
+    _backfill_fire_at()
+    _seed_events()
+    _init_search()
     logger.info("Database initialized")
 
 
+def _add_missing_columns() -> set[str]:
+    """create_all не меняет существующие таблицы: дописываем новые колонки и индексы."""
+    added = set()
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not insp.has_table(table.name):
+                continue
+            existing = {c["name"] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name not in existing:
+                    conn.execute(sql_text(
+                        f"ALTER TABLE {table.name} ADD COLUMN {col.name} "
+                        f"{col.type.compile(dialect=engine.dialect)}"
+                    ))
+                    logger.info(f"Added column {table.name}.{col.name}")
+                    added.add(f"{table.name}.{col.name}")
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+    return added
+
+
+def _backfill_proj_zones():
+    """proj_users до появления колонки timezone: события до checkpoint уже учтены, берём текущую зону."""
+    with engine.begin() as conn:
+        n = conn.execute(sql_text(
+            "UPDATE proj_users SET timezone = "
+            "(SELECT timezone FROM users WHERE users.id = proj_users.user_id)"
+        )).rowcount
+    if n:
+        logger.info(f"Backfilled timezone for {n} proj_users rows")
+
+
+def _migrate_tenants():
+    """
+    База однобот-режима: строки без арендатора — DEFAULT_TENANT, а уникальность
+    users.telegram_id — в пределах арендатора (uq_users_tenant_telegram).
+    """
+    with engine.begin() as conn:
+        for table in ("users", "broadcasts", "outbox"):
+            n = conn.execute(sql_text(f"UPDATE {table} SET tenant = :t WHERE tenant IS NULL"),
+                             {"t": DEFAULT_TENANT}).rowcount
+            if n:
+                logger.info(f"Assigned {n} {table} rows to tenant {DEFAULT_TENANT}")
+
+    old = [u for u in inspect(engine).get_unique_constraints("users") if u["column_names"] == ["telegram_id"]]
+    if not old:
+        return
+    with engine.begin() as conn:
+        if _SQLITE:
+            # SQLite не умеет DROP CONSTRAINT: пересоздаём таблицу (внешние ключи ссылаются по имени)
+            cols = ", ".join(c.name for c in User.__table__.columns)
+            conn.execute(CreateTable(User.__table__.to_metadata(MetaData(), name="users_new")))
+            conn.execute(sql_text(f"INSERT INTO users_new ({cols}) SELECT {cols} FROM users"))
+            conn.execute(sql_text("DROP TABLE users"))
+            conn.execute(sql_text("ALTER TABLE users_new RENAME TO users"))
+        else:
+            conn.execute(sql_text(f"ALTER TABLE users DROP CONSTRAINT {old[0]['name']}"))
+            conn.execute(sql_text("ALTER TABLE users ADD CONSTRAINT uq_users_tenant_telegram "
+                                  "UNIQUE (tenant, telegram_id)"))
+    logger.info("users.telegram_id is now unique per tenant")
+
+
+def _backfill_fire_at():
+    """Старые разовые напоминания: fire_at = день создания + time (в TIMEZONE)."""
+    from datetime import datetime
+    import pytz
+
+    with get_db() as db:
+        rows = db.query(Reminder).filter(
+            Reminder.reminder_type == "once",
+            Reminder.fire_at.is_(None)
+        ).all()
+        for r in rows:
+            tz = get_tz(r.user.timezone)
+            created = (r.created_at or datetime.utcnow()).replace(tzinfo=pytz.utc).astimezone(tz)
+            h, m = map(int, r.time.split(":"))
+            local = tz.localize(datetime(created.year, created.month, created.day, h, m))
+            r.fire_at = local.astimezone(pytz.utc).replace(tzinfo=None)
+        if rows:
+            db.commit()
+            logger.info(f"Backfilled fire_at for {len(rows)} once reminders")
+
+
+def _event(type_: str, user_id: int = None, reminder_id: int = None, at=None, **data) -> dict:
+    """Строка для events (см. models.Event)."""
+    from datetime import datetime
+    return {
+        "type": type_, "user_id": user_id, "reminder_id": reminder_id,
+        "at": at or datetime.utcnow(),
+        "data": json.dumps(data, ensure_ascii=False, default=str) if data else None,
+    }
+
+
+def _append_events(db: Session, events: list[dict]) -> None:
+    """Дописать события в текущую транзакцию (один executemany)."""
+    if events:
+        db.execute(insert(Event), events)
+
+
+def _reminder_created(r, at=None) -> dict:
+    return _event("reminder_created", r.user_id, r.id, at or r.created_at,
+                  reminder_type=r.reminder_type, time=r.time, days=r.days,
+                  text=r.text, fire_at=r.fire_at)
+
+
+def _seed_events():
+    """Журнал пуст, а данные есть (БД старше журнала) — восстановить события из текущих строк."""
+    with get_db() as db:
+        if db.query(Event.id).first() or not db.query(Reminder.id).first():
+            return
+        events = []
+        for r in db.query(Reminder).all():
+            events.append(_reminder_created(r))
+            if not r.is_active:
+                events.append(_event("reminder_deactivated", r.user_id, r.id, r.fire_at or r.created_at))
+        for c in db.query(CompletedWorkout).all():
+            events.append(_event("workout_completed", c.user_id, c.reminder_id, c.completed_at,
+                                 completed_id=c.id))
+        events.sort(key=lambda e: e["at"])
+        _append_events(db, events)
+        db.commit()
+        logger.info(f"Seeded event log with {len(events)} events from existing rows")
+
+
+# Полнотекстовый индекс (SQLite FTS5) по текстам напоминаний и выполнений.
+# rowid = id*2 для reminders, id*2+1 для completed_workouts — удаление/обновление
+# по rowid без сканирования. owner = 'u<user_id>' — фильтр пользователя внутри MATCH.
+# unicode61 не сводит ё к е, поэтому нормализуем сами (и в запросе тоже).
+_FTS_TEXT = "replace(replace({}, 'ё', 'е'), 'Ё', 'Е')"
+_FTS_BODY = _FTS_TEXT.format("(SELECT body FROM texts WHERE id = {})")
+_SEARCH_TRIGGERS = ("search_reminders_ai", "search_reminders_au", "search_reminders_ad",
+                    "search_completed_ai", "search_completed_ad")
+_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE search_index USING fts5("
+    "body, owner, tokenize = 'unicode61 remove_diacritics 2')",
+
+    "CREATE TRIGGER search_reminders_ai AFTER INSERT ON reminders BEGIN "
+    f"INSERT INTO search_index(rowid, body, owner) VALUES (new.id * 2, {_FTS_BODY.format('new.text_id')}, "
+    "'u' || new.user_id); END",
+
+    "CREATE TRIGGER search_reminders_au AFTER UPDATE OF text_id, user_id ON reminders BEGIN "
+    "DELETE FROM search_index WHERE rowid = old.id * 2; "
+    f"INSERT INTO search_index(rowid, body, owner) VALUES (new.id * 2, {_FTS_BODY.format('new.text_id')}, "
+    "'u' || new.user_id); END",
+
+    "CREATE TRIGGER search_reminders_ad AFTER DELETE ON reminders BEGIN "
+    "DELETE FROM search_index WHERE rowid = old.id * 2; END",
+
+    "CREATE TRIGGER search_completed_ai AFTER INSERT ON completed_workouts WHEN new.text_id IS NOT NULL BEGIN "
+    f"INSERT INTO search_index(rowid, body, owner) VALUES (new.id * 2 + 1, {_FTS_BODY.format('new.text_id')}, "
+    "'u' || new.user_id); END",
+
+    "CREATE TRIGGER search_completed_ad AFTER DELETE ON completed_workouts BEGIN "
+    "DELETE FROM search_index WHERE rowid = old.id * 2 + 1; END",
+
+    "INSERT INTO search_index(rowid, body, owner) "
+    f"SELECT r.id * 2, {_FTS_TEXT.format('t.body')}, 'u' || r.user_id "
+    "FROM reminders r JOIN texts t ON t.id = r.text_id",
+
+    "INSERT INTO search_index(rowid, body, owner) "
+    f"SELECT c.id * 2 + 1, {_FTS_TEXT.format('t.body')}, 'u' || c.user_id "
+    "FROM completed_workouts c JOIN texts t ON t.id = c.text_id",
+]
+
+
+def search_enabled() -> bool:
+    return engine.dialect.name == "sqlite" and inspect(engine).has_table("search_index")
+
+
+def _init_search():
+    """Создать FTS-индекс и триггеры (один раз) и заполнить его существующими строками."""
+    if engine.dialect.name != "sqlite" or inspect(engine).has_table("search_index"):
+        return
+    try:
+        with engine.begin() as conn:
+            for stmt in _SEARCH_DDL:
+                conn.execute(sql_text(stmt))
+        logger.info("Full-text search index built")
+    except Exception as e:
+        # SQLite без FTS5 — бот работает, /find отвечает, что поиск недоступен
+        logger.warning(f"Full-text search unavailable: {e}")
+
+
+# ---------------- Словарь текстов ----------------
+# Тексты напоминаний и выполнений лежат в texts один раз (models.InternedText),
+# строки ссылаются на них по text_id. Запись: intern_texts — найти по хешу или
+# добавить. Чтение: у ORM-объектов .text (подзапрос по PK), выборки колонок
+# берут text_id и достают тексты через text_cache — одинаковые тексты тогда
+# ещё и один объект str в памяти (корзины планировщика, снимки).
+
+def text_hash(body: str) -> int:
+    """8 байт blake2b со знаком — помещается в BIGINT."""
+    return int.from_bytes(hashlib.blake2b(body.encode("utf-8"), digest_size=8).digest(),
+                          "little", signed=True)
+
+
+class TextCache:
+    """LRU словаря в обе стороны: id -> текст (чтение) и текст -> id (запись)."""
+
+    def __init__(self, size: int = TEXT_CACHE_SIZE):
+        self.size = size
+        self._bodies: OrderedDict[int, str] = OrderedDict()
+        self._ids: dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def body(self, text_id: int) -> str | None:
+        body = self._bodies.get(text_id)
+        if body is None:
+            self.misses += 1
+            return None
+        self._bodies.move_to_end(text_id)
+        self.hits += 1
+        return body
+
+    def id_of(self, body: str) -> int | None:
+        text_id = self._ids.get(body)
+        if text_id is None:
+            self.misses += 1
+            return None
+        self._bodies.move_to_end(text_id)
+        self.hits += 1
+        return text_id
+
+    def put(self, text_id: int, body: str) -> None:
+        if self.size <= 0:
+            return
+        self._bodies[text_id] = body
+        self._bodies.move_to_end(text_id)
+        self._ids.setdefault(body, text_id)
+        while len(self._bodies) > self.size:
+            old_id, old = self._bodies.popitem(last=False)
+            if self._ids.get(old) == old_id:
+                del self._ids[old]
+
+    def __len__(self) -> int:
+        return len(self._bodies)
+
+
+text_cache = TextCache()
+
+_IN_CHUNK = 500     # параметров в одном IN (...)
+
+
+def _find_texts(db: Session, bodies: set[str], cache: bool = True) -> dict[str, int]:
+    """{текст: id} для уже записанных текстов; при дублях — меньший id."""
+    hashes = sorted({text_hash(b) for b in bodies})
+    found = {}
+    for i in range(0, len(hashes), _IN_CHUNK):
+        rows = db.query(InternedText.id, InternedText.body).filter(
+            InternedText.hash.in_(hashes[i:i + _IN_CHUNK])
+        ).order_by(InternedText.id).all()
+        for text_id, body in rows:
+            if body in bodies and body not in found:
+                found[body] = text_id
+                if cache:
+                    text_cache.put(text_id, body)
+    return found
+
+
+def intern_texts(db: Session, bodies: Iterable[str | None]) -> dict[str, int]:
+    """
+    {текст: text_id}; новых текстов добавляет строки в texts в текущей транзакции.
+    Уникального индекса нет: два процесса могут одновременно записать один текст
+    дважды — это лишняя строка, а не ошибка. Новые id в кеш не попадают, пока не
+    закоммичены (после отката кеш ссылался бы на несуществующую строку).
+    """
+    out, missing = {}, set()
+    for body in set(bodies):
+        if body is None:
+            continue
+        text_id = text_cache.id_of(body)
+        if text_id is None:
+            missing.add(body)
+        else:
+            out[body] = text_id
+    if missing:
+        out.update(_find_texts(db, missing))
+        new = missing - out.keys()
+        if new:
+            db.execute(insert(InternedText), [{"hash": text_hash(b), "body": b} for b in new])
+            out.update(_find_texts(db, new, cache=False))
+    return out
+
+
+def intern_text(db: Session, body: str | None) -> int | None:
+    return intern_texts(db, [body])[body] if body is not None else None
+
+
+def texts_by_id(db: Session, text_ids: Iterable[int | None]) -> dict[int, str]:
+    """{text_id: текст}: из кеша, недостающие — одним запросом на порцию id."""
+    out, missing = {}, []
+    for text_id in set(text_ids):
+        if text_id is None:
+            continue
+        body = text_cache.body(text_id)
+        if body is None:
+            missing.append(text_id)
+        else:
+            out[text_id] = body
+    for i in range(0, len(missing), _IN_CHUNK):
+        for text_id, body in db.query(InternedText.id, InternedText.body).filter(
+            InternedText.id.in_(missing[i:i + _IN_CHUNK])
+        ).all():
+            text_cache.put(text_id, body)
+            out[text_id] = body
+    return out
+
+
+def _migrate_texts(chunk: int = TEXT_MIGRATION_CHUNK):
+    """
+    База до словаря: тексты в reminders.text / completed_workouts.text. Переносим
+    их в texts порциями по chunk строк (порция — своя транзакция: прерванный
+    перенос продолжится со следующего старта), затем удаляем старую колонку.
+    """
+    insp = inspect(engine)
+    for table in ("reminders", "completed_workouts"):
+        if "text" not in {c["name"] for c in insp.get_columns(table)}:
+            continue
+        moved, after = 0, 0
+        while True:
+            with get_db() as db:
+                rows = db.execute(sql_text(
+                    f"SELECT id, text FROM {table} "
+                    "WHERE id > :after AND text_id IS NULL AND text IS NOT NULL ORDER BY id LIMIT :n"
+                ), {"after": after, "n": chunk}).all()
+                if not rows:
+                    break
+                ids = intern_texts(db, [body for _, body in rows])
+                db.execute(sql_text(f"UPDATE {table} SET text_id = :text_id WHERE id = :id"),
+                           [{"id": row_id, "text_id": ids[body]} for row_id, body in rows])
+                db.commit()
+            moved += len(rows)
+            after = rows[-1][0]
+            logger.info(f"Moved {moved} {table}.text values to the text dictionary")
+        with engine.begin() as conn:
+            if _SQLITE:
+                # триггеры поиска ссылаются на старую колонку; индекс заново построит _init_search
+                for name in _SEARCH_TRIGGERS:
+                    conn.execute(sql_text(f"DROP TRIGGER IF EXISTS {name}"))
+                conn.execute(sql_text("DROP TABLE IF EXISTS search_index"))
+            conn.execute(sql_text(f"ALTER TABLE {table} DROP COLUMN text"))
+        logger.info(f"Dropped {table}.text; VACUUM to return the freed pages to the OS")
+
+
 @contextmanager
 def get_db() -> Generator[Session, None, None]:
     db = SessionLocal()
+    querystats.note_session()
     try:
         yield db
     except Exception:
@@ -32,11 +413,14 @@ def get_db() -> Generator[Session, None, None]:
 
 
 def get_or_create_user(telegram_id: int, username: str = None,
-                       first_name: str = None, last_name: str = None) -> User:
+                       first_name: str = None, last_name: str = None, tenant: str = None) -> User:
+    """Пользователь бота tenant (по умолчанию — бота текущего апдейта)."""
+    tenant = tenant or current_tenant()
     with get_db() as db:
-        user = db.query(User).filter(User.telegram_id == telegram_id).first()
+        user = db.query(User).filter(User.tenant == tenant, User.telegram_id == telegram_id).first()
         if not user:
             user = User(
+                tenant=tenant,
                 telegram_id=telegram_id,
                 username=username,
                 first_name=first_name,
@@ -45,52 +429,180 @@ def get_or_create_user(telegram_id: int, username: str = None,
             db.add(user)
             db.commit()
             db.refresh(user)
-            logger.info(f"Created new user: {telegram_id}")
+            logger.info(f"Created new user: {telegram_id} ({tenant})")
         else:
-            if user.username != username or user.first_name != first_name or user.last_name != last_name:
+            if user.username != username or user.first_name != first_name or user.last_name != last_name \
+                    or not user.is_active:
                 user.username = username
                 user.first_name = first_name
                 user.last_name = last_name
+                user.is_active = True  # снова пишет боту — значит, не заблокировал
                 db.commit()
+                db.refresh(user)
         return user
 
 
+def set_user_timezone(user_id: int, tz: str | None) -> None:
+    with get_db() as db:
+        db.query(User).filter(User.id == user_id).update(
+            {User.timezone: tz}, synchronize_session=False
+        )
+        # корзины планировщика зависят от зоны — снимок при старте дочитает по событию
+        _append_events(db, [_event("timezone_changed", user_id, tz=tz)])
+        db.commit()
+
+
 def create_reminder(user_id: int, reminder_type: str, time: str,
-                    text: str, days: str = None, job_id: str = None) -> Reminder:
+                    text: str, days: str = None, job_id: str = None,
+                    fire_at=None) -> Reminder:
     with get_db() as db:
         reminder = Reminder(
             user_id=user_id,
             reminder_type=reminder_type,
             time=time,
             days=days,
-            text=text,
-            job_id=job_id
+            text_id=intern_text(db, text),
+            job_id=job_id,
+            fire_at=fire_at
         )
         db.add(reminder)
+        db.flush()
+        _append_events(db, [_reminder_created(reminder)])
         db.commit()
         db.refresh(reminder)
         logger.info(f"Created reminder {reminder.id} for user {user_id}")
         return reminder
 
 
-def get_active_reminders(user_id: int = None):
+def bulk_create_reminders(telegram_id: int, specs: list[ReminderSpec],
+                          username: str = None, first_name: str = None,
+                          last_name: str = None, tenant: str = None) -> tuple[int, list[int]]:
+    """
+    Создать пользователя (если нужно) и все напоминания одной транзакцией.
+    Вставка одним INSERT ... RETURNING. Возвращает (user_id, [reminder_id, ...]).
+    """
+    tenant = tenant or current_tenant()
     with get_db() as db:
-        q = db.query(Reminder).filter(Reminder.is_active == True)
+        user = db.query(User).filter(User.tenant == tenant, User.telegram_id == telegram_id).first()
+        if not user:
+            user = User(tenant=tenant, telegram_id=telegram_id, username=username,
+                        first_name=first_name, last_name=last_name)
+            db.add(user)
+            db.flush()
+        user_id = user.id
+        ids = []
+        if specs:
+            from datetime import datetime
+            now = datetime.utcnow()
+            text_ids = intern_texts(db, [sp.text for sp in specs])
+            ids = list(db.scalars(
+                insert(Reminder).values([
+                    {"user_id": user_id, "reminder_type": sp.reminder_type, "time": sp.time,
+                     "days": sp.days, "text_id": text_ids[sp.text], "fire_at": sp.fire_at,
+                     "is_active": True, "created_at": now}
+                    for sp in specs
+                ]).returning(Reminder.id)
+            ))
+            # id выдаются по порядку VALUES
+            _append_events(db, [
+                _event("reminder_created", user_id, rid, now, reminder_type=sp.reminder_type,
+                       time=sp.time, days=sp.days, text=sp.text, fire_at=sp.fire_at)
+                for rid, sp in zip(sorted(ids), specs)
+            ])
+        db.commit()
+        logger.info(f"Bulk-created {len(ids)} reminders for user {user_id}")
+        return user_id, sorted(ids)
+
+
+def _reminder_views(db: Session):
+    """SELECT только нужных колонок напоминания + telegram_id, зона и арендатор владельца."""
+    return db.query(
+        Reminder.id, Reminder.user_id, Reminder.reminder_type, Reminder.time,
+        Reminder.days, Reminder.text_id, Reminder.job_id, Reminder.created_at,
+        User.telegram_id, Reminder.fire_at, User.timezone, User.tenant
+    ).join(User, User.id == Reminder.user_id)
+
+
+def _views(db: Session, rows) -> list[ReminderView]:
+    """Строки _reminder_views -> ReminderView, text_id -> текст через словарь."""
+    texts = texts_by_id(db, [row[5] for row in rows])
+    return [ReminderView(*row[:5], texts.get(row[5], ""), *row[6:]) for row in rows]
+
+
+def get_active_reminders(user_id: int = None) -> list[ReminderView]:
+    with get_db() as db:
+        q = _reminder_views(db).filter(Reminder.is_active == True)
         if user_id:
             q = q.filter(Reminder.user_id == user_id)
-        return q.all()
+        return _views(db, q.order_by(Reminder.id).all())
+
+
+def get_pending_once_reminders(from_utc, until_utc) -> list[ReminderView]:
+    """Активные разовые с fire_at в [from, until) — диапазонный запрос по индексу fire_at."""
+    with get_db() as db:
+        q = _reminder_views(db).filter(
+            Reminder.fire_at >= from_utc,
+            Reminder.fire_at < until_utc,
+            Reminder.reminder_type == "once",
+            Reminder.is_active == True
+        ).order_by(Reminder.fire_at)
+        return _views(db, q.all())
+
+
+def count_active_reminders(user_id: int) -> int:
+    with get_db() as db:
+        return db.query(Reminder.id).filter(
+            Reminder.user_id == user_id,
+            Reminder.is_active == True
+        ).count()
 
 
-def get_reminder_by_id(reminder_id: int, user_id: int = None):
+def get_reminder_by_id(reminder_id: int, user_id: int = None) -> ReminderView | None:
     """Возвращает ТОЛЬКО активное напоминание (чтобы нельзя было удалять повторно)."""
     with get_db() as db:
-        q = db.query(Reminder).filter(
+        q = _reminder_views(db).filter(
             Reminder.id == reminder_id,
             Reminder.is_active == True
         )
         if user_id:
             q = q.filter(Reminder.user_id == user_id)
-        return q.first()
+        row = q.first()
+        return _views(db, [row])[0] if row else None
+
+
+def get_reminders_by_ids(reminder_ids: list[int], user_id: int = None,
+                         active_only: bool = False) -> list[ReminderView]:
+    """Напоминания по списку id (по умолчанию без фильтра is_active) одним запросом."""
+    if not reminder_ids:
+        return []
+    with get_db() as db:
+        q = _reminder_views(db).filter(Reminder.id.in_(reminder_ids))
+        if user_id:
+            q = q.filter(Reminder.user_id == user_id)
+        if active_only:
+            q = q.filter(Reminder.is_active == True)
+        return _views(db, q.order_by(Reminder.id).all())
+
+
+def set_reminder_job_id(reminder_id: int, job_id: str) -> None:
+    """Сохранить ID задачи APScheduler у напоминания."""
+    with get_db() as db:
+        db.query(Reminder).filter(Reminder.id == reminder_id).update(
+            {Reminder.job_id: job_id}, synchronize_session=False
+        )
+        db.commit()
+
+
+def set_reminder_job_ids(job_ids: dict[int, str]) -> None:
+    """То же пачкой: {reminder_id: job_id} одним executemany."""
+    if not job_ids:
+        return
+    with get_db() as db:
+        db.execute(
+            update(Reminder),
+            [{"id": rid, "job_id": jid} for rid, jid in job_ids.items()]
+        )
+        db.commit()
 
 
 def delete_reminder(reminder_id: int, user_id: int = None) -> bool:
@@ -102,6 +614,7 @@ def delete_reminder(reminder_id: int, user_id: int = None) -> bool:
         r = q.first()
         if not r:
             return False
+        _append_events(db, [_event("reminder_deleted", r.user_id, r.id)])
         db.delete(r)
         db.commit()
         logger.info(f"Hard-deleted reminder {reminder_id}")
@@ -118,21 +631,26 @@ def rename_reminder(reminder_id: int, user_id: int, new_text: str) -> bool:
         ).first()
         if not r:
             return False
-        r.text = new_text
+        r.text_id = intern_text(db, new_text)
+        _append_events(db, [_event("reminder_renamed", user_id, reminder_id, text=new_text)])
         db.commit()
         return True
 
 
-def mark_workout_completed(reminder_id: int, user_id: int, text: str = None):
+def mark_workout_completed(reminder_id: int, user_id: int, text: str = None) -> int:
     with get_db() as db:
         completed = CompletedWorkout(
             user_id=user_id,
             reminder_id=reminder_id,
-            text=text
+            text_id=intern_text(db, text)
         )
         db.add(completed)
+        db.flush()
+        _append_events(db, [_event("workout_completed", user_id, reminder_id, completed.completed_at,
+                                   completed_id=completed.id)])
         db.commit()
         logger.info(f"Marked workout completed for user {user_id}, reminder {reminder_id}")
+        return completed.id
 
 
 def get_user_stats(user_id: int, days: int = 7):
@@ -161,27 +679,72 @@ def set_reminder_inactive(reminder_id: int) -> None:
         r = db.query(Reminder).filter(Reminder.id == reminder_id).first()
         if r and r.is_active:
             r.is_active = False
+            _append_events(db, [_event("reminder_deactivated", r.user_id, r.id)])
             db.commit()
 
-def get_any_reminder_by_id(reminder_id: int, user_id: int = None):
+
+def set_reminders_inactive(reminder_ids: list[int]) -> None:
+    """То же для пачки id одним UPDATE."""
+    if not reminder_ids:
+        return
+    with get_db() as db:
+        rows = db.query(Reminder.id, Reminder.user_id).filter(
+            Reminder.id.in_(reminder_ids), Reminder.is_active == True
+        ).all()
+        if not rows:
+            return
+        db.query(Reminder).filter(Reminder.id.in_([rid for rid, _ in rows])).update(
+            {Reminder.is_active: False}, synchronize_session=False
+        )
+        _append_events(db, [_event("reminder_deactivated", uid, rid) for rid, uid in rows])
+        db.commit()
+
+
+def record_reminders_sent(reminder_ids: list[int], deactivate_ids: list[int] = ()) -> None:
+    """После отправки: события reminder_sent и деактивация разовых — одной транзакцией."""
+    if not reminder_ids and not deactivate_ids:
+        return
+    with get_db() as db:
+        rows = db.query(Reminder.id, Reminder.user_id, Reminder.is_active).filter(
+            Reminder.id.in_(set(reminder_ids) | set(deactivate_ids))
+        ).all()
+        sent = set(reminder_ids)
+        events = [_event("reminder_sent", uid, rid) for rid, uid, _ in rows if rid in sent]
+        deactivate = set(deactivate_ids)
+        off = [(rid, uid) for rid, uid, active in rows if active and rid in deactivate]
+        if off:
+            db.query(Reminder).filter(Reminder.id.in_([rid for rid, _ in off])).update(
+                {Reminder.is_active: False}, synchronize_session=False
+            )
+            events += [_event("reminder_deactivated", uid, rid) for rid, uid in off]
+        _append_events(db, events)
+        db.commit()
+
+def get_any_reminder_by_id(reminder_id: int, user_id: int = None) -> ReminderView | None:
     """Ищет напоминание без фильтра is_active (нужно для колбэка после once)."""
     with get_db() as db:
-        q = db.query(Reminder).filter(Reminder.id == reminder_id)
+        q = _reminder_views(db).filter(Reminder.id == reminder_id)
         if user_id:
             q = q.filter(Reminder.user_id == user_id)
-        return q.first()
+        row = q.first()
+        return _views(db, [row])[0] if row else None
 
-def _planned_for_day(user_id: int, day_local_date, tz_str: str = "Asia/Almaty") -> int:
-    """План на конкретный день: active 'everyday' + active 'days' совпадающего weekday."""
-    ru_days = ['пн','вт','ср','чт','пт','сб','вс']
-    ru = ru_days[day_local_date.weekday()]
+
+def _plan_rows(user_id: int) -> list[PlanRow]:
+    """Активные напоминания пользователя — только поля для расчёта плана."""
     with get_db() as db:
-        rems = db.query(Reminder).filter(
+        rows = db.query(Reminder.reminder_type, Reminder.days).filter(
             Reminder.user_id == user_id,
             Reminder.is_active == True
         ).all()
+    return [PlanRow(*row) for row in rows]
+
+
+def _planned_from_rows(rows: list[PlanRow], day_local_date) -> int:
+    ru_days = ['пн','вт','ср','чт','пт','сб','вс']
+    ru = ru_days[day_local_date.weekday()]
     y = 0
-    for r in rems:
+    for r in rows:
         if r.reminder_type == "everyday":
             y += 1
         elif r.reminder_type == "days" and r.days:
@@ -191,16 +754,21 @@ def _planned_for_day(user_id: int, day_local_date, tz_str: str = "Asia/Almaty")
     return y
 
 
-def finalize_past_weeks(user_id: int, tz_str: str = "Asia/Almaty") -> int:
+def _planned_for_day(user_id: int, day_local_date, tz_str: str = None) -> int:
+    """План на конкретный день: active 'everyday' + active 'days' совпадающего weekday."""
+    return _planned_from_rows(_plan_rows(user_id), day_local_date)
+
+
+def finalize_past_weeks(user_id: int, tz_str: str = None) -> int:
     """
     Сводит недели (пн–вс) ТОЛЬКО с момента первой активности пользователя.
     Не сохраняет пустые недели 0/0.
-    Возвращает, сколько итогов создано.
+    Возвращает, сколько итогов создано. tz_str — зона пользователя (None — по умолчанию).
     """
     from datetime import datetime, timedelta
     import pytz
 
-    tz = pytz.timezone(tz_str)
+    tz = get_tz(tz_str)
     today = datetime.now(tz).date()
     this_monday = today - timedelta(days=today.weekday())  # понедельник текущей недели
 
@@ -239,13 +807,16 @@ def finalize_past_weeks(user_id: int, tz_str: str = "Asia/Almaty") -> int:
 
     # ---- 2) Узнаём какие недели уже сохранены ----
     with get_db() as db:
-        existing = db.query(WeeklySummary).filter(WeeklySummary.user_id == user_id).all()
+        existing = db.query(WeeklySummary.week_start)\
+                     .filter(WeeklySummary.user_id == user_id).all()
 
     have = set()
-    for w in existing:
-        ws_local = w.week_start.replace(tzinfo=pytz.utc).astimezone(tz).date()
+    for (week_start,) in existing:
+        ws_local = week_start.replace(tzinfo=pytz.utc).astimezone(tz).date()
         have.add(ws_local)  # локальная дата понедельника
 
+    plan_rows = None  # план читаем один раз и только если есть что сводить
+
     # ---- 3) Считаем и сохраняем новые недели ----
     created = 0
     cur = start_monday
@@ -257,14 +828,15 @@ def finalize_past_weeks(user_id: int, tz_str: str = "Asia/Almaty") -> int:
             # неделя завершена, если её воскресенье < this_monday
             if week_end_date < this_monday:
                 # границы недели в локали -> UTC
-                week_start_local = datetime(cur.year, cur.month, cur.day, 0, 0, 0, tzinfo=tz)
-                week_end_local   = datetime(week_end_date.year, week_end_date.month, week_end_date.day, 23, 59, 59, tzinfo=tz)
+                # localize, а не tzinfo=: у pytz-зон иначе берётся LMT-смещение
+                week_start_local = tz.localize(datetime(cur.year, cur.month, cur.day, 0, 0, 0))
+                week_end_local   = tz.localize(datetime(week_end_date.year, week_end_date.month, week_end_date.day, 23, 59, 59))
                 week_start_utc = week_start_local.astimezone(pytz.utc)
                 week_end_utc   = week_end_local.astimezone(pytz.utc)
 
                 # DONE внутри этой недели
                 with get_db() as db:
-                    done_rows = db.query(CompletedWorkout).filter(
+                    done_rows = db.query(CompletedWorkout.completed_at).filter(
                         CompletedWorkout.user_id == user_id,
                         CompletedWorkout.completed_at >= week_start_utc,
                         CompletedWorkout.completed_at <= week_end_utc
@@ -272,14 +844,17 @@ def finalize_past_weeks(user_id: int, tz_str: str = "Asia/Almaty") -> int:
 
                 # считаем done по дням (в локальной TZ)
                 dm = {}
-                for r in done_rows:
-                    dt_local = r.completed_at.replace(tzinfo=pytz.utc).astimezone(tz)
+                for (completed_at,) in done_rows:
+                    dt_local = completed_at.replace(tzinfo=pytz.utc).astimezone(tz)
                     dd = dt_local.date()
                     dm[dd] = dm.get(dd, 0) + 1
 
+                if plan_rows is None:
+                    plan_rows = _plan_rows(user_id)
+
                 planned_total, done_total = 0, 0
                 for d in week_days:
-                    planned_total += _planned_for_day(user_id, d, tz_str)
+                    planned_total += _planned_from_rows(plan_rows, d)
                     done_total += dm.get(d, 0)
 
                 # Не сохраняем пустую неделю 0/0
@@ -304,28 +879,29 @@ def finalize_past_weeks(user_id: int, tz_str: str = "Asia/Almaty") -> int:
 
     return created
 
-def get_week_summaries(user_id: int, tz_str: str = "Asia/Almaty"):
+def get_week_summaries(user_id: int, tz_str: str = None):
     """
     Вернёт все недельные итоги пользователя.
     Формат:
     {"range": "12.08–18.08", "done": 55, "planned": 56, "pct": 98}
     """
     import pytz
-    tz = pytz.timezone(tz_str)
+    tz = get_tz(tz_str)
     with get_db() as db:
-        rows = db.query(WeeklySummary)\
+        rows = db.query(WeeklySummary.week_start, WeeklySummary.week_end,
+                        WeeklySummary.done_total, WeeklySummary.planned_total)\
                  .filter(WeeklySummary.user_id == user_id)\
                  .order_by(WeeklySummary.week_start.asc())\
                  .all()
     out = []
-    for w in rows:
-        ws = w.week_start.replace(tzinfo=pytz.utc).astimezone(tz).date()
-        we = w.week_end.replace(tzinfo=pytz.utc).astimezone(tz).date()
-        pct = int(round(100 * w.done_total / w.planned_total)) if w.planned_total > 0 else 0
+    for week_start, week_end, done_total, planned_total in rows:
+        ws = week_start.replace(tzinfo=pytz.utc).astimezone(tz).date()
+        we = week_end.replace(tzinfo=pytz.utc).astimezone(tz).date()
+        pct = int(round(100 * done_total / planned_total)) if planned_total > 0 else 0
         out.append({
             "range": f"{ws.strftime('%d.%m')}–{we.strftime('%d.%m')}",
-            "done": w.done_total,
-            "planned": w.planned_total,
+            "done": done_total,
+            "planned": planned_total,
             "pct": pct
         })
     return out
@@ -333,7 +909,7 @@ def get_week_summaries(user_id: int, tz_str: str = "Asia/Almaty"):
 
 
 
-def get_daily_7d_ratio(user_id: int, tz_str: str = "Asia/Almaty"):
+def get_daily_7d_ratio(user_id: int, tz_str: str = None):
     """
     Возвращает список на 7 дней (сегодня и 6 прошлых) в порядке: сегодня, вчера, ...
       [{"date":"ДД.ММ.ГГГГ","done":X,"planned":Y}, ...]
@@ -341,32 +917,925 @@ def get_daily_7d_ratio(user_id: int, tz_str: str = "Asia/Almaty"):
     from datetime import datetime, timedelta
     import pytz
 
-    tz = pytz.timezone(tz_str)
-    now_local = datetime.now(tz)
-    today0 = now_local.replace(hour=0, minute=0, second=0, microsecond=0)
+    tz = get_tz(tz_str)
+    today = datetime.now(tz).date()
 
-    # отметки DONE за последние 7 дней
-    start_local = today0 - timedelta(days=6)
-    start_utc = start_local.astimezone(pytz.utc)
+    # отметки DONE за последние 7 дней (полночь через localize — верно и в день перехода DST)
+    first = today - timedelta(days=6)
+    start_utc = tz.localize(datetime(first.year, first.month, first.day)).astimezone(pytz.utc)
 
     with get_db() as db:
-        rows = db.query(CompletedWorkout).filter(
+        rows = db.query(CompletedWorkout.completed_at).filter(
             CompletedWorkout.user_id == user_id,
             CompletedWorkout.completed_at >= start_utc
         ).all()
 
     done_map = {}
-    for r in rows:
-        dt_local = r.completed_at.replace(tzinfo=pytz.utc).astimezone(tz)
+    for (completed_at,) in rows:
+        dt_local = completed_at.replace(tzinfo=pytz.utc).astimezone(tz)
         d = dt_local.date()
         done_map[d] = done_map.get(d, 0) + 1
 
+    plan_rows = _plan_rows(user_id)
     out = []
     for i in range(7):
-        d = (today0 - timedelta(days=i)).date()
+        d = today - timedelta(days=i)
         out.append({
             "date": d.strftime("%d.%m.%Y"),
             "done": done_map.get(d, 0),
-            "planned": _planned_for_day(user_id, d, tz_str)
+            "planned": _planned_from_rows(plan_rows, d)
         })
     return out
+
+
+def get_done_by_day(user_id: int, start_utc, end_utc, tz) -> dict:
+    """
+    {локальная дата: число выполнений} за [start, end) одним агрегатом.
+    Сдвиг в локальное время — CASE по отрезкам без перехода DST, так что
+    GROUP BY идёт сразу по локальным дням (диапазон — по ix_completed_workouts_user).
+    """
+    from datetime import date
+    import pytz
+
+    col = CompletedWorkout.completed_at
+    with get_db() as db:
+        if not _SQLITE:
+            out = {}
+            for (at,) in db.query(col).filter(
+                CompletedWorkout.user_id == user_id, col >= start_utc, col < end_utc
+            ).all():
+                d = pytz.utc.localize(at).astimezone(tz).date()
+                out[d] = out.get(d, 0) + 1
+            return out
+
+        periods = offset_periods(tz, start_utc, end_utc)
+        shift = f"{periods[-1][2]:+d} minutes"
+        if len(periods) > 1:
+            shift = case(*((col < end, f"{m:+d} minutes") for _, end, m in periods[:-1]), else_=shift)
+        day = func.date(col, shift)
+        rows = db.query(day, func.count(CompletedWorkout.id)).filter(
+            CompletedWorkout.user_id == user_id, col >= start_utc, col < end_utc
+        ).group_by(day).all()
+    return {date.fromisoformat(d): n for d, n in rows}
+
+
+
+# ---------------- Broadcast ----------------
+
+def get_active_user_chunk(after_id: int, limit: int, tenant: str = None) -> list[tuple[int, int]]:
+    """Keyset-страница активных пользователей бота: [(users.id, telegram_id), ...] с id > after_id."""
+    with get_db() as db:
+        return [tuple(row) for row in db.query(User.id, User.telegram_id).filter(
+            User.tenant == (tenant or current_tenant()),
+            User.is_active == True,
+            User.id > after_id
+        ).order_by(User.id.asc()).limit(limit).all()]
+
+
+def count_active_users(after_id: int = 0, tenant: str = None) -> int:
+    with get_db() as db:
+        return db.query(User.id).filter(
+            User.tenant == (tenant or current_tenant()), User.is_active == True, User.id > after_id
+        ).count()
+
+
+def count_active_users_by_tenant() -> dict[str, int]:
+    with get_db() as db:
+        return dict(db.query(User.tenant, func.count(User.id)).filter(User.is_active == True)
+                    .group_by(User.tenant).all())
+
+
+def deactivate_users(user_ids: list[int]) -> None:
+    """Пометить пользователей неактивными (заблокировали бота)."""
+    if not user_ids:
+        return
+    with get_db() as db:
+        db.query(User).filter(User.id.in_(user_ids)).update(
+            {User.is_active: False}, synchronize_session=False
+        )
+        db.commit()
+    logger.info(f"Deactivated {len(user_ids)} users")
+
+
+def create_broadcast(text: str, created_by: int, tenant: str = None) -> int:
+    """Рассылка пользователям бота tenant (по умолчанию — текущего)."""
+    tenant = tenant or current_tenant()
+    with get_db() as db:
+        b = Broadcast(tenant=tenant, text=text, created_by=created_by,
+                      total=count_active_users(tenant=tenant))
+        db.add(b)
+        db.commit()
+        return b.id
+
+
+def get_broadcast(broadcast_id: int) -> dict | None:
+    with get_db() as db:
+        b = db.get(Broadcast, broadcast_id)
+        if not b:
+            return None
+        return {
+            "id": b.id, "tenant": b.tenant, "text": b.text, "created_by": b.created_by, "status": b.status,
+            "last_user_id": b.last_user_id, "total": b.total,
+            "sent": b.sent, "failed": b.failed, "blocked": b.blocked,
+        }
+
+
+def get_running_broadcast_ids() -> list[int]:
+    with get_db() as db:
+        return [bid for (bid,) in db.query(Broadcast.id).filter(Broadcast.status == "running").all()]
+
+
+def save_broadcast_progress(broadcast_id: int, last_user_id: int, sent: int,
+                            failed: int, blocked: int, status: str | None = None) -> None:
+    from datetime import datetime
+    values = {
+        Broadcast.last_user_id: last_user_id,
+        Broadcast.sent: sent,
+        Broadcast.failed: failed,
+        Broadcast.blocked: blocked,
+    }
+    if status:
+        values[Broadcast.status] = status
+        if status != "running":
+            values[Broadcast.finished_at] = datetime.utcnow()
+    with get_db() as db:
+        # не перетираем cancelled, выставленный командой остановки
+        db.query(Broadcast).filter(
+            Broadcast.id == broadcast_id,
+            Broadcast.status == "running"
+        ).update(values, synchronize_session=False)
+        db.commit()
+
+
+def cancel_broadcast(broadcast_id: int) -> bool:
+    from datetime import datetime
+    with get_db() as db:
+        n = db.query(Broadcast).filter(
+            Broadcast.id == broadcast_id,
+            Broadcast.tenant == current_tenant(),
+            Broadcast.status == "running"
+        ).update({Broadcast.status: "cancelled", Broadcast.finished_at: datetime.utcnow()},
+                 synchronize_session=False)
+        db.commit()
+        return n > 0
+
+
+
+# ---------------- Служебное состояние ----------------
+
+def get_state(key: str) -> str | None:
+    with get_db() as db:
+        row = db.get(BotState, key)
+        return row.value if row else None
+
+
+def set_state(key: str, value: str) -> None:
+    with get_db() as db:
+        row = db.get(BotState, key)
+        if row:
+            row.value = value
+        else:
+            db.add(BotState(key=key, value=value))
+        db.commit()
+
+
+
+# ---------------- Серии (streaks) ----------------
+
+def get_user_id_by_telegram_id(telegram_id: int, tenant: str = None) -> int | None:
+    with get_db() as db:
+        row = db.query(User.id).filter(
+            User.tenant == (tenant or current_tenant()), User.telegram_id == telegram_id
+        ).first()
+        return row[0] if row else None
+
+
+def get_streak(user_id: int) -> dict:
+    with get_db() as db:
+        row = db.query(User.current_streak, User.best_streak, User.last_evaluated_date)\
+                .filter(User.id == user_id).first()
+    if not row:
+        return {"current": 0, "best": 0, "last_evaluated_date": None}
+    return {"current": row[0] or 0, "best": row[1] or 0, "last_evaluated_date": row[2]}
+
+
+def get_user_timezones() -> list[str | None]:
+    """Различные users.timezone (None — зона по умолчанию)."""
+    with get_db() as db:
+        return [tz for (tz,) in db.query(User.timezone).distinct()]
+
+
+def get_streak_states(after_id: int, limit: int, up_to=None, user_ids: list[int] = None,
+                      up_to_by_tz: dict | None = None):
+    """
+    Keyset-страница пользователей, которым нужно досчитать серию:
+    [(id, current, best, last_evaluated_date, created_at, timezone), ...].
+    up_to — пропускать тех, у кого last_evaluated_date >= up_to;
+    up_to_by_tz — то же с границей по users.timezone ({зона: дата}).
+    """
+    def not_closed(day):
+        return User.last_evaluated_date.is_(None) | (User.last_evaluated_date < day)
+
+    with get_db() as db:
+        q = db.query(User.id, User.current_streak, User.best_streak,
+                     User.last_evaluated_date, User.created_at, User.timezone)\
+              .filter(User.id > after_id)
+        if up_to is not None:
+            q = q.filter(not_closed(up_to))
+        if up_to_by_tz:
+            q = q.filter(or_(*(
+                (User.timezone.is_(None) if tz is None else User.timezone == tz) & not_closed(day)
+                for tz, day in up_to_by_tz.items()
+            )))
+        if user_ids is not None:
+            q = q.filter(User.id.in_(user_ids))
+        return [tuple(r) for r in q.order_by(User.id.asc()).limit(limit).all()]
+
+
+def get_plan_rows_for_users(user_ids: list[int]) -> dict[int, list[PlanRow]]:
+    out: dict[int, list[PlanRow]] = {uid: [] for uid in user_ids}
+    if not user_ids:
+        return out
+    with get_db() as db:
+        rows = db.query(Reminder.user_id, Reminder.reminder_type, Reminder.days).filter(
+            Reminder.user_id.in_(user_ids),
+            Reminder.is_active == True
+        ).all()
+    for user_id, reminder_type, days in rows:
+        out[user_id].append(PlanRow(reminder_type, days))
+    return out
+
+
+def get_done_times(user_ids: list[int], start_utc, end_utc) -> list[tuple[int, object]]:
+    """[(user_id, completed_at)] за [start, end) — только две колонки."""
+    if not user_ids:
+        return []
+    with get_db() as db:
+        return [tuple(r) for r in db.query(CompletedWorkout.user_id, CompletedWorkout.completed_at).filter(
+            CompletedWorkout.user_id.in_(user_ids),
+            CompletedWorkout.completed_at >= start_utc,
+            CompletedWorkout.completed_at < end_utc
+        ).all()]
+
+
+def save_streaks(states: list[dict]) -> None:
+    """[{id, current_streak, best_streak, last_evaluated_date}] одним executemany."""
+    if not states:
+        return
+    with get_db() as db:
+        db.execute(update(User), states)
+        db.commit()
+
+
+def reset_streaks(user_ids: list[int] = None) -> None:
+    with get_db() as db:
+        q = db.query(User)
+        if user_ids is not None:
+            q = q.filter(User.id.in_(user_ids))
+        q.update({User.current_streak: 0, User.best_streak: 0, User.last_evaluated_date: None},
+                 synchronize_session=False)
+        db.commit()
+
+
+
+# ---------------- Челленджи ----------------
+
+def _challenge_dict(c: Challenge) -> dict:
+    return {
+        "id": c.id, "code": c.code, "title": c.title,
+        "start_date": c.start_date, "end_date": c.end_date,
+        "planned_through": c.planned_through, "created_by": c.created_by,
+    }
+
+
+def create_challenge(code: str, title: str, start_date, end_date, created_by: int) -> int:
+    from datetime import timedelta
+    with get_db() as db:
+        c = Challenge(code=code, title=title, start_date=start_date, end_date=end_date,
+                      planned_through=start_date - timedelta(days=1), created_by=created_by)
+        db.add(c)
+        db.commit()
+        return c.id
+
+
+def get_challenge(challenge_id: int = None, code: str = None, tenant: str = None) -> dict | None:
+    """По id или коду; с tenant — только челленджи, созданные у этого бота."""
+    with get_db() as db:
+        q = db.query(Challenge)
+        q = q.filter(Challenge.id == challenge_id) if challenge_id is not None \
+            else q.filter(Challenge.code == code)
+        if tenant:
+            q = q.join(User, User.id == Challenge.created_by).filter(User.tenant == tenant)
+        c = q.first()
+        return _challenge_dict(c) if c else None
+
+
+def get_user_challenges(user_id: int, day=None) -> list[dict]:
+    """Челленджи пользователя (новые первыми); day — только идущие в этот день."""
+    with get_db() as db:
+        q = db.query(Challenge).join(ChallengeMember, ChallengeMember.challenge_id == Challenge.id)\
+              .filter(ChallengeMember.user_id == user_id)
+        if day is not None:
+            q = q.filter(Challenge.start_date <= day, Challenge.end_date >= day)
+        return [_challenge_dict(c) for c in q.order_by(Challenge.id.desc()).all()]
+
+
+def add_challenge_member(challenge_id: int, user_id: int, planned: int = 0) -> bool:
+    """False — уже участвует."""
+    with get_db() as db:
+        exists = db.query(ChallengeMember.id).filter(
+            ChallengeMember.challenge_id == challenge_id,
+            ChallengeMember.user_id == user_id
+        ).first()
+        if exists:
+            return False
+        db.add(ChallengeMember(challenge_id=challenge_id, user_id=user_id, planned=planned))
+        db.commit()
+        return True
+
+
+def get_member_rows(user_id: int, day) -> list[tuple[int, int, int, int]]:
+    """[(member_id, challenge_id, done, planned)] по челленджам, идущим в day."""
+    with get_db() as db:
+        return [tuple(r) for r in db.query(
+            ChallengeMember.id, ChallengeMember.challenge_id,
+            ChallengeMember.done, ChallengeMember.planned
+        ).join(Challenge, Challenge.id == ChallengeMember.challenge_id).filter(
+            ChallengeMember.user_id == user_id,
+            Challenge.start_date <= day,
+            Challenge.end_date >= day
+        ).all()]
+
+
+def get_challenge_member_chunk(challenge_id: int, after_id: int, limit: int) -> list[tuple]:
+    """Keyset-страница участников: [(member_id, user_id, done, planned)]."""
+    with get_db() as db:
+        return [tuple(r) for r in db.query(
+            ChallengeMember.id, ChallengeMember.user_id,
+            ChallengeMember.done, ChallengeMember.planned
+        ).filter(
+            ChallengeMember.challenge_id == challenge_id,
+            ChallengeMember.id > after_id
+        ).order_by(ChallengeMember.id.asc()).limit(limit).all()]
+
+
+def save_challenge_members(rows: list[dict]) -> None:
+    """[{id, done, planned, score}] одним executemany."""
+    if not rows:
+        return
+    with get_db() as db:
+        db.execute(update(ChallengeMember), rows)
+        db.commit()
+
+
+def get_challenges_to_plan(day, challenge_id: int = None) -> list[dict]:
+    """Идущие челленджи (или один challenge_id), в которые план участников ещё не добавлен по day."""
+    with get_db() as db:
+        q = db.query(Challenge).filter(
+            Challenge.start_date <= day,
+            Challenge.planned_through < day,
+            Challenge.planned_through < Challenge.end_date
+        )
+        if challenge_id is not None:
+            q = q.filter(Challenge.id == challenge_id)
+        return [_challenge_dict(c) for c in q.all()]
+
+
+def set_challenge_planned_through(challenge_id: int, day) -> None:
+    with get_db() as db:
+        db.query(Challenge).filter(Challenge.id == challenge_id).update(
+            {Challenge.planned_through: day}, synchronize_session=False
+        )
+        db.commit()
+
+
+def get_challenge_scores(challenge_id: int) -> list[tuple[int, int, int]]:
+    """[(user_id, score, done)] всех участников — для таблицы в памяти."""
+    with get_db() as db:
+        return [tuple(r) for r in db.query(
+            ChallengeMember.user_id, ChallengeMember.score, ChallengeMember.done
+        ).filter(ChallengeMember.challenge_id == challenge_id).all()]
+
+
+def get_challenge_top(challenge_id: int, limit: int = 10) -> list[tuple]:
+    """[(user_id, имя, done, planned, score)] — первые места по индексу (challenge_id, score)."""
+    with get_db() as db:
+        return [tuple(r) for r in db.query(
+            ChallengeMember.user_id,
+            func.coalesce(User.first_name, User.username),
+            ChallengeMember.done, ChallengeMember.planned, ChallengeMember.score
+        ).join(User, User.id == ChallengeMember.user_id).filter(
+            ChallengeMember.challenge_id == challenge_id
+        ).order_by(
+            ChallengeMember.score.desc(), ChallengeMember.done.desc(), ChallengeMember.user_id.asc()
+        ).limit(limit).all()]
+
+
+
+# ---------------- Поиск ----------------
+
+def search_history(user_id: int, match: str, limit: int, offset: int = 0) -> list[dict]:
+    """
+    Поиск по FTS-индексу, лучшие (bm25) первыми. match — уже собранное
+    FTS5-выражение для колонки body. Возвращает limit+1 строк, чтобы
+    вызывающий понял, есть ли следующая страница.
+    """
+    with get_db() as db:
+        hits = db.execute(sql_text(
+            "SELECT rowid, snippet(search_index, 0, '«', '»', '…', 12) "
+            "FROM search_index WHERE search_index MATCH :q "
+            "ORDER BY bm25(search_index, 1.0, 0.0), rowid DESC LIMIT :limit OFFSET :offset"
+        ), {"q": f"owner:u{user_id} AND body:({match})", "limit": limit + 1, "offset": offset}).all()
+
+        reminder_ids = [rowid // 2 for rowid, _ in hits if rowid % 2 == 0]
+        done_ids = [rowid // 2 for rowid, _ in hits if rowid % 2 == 1]
+        reminders = {r[0]: r for r in db.query(
+            Reminder.id, Reminder.reminder_type, Reminder.time, Reminder.days, Reminder.is_active
+        ).filter(Reminder.id.in_(reminder_ids)).all()} if reminder_ids else {}
+        completed = dict(db.query(CompletedWorkout.id, CompletedWorkout.completed_at)
+                         .filter(CompletedWorkout.id.in_(done_ids)).all()) if done_ids else {}
+
+    out = []
+    for rowid, snippet in hits:
+        ref_id = rowid // 2
+        if rowid % 2 == 0 and ref_id in reminders:
+            _, reminder_type, time, days, is_active = reminders[ref_id]
+            out.append({"kind": "reminder", "id": ref_id, "snippet": snippet,
+                        "reminder_type": reminder_type, "time": time, "days": days,
+                        "is_active": bool(is_active)})
+        elif rowid % 2 == 1 and ref_id in completed:
+            out.append({"kind": "done", "id": ref_id, "snippet": snippet,
+                        "completed_at": completed[ref_id]})
+    return out
+
+
+
+# ---------------- Журнал упражнений ----------------
+
+def add_workout_logs(user_id: int, entries: list[LogEntry], week_start,
+                     completed_id: int = None) -> list[tuple[str, str, float]]:
+    """
+    Записать упражнения и в той же транзакции обновить exercise_stats и
+    exercise_weeks. Возвращает новые рекорды: [(exercise, 'weight'|'reps'|'volume', value)].
+    """
+    from datetime import datetime
+
+    now = datetime.utcnow()
+    names = sorted({e.exercise for e in entries})
+    records = []
+    with get_db() as db:
+        stats = {s.exercise: s for s in db.query(ExerciseStats).filter(
+            ExerciseStats.user_id == user_id, ExerciseStats.exercise.in_(names))}
+        weeks = {w.exercise: w for w in db.query(ExerciseWeek).filter(
+            ExerciseWeek.user_id == user_id, ExerciseWeek.exercise.in_(names),
+            ExerciseWeek.week_start == week_start)}
+
+        for e in entries:
+            db.add(WorkoutLog(user_id=user_id, completed_id=completed_id, exercise=e.exercise,
+                              sets=e.sets, reps=e.reps, weight=e.weight, logged_at=now))
+
+            st = stats.get(e.exercise)
+            if st is None:
+                st = stats[e.exercise] = ExerciseStats(user_id=user_id, exercise=e.exercise,
+                                                       entries=0, total_reps=0, total_volume=0)
+                db.add(st)
+            elif st.entries:
+                # рекорд — только если было с чем сравнивать
+                if e.weight and (st.best_weight or 0) < e.weight:
+                    records.append((e.exercise, "weight", e.weight))
+                elif not e.weight and (st.best_reps or 0) < e.reps:
+                    records.append((e.exercise, "reps", e.reps))
+                if e.volume and (st.best_volume or 0) < e.volume:
+                    records.append((e.exercise, "volume", e.volume))
+            st.entries += 1
+            st.total_reps += e.sets * e.reps
+            st.total_volume += e.volume
+            if e.weight and (st.best_weight or 0) < e.weight:
+                st.best_weight, st.best_weight_at = e.weight, now
+            st.best_reps = max(st.best_reps or 0, e.reps)
+            st.best_volume = max(st.best_volume or 0, e.volume)
+            st.last_sets, st.last_reps, st.last_weight, st.last_at = e.sets, e.reps, e.weight, now
+
+            wk = weeks.get(e.exercise)
+            if wk is None:
+                wk = weeks[e.exercise] = ExerciseWeek(user_id=user_id, exercise=e.exercise,
+                                                      week_start=week_start, sets=0, reps=0, volume=0)
+                db.add(wk)
+            wk.sets += e.sets
+            wk.reps += e.sets * e.reps
+            wk.volume += e.volume
+        db.commit()
+    return records
+
+
+def get_exercise_stats(user_id: int, exercise: str = None, limit: int = 20) -> list[dict]:
+    """Итоги по упражнениям (последние первыми) — готовые строки, без чтения журнала."""
+    with get_db() as db:
+        q = db.query(ExerciseStats).filter(ExerciseStats.user_id == user_id)
+        if exercise is not None:
+            q = q.filter(ExerciseStats.exercise == exercise)
+        return [{
+            "exercise": s.exercise, "entries": s.entries, "total_reps": s.total_reps,
+            "total_volume": s.total_volume, "best_weight": s.best_weight,
+            "best_weight_at": s.best_weight_at, "best_reps": s.best_reps,
+            "best_volume": s.best_volume, "last_sets": s.last_sets, "last_reps": s.last_reps,
+            "last_weight": s.last_weight, "last_at": s.last_at,
+        } for s in q.order_by(ExerciseStats.last_at.desc()).limit(limit).all()]
+
+
+def find_exercises(user_id: int, prefix: str, limit: int = 5) -> list[str]:
+    """Названия упражнений пользователя, начинающиеся с prefix."""
+    with get_db() as db:
+        return [name for (name,) in db.query(ExerciseStats.exercise).filter(
+            ExerciseStats.user_id == user_id,
+            ExerciseStats.exercise.startswith(prefix, autoescape=True)
+        ).order_by(ExerciseStats.exercise).limit(limit).all()]
+
+
+def get_exercise_weeks(user_id: int, exercise: str, since) -> list[tuple]:
+    """[(week_start, sets, reps, volume)] с недели since, по порядку."""
+    with get_db() as db:
+        return [tuple(r) for r in db.query(
+            ExerciseWeek.week_start, ExerciseWeek.sets, ExerciseWeek.reps, ExerciseWeek.volume
+        ).filter(
+            ExerciseWeek.user_id == user_id,
+            ExerciseWeek.exercise == exercise,
+            ExerciseWeek.week_start >= since
+        ).order_by(ExerciseWeek.week_start.asc()).all()]
+
+
+
+# ---------------- Журнал событий и проекции ----------------
+
+def get_events(after_id: int, limit: int) -> list[tuple]:
+    """[(id, type, user_id, reminder_id, at, data)] с id > after_id, по порядку."""
+    with get_db() as db:
+        return [tuple(r) for r in db.query(
+            Event.id, Event.type, Event.user_id, Event.reminder_id, Event.at, Event.data
+        ).filter(Event.id > after_id).order_by(Event.id.asc()).limit(limit).all()]
+
+
+def get_last_event_id() -> int:
+    with get_db() as db:
+        return db.query(func.max(Event.id)).scalar() or 0
+
+
+def get_event_at(event_id: int):
+    """at события с данным id (None — такого нет): проверка, что база та же."""
+    with get_db() as db:
+        return db.query(Event.at).filter(Event.id == event_id).scalar()
+
+
+def get_changes_since(after_id: int, types: tuple[str, ...]) -> list[tuple[int, int]]:
+    """Различные (user_id, reminder_id) из событий данных типов с id > after_id."""
+    with get_db() as db:
+        return [tuple(r) for r in db.query(Event.user_id, Event.reminder_id).filter(
+            Event.id > after_id, Event.type.in_(types)
+        ).distinct().all()]
+
+
+def load_projection_users(user_ids: list[int]) -> tuple[list[dict], dict, dict]:
+    """
+    Состояние проекции для пользователей:
+    (proj_reminders, {user_id: planned_through}, {user_id: timezone}).
+    """
+    if not user_ids:
+        return [], {}, {}
+    with get_db() as db:
+        reminders = [{
+            "reminder_id": r.reminder_id, "user_id": r.user_id, "reminder_type": r.reminder_type,
+            "time": r.time, "days": r.days, "text": r.text, "is_active": r.is_active,
+            "deleted": r.deleted, "created_at": r.created_at,
+        } for r in db.query(ProjReminder).filter(ProjReminder.user_id.in_(user_ids)).all()]
+        through, zones = {}, {}
+        for uid, planned_through, tz in db.query(
+            ProjUser.user_id, ProjUser.planned_through, ProjUser.timezone
+        ).filter(ProjUser.user_id.in_(user_ids)):
+            through[uid] = planned_through
+            zones[uid] = tz
+    return reminders, through, zones
+
+
+def get_proj_users_to_close(after_id: int, limit: int, through) -> list[int]:
+    """Keyset-страница пользователей проекции, которым план начислен раньше through."""
+    with get_db() as db:
+        return [uid for (uid,) in db.query(ProjUser.user_id).filter(
+            ProjUser.user_id > after_id,
+            ProjUser.planned_through < through
+        ).order_by(ProjUser.user_id.asc()).limit(limit).all()]
+
+
+def _add_counters(db: Session, model, date_col: str, deltas: dict) -> None:
+    """deltas {(user_id, date): [planned, sent, done]} прибавить к строкам model (upsert)."""
+    if not deltas:
+        return
+    user_ids = sorted({uid for uid, _ in deltas})
+    dates = [d for _, d in deltas]
+    col = getattr(model, date_col)
+    existing = {}
+    for i in range(0, len(user_ids), 500):
+        for uid, d, planned, sent, done in db.query(
+            model.user_id, col, model.planned, model.sent, model.done
+        ).filter(
+            model.user_id.in_(user_ids[i:i + 500]),
+            col >= min(dates), col <= max(dates)
+        ):
+            if (uid, d) in deltas:
+                existing[(uid, d)] = (planned, sent, done)
+
+    updates, inserts = [], []
+    for (uid, d), (planned, sent, done) in deltas.items():
+        old = existing.get((uid, d))
+        row = {"user_id": uid, date_col: d, "planned": planned, "sent": sent, "done": done}
+        if old:
+            row.update(planned=old[0] + planned, sent=old[1] + sent, done=old[2] + done)
+            updates.append(row)
+        else:
+            inserts.append(row)
+    if updates:
+        db.execute(update(model), updates)
+    if inserts:
+        db.execute(insert(model), inserts)
+
+
+def save_projection(reminders: list[dict], users: dict, daily: dict, weekly: dict,
+                    checkpoint_key: str, checkpoint: int, expected: int) -> bool:
+    """
+    Изменения проекций и новый checkpoint — одной транзакцией.
+    checkpoint двигается, только если в БД всё ещё expected (прочитанный
+    реплеером); иначе его обогнал другой реплеер — ничего не пишем, False.
+    """
+    with get_db() as db:
+        # сначала checkpoint: условный UPDATE берёт блокировку на запись до счётчиков
+        moved = db.execute(
+            update(BotState)
+            .where(BotState.key == checkpoint_key, BotState.value == str(expected))
+            .values(value=str(checkpoint))
+        ).rowcount
+        if not moved and not expected and db.get(BotState, checkpoint_key) is None:
+            # первый проход по пустому журналу проекций (после reset_projections)
+            db.add(BotState(key=checkpoint_key, value=str(checkpoint)))
+            moved = 1
+        if not moved:
+            db.rollback()
+            return False
+
+        if reminders:
+            ids = [r["reminder_id"] for r in reminders]
+            known = {rid for (rid,) in db.query(ProjReminder.reminder_id)
+                     .filter(ProjReminder.reminder_id.in_(ids))}
+            changed = [r for r in reminders if r["reminder_id"] in known]
+            new = [r for r in reminders if r["reminder_id"] not in known]
+            if changed:
+                db.execute(update(ProjReminder), changed)
+            if new:
+                db.execute(insert(ProjReminder), new)
+        if users:
+            known = {uid for (uid,) in db.query(ProjUser.user_id)
+                     .filter(ProjUser.user_id.in_(list(users)))}
+            rows = [{"user_id": uid, "planned_through": d, "timezone": tz}
+                    for uid, (d, tz) in users.items()]
+            if any(r["user_id"] in known for r in rows):
+                db.execute(update(ProjUser), [r for r in rows if r["user_id"] in known])
+            if any(r["user_id"] not in known for r in rows):
+                db.execute(insert(ProjUser), [r for r in rows if r["user_id"] not in known])
+        _add_counters(db, ProjDaily, "day", daily)
+        _add_counters(db, ProjWeekly, "week_start", weekly)
+        db.commit()
+        return True
+
+
+def reset_projections(checkpoint_key: str) -> None:
+    with get_db() as db:
+        for model in (ProjReminder, ProjUser, ProjDaily, ProjWeekly):
+            db.query(model).delete(synchronize_session=False)
+        db.query(BotState).filter(BotState.key == checkpoint_key).delete(synchronize_session=False)
+        db.commit()
+
+
+def get_proj_daily(user_id: int, since) -> list[tuple]:
+    """[(day, planned, sent, done)] из проекции."""
+    with get_db() as db:
+        return [tuple(r) for r in db.query(
+            ProjDaily.day, ProjDaily.planned, ProjDaily.sent, ProjDaily.done
+        ).filter(ProjDaily.user_id == user_id, ProjDaily.day >= since)
+         .order_by(ProjDaily.day.asc()).all()]
+
+
+# ---------------- Outbox (отдельный отправщик) ----------------
+
+def enqueue_reminder_message(chat_id: int, text: str, reply_markup: str | None,
+                             reminder_ids: list[int], deactivate_ids: list[int] = (),
+                             tenant: str = None) -> int:
+    """
+    Поставить сообщение с напоминаниями в outbox. Разовые деактивируются в той же
+    транзакции; события reminder_sent пишет отправщик после доставки.
+    """
+    with get_db() as db:
+        msg = OutboxMessage(tenant=tenant or current_tenant(), chat_id=chat_id, text=text,
+                            reply_markup=reply_markup,
+                            reminder_ids=json.dumps(list(reminder_ids)))
+        db.add(msg)
+        if deactivate_ids:
+            off = db.query(Reminder.id, Reminder.user_id).filter(
+                Reminder.id.in_(list(deactivate_ids)),
+                Reminder.is_active == True
+            ).all()
+            if off:
+                db.query(Reminder).filter(Reminder.id.in_([rid for rid, _ in off])).update(
+                    {Reminder.is_active: False}, synchronize_session=False
+                )
+                _append_events(db, [_event("reminder_deactivated", uid, rid) for rid, uid in off])
+        db.commit()
+        return msg.id
+
+
+def claim_outbox(owner: str, limit: int, lease_seconds: float) -> list[dict]:
+    """
+    Взять в аренду до limit готовых к отправке сообщений. Просроченная аренда
+    (отправщик упал) снова доступна. Условия повторены во внешнем WHERE, чтобы
+    две конкурирующие транзакции не взяли одну строку.
+    """
+    from datetime import datetime, timedelta
+
+    now = datetime.utcnow()
+    until = now + timedelta(seconds=lease_seconds)
+    ready = (
+        (OutboxMessage.status == "pending")
+        & (OutboxMessage.available_at <= now)
+        & (OutboxMessage.lease_until.is_(None) | (OutboxMessage.lease_until < now))
+    )
+    with get_db() as db:
+        ids = [i for (i,) in db.query(OutboxMessage.id).filter(ready)
+               .order_by(OutboxMessage.id.asc()).limit(limit).all()]
+        if not ids:
+            return []
+        db.query(OutboxMessage).filter(OutboxMessage.id.in_(ids), ready).update({
+            OutboxMessage.lease_owner: owner,
+            OutboxMessage.lease_until: until,
+            OutboxMessage.attempts: OutboxMessage.attempts + 1,
+        }, synchronize_session=False)
+        db.commit()
+        rows = db.query(
+            OutboxMessage.id, OutboxMessage.chat_id, OutboxMessage.text,
+            OutboxMessage.reply_markup, OutboxMessage.attempts, OutboxMessage.tenant
+        ).filter(
+            OutboxMessage.id.in_(ids),
+            OutboxMessage.lease_owner == owner,
+            OutboxMessage.lease_until == until
+        ).order_by(OutboxMessage.id.asc()).all()
+        return [{"id": r[0], "chat_id": r[1], "text": r[2], "reply_markup": r[3], "attempts": r[4],
+                 "tenant": r[5]} for r in rows]
+
+
+def complete_outbox(owner: str, sent: list[int], retry: dict | None = None,
+                    dead: dict | None = None) -> None:
+    """
+    Итог пачки одной транзакцией: sent — доставлены (+ события reminder_sent),
+    retry {id: available_at} — повторить позже, dead {id: (status, error)} — больше не пытаться.
+    Строки, аренду которых уже перехватил другой отправщик, не трогаем.
+    """
+    from datetime import datetime
+
+    retry, dead = retry or {}, dead or {}
+    now = datetime.utcnow()
+    mine = OutboxMessage.lease_owner == owner
+    with get_db() as db:
+        if sent:
+            db.query(OutboxMessage).filter(OutboxMessage.id.in_(sent), mine).update({
+                OutboxMessage.status: "sent", OutboxMessage.sent_at: now,
+                OutboxMessage.lease_owner: None, OutboxMessage.lease_until: None,
+            }, synchronize_session=False)
+            reminder_ids = []
+            for (raw,) in db.query(OutboxMessage.reminder_ids).filter(OutboxMessage.id.in_(sent)):
+                reminder_ids += json.loads(raw) if raw else []
+            if reminder_ids:
+                owners = dict(db.query(Reminder.id, Reminder.user_id)
+                              .filter(Reminder.id.in_(set(reminder_ids))).all())
+                _append_events(db, [_event("reminder_sent", owners[rid], rid)
+                                    for rid in reminder_ids if rid in owners])
+        for msg_id, available_at in retry.items():
+            db.query(OutboxMessage).filter(OutboxMessage.id == msg_id, mine).update({
+                OutboxMessage.available_at: available_at,
+                OutboxMessage.lease_owner: None, OutboxMessage.lease_until: None,
+            }, synchronize_session=False)
+        for msg_id, (status, error) in dead.items():
+            db.query(OutboxMessage).filter(OutboxMessage.id == msg_id, mine).update({
+                OutboxMessage.status: status, OutboxMessage.error: error,
+                OutboxMessage.lease_owner: None, OutboxMessage.lease_until: None,
+            }, synchronize_session=False)
+        db.commit()
+
+
+def deactivate_users_by_telegram_id(telegram_ids: list[int], tenant: str = None) -> None:
+    if not telegram_ids:
+        return
+    with get_db() as db:
+        ids = [uid for (uid,) in db.query(User.id).filter(
+            User.tenant == (tenant or current_tenant()), User.telegram_id.in_(telegram_ids)
+        )]
+    deactivate_users(ids)
+
+
+def purge_outbox(before) -> int:
+    """Удалить доставленные и окончательно неудачные сообщения старше before."""
+    with get_db() as db:
+        n = db.query(OutboxMessage).filter(
+            OutboxMessage.status != "pending",
+            OutboxMessage.created_at < before
+        ).delete(synchronize_session=False)
+        db.commit()
+        return n
+
+
+def get_outbox_stats() -> dict:
+    """{status: count} и возраст самого старого ожидающего сообщения в секундах."""
+    from datetime import datetime
+
+    with get_db() as db:
+        counts = dict(db.query(OutboxMessage.status, func.count(OutboxMessage.id))
+                      .group_by(OutboxMessage.status).all())
+        oldest = db.query(func.min(OutboxMessage.created_at)).filter(
+            OutboxMessage.status == "pending"
+        ).scalar()
+    counts["oldest_pending_s"] = (datetime.utcnow() - oldest).total_seconds() if oldest else 0.0
+    return counts
+
+
+# ---------------- Экспорт ----------------
+#
+# Генераторы читают строки порциями (yield_per + stream_results): в памяти
+# не больше одной порции, сколько бы лет истории ни было у пользователя.
+# Сессия открыта, пока генератор не дочитан или не закрыт.
+
+def _stream(stmt, chunk: int):
+    with get_db() as db:
+        result = db.execute(stmt.execution_options(yield_per=chunk, stream_results=True))
+        for row in result:
+            yield tuple(row)
+
+
+def iter_completed_workouts(user_id: int | None = None, chunk: int = 1000):
+    """(telegram_id, completed_at, text, reminder_id) по порядку выполнения."""
+    stmt = select(User.telegram_id, CompletedWorkout.completed_at, CompletedWorkout.text_id,
+                  CompletedWorkout.reminder_id).join(User, User.id == CompletedWorkout.user_id)
+    if user_id is not None:
+        stmt = stmt.where(CompletedWorkout.user_id == user_id).order_by(CompletedWorkout.completed_at)
+    else:
+        stmt = stmt.order_by(CompletedWorkout.id)
+    batch = []
+    for row in _stream(stmt, chunk):
+        batch.append(row)
+        if len(batch) >= chunk:
+            yield from _with_texts(batch, 2)
+            batch = []
+    yield from _with_texts(batch, 2)
+
+
+def _with_texts(rows: list[tuple], col: int) -> list[tuple]:
+    """text_id в колонке col -> текст (словарь почти весь в кеше, в БД — только промахи)."""
+    with get_db() as db:
+        texts = texts_by_id(db, [row[col] for row in rows])
+    return [row[:col] + (texts.get(row[col]),) + row[col + 1:] for row in rows]
+
+
+def iter_workout_logs(user_id: int | None = None, chunk: int = 1000):
+    """(telegram_id, logged_at, exercise, sets, reps, weight)."""
+    stmt = select(User.telegram_id, WorkoutLog.logged_at, WorkoutLog.exercise, WorkoutLog.sets,
+                  WorkoutLog.reps, WorkoutLog.weight).join(User, User.id == WorkoutLog.user_id)
+    if user_id is not None:
+        stmt = stmt.where(WorkoutLog.user_id == user_id)
+    return _stream(stmt.order_by(WorkoutLog.id), chunk)
+
+
+def iter_weekly_summaries(user_id: int | None = None, chunk: int = 1000):
+    """(telegram_id, week_start, done_total, planned_total)."""
+    stmt = select(User.telegram_id, WeeklySummary.week_start, WeeklySummary.done_total,
+                  WeeklySummary.planned_total).join(User, User.id == WeeklySummary.user_id)
+    if user_id is not None:
+        stmt = stmt.where(WeeklySummary.user_id == user_id)
+    return _stream(stmt.order_by(WeeklySummary.id), chunk)
+
+
+# ---------------- Прогноз нагрузки ----------------
+
+def get_recurring_groups() -> list[tuple]:
+    """[(timezone, time, reminder_type, days, count)] активных повторяющихся — один GROUP BY."""
+    with get_db() as db:
+        return [tuple(r) for r in db.query(
+            User.timezone, Reminder.time, Reminder.reminder_type, Reminder.days, func.count(Reminder.id)
+        ).join(User, User.id == Reminder.user_id).filter(
+            Reminder.is_active == True,
+            Reminder.reminder_type.in_(("everyday", "days"))
+        ).group_by(User.timezone, Reminder.time, Reminder.reminder_type, Reminder.days).all()]
+
+
+def count_once_by_fire_at(from_utc, until_utc) -> list[tuple]:
+    """[(fire_at, count)] активных разовых в [from, until) — по индексу fire_at."""
+    with get_db() as db:
+        return [tuple(r) for r in db.query(Reminder.fire_at, func.count(Reminder.id)).filter(
+            Reminder.reminder_type == "once",
+            Reminder.is_active == True,
+            Reminder.fire_at >= from_utc,
+            Reminder.fire_at < until_utc
+        ).group_by(Reminder.fire_at).all()]
@@ -0,0 +1,73 @@
+"""
+Отправка сообщений через общий лимит Telegram.
+
+Все массовые рассылки (broadcast, дайджесты) идут через RateLimitedSender:
+он держит глобальный rate limit, ограничивает число одновременных запросов,
+ждёт и повторяет на 429 и сообщает, что пользователь заблокировал бота.
+admit — корутина, которую ждут перед каждой отправкой (уступить напоминаниям,
+см. loadplan.LoadPlanner.admit).
+"""
+from enum import Enum
+from typing import Awaitable, Callable
+import asyncio
+import logging
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest, TelegramNetworkError
+)
+
+from .ratelimit import AsyncRateLimiter
+
+logger = logging.getLogger(__name__)
+
+
+class DeliveryResult(str, Enum):
+    OK = "ok"
+    BLOCKED = "blocked"   # бот заблокирован / чат недоступен — пользователя можно деактивировать
+    FAILED = "failed"
+
+
+class RateLimitedSender:
+    def __init__(self, bot: Bot, rate: float, concurrency: int, max_retries: int = 3,
+                 admit: Callable[[], Awaitable[None]] | None = None):
+        self.bot = bot
+        self.admit = admit
+        self.limiter = AsyncRateLimiter(rate, burst=max(1.0, rate))
+        self._sem = asyncio.Semaphore(concurrency)
+        self.max_retries = max_retries
+        self.sent = 0
+        self.failed = 0
+        self.blocked = 0
+
+    async def send(self, chat_id: int, text: str, **kwargs) -> DeliveryResult:
+        if self.admit:
+            await self.admit()
+        async with self._sem:
+            for attempt in range(self.max_retries + 1):
+                await self.limiter.acquire()
+                try:
+                    await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                    self.sent += 1
+                    return DeliveryResult.OK
+                except TelegramRetryAfter as e:
+                    # 429: притормаживаем всех, не только этот запрос
+                    logger.warning(f"Flood control, retry after {e.retry_after}s")
+                    self.limiter.pause(e.retry_after)
+                except TelegramForbiddenError:
+                    self.blocked += 1
+                    return DeliveryResult.BLOCKED
+                except TelegramBadRequest as e:
+                    if "chat not found" in str(e).lower():
+                        self.blocked += 1
+                        return DeliveryResult.BLOCKED
+                    logger.error(f"Failed to send to {chat_id}: {e}")
+                    break
+                except TelegramNetworkError as e:
+                    logger.warning(f"Network error sending to {chat_id} (attempt {attempt + 1}): {e}")
+                    await asyncio.sleep(min(2 ** attempt, 10))
+                except Exception as e:
+                    logger.error(f"Failed to send to {chat_id}: {e}")
+                    break
+            self.failed += 1
+            return DeliveryResult.FAILED
@@ -0,0 +1,154 @@
+"""
+Выгрузка истории: /export у пользователя и CLI для всех.
+
+Строки идут потоком из генераторов db.iter_* (yield_per) прямо в файл — в
+памяти держится одна порция строк, а не вся история. Форматы: CSV (все
+виды записей в одной таблице, колонка kind) или JSON Lines; к любому можно
+добавить gzip.
+
+    python -m src.export --format jsonl --gzip -o export.jsonl.gz
+    python -m src.export --user 123456789 --format csv
+"""
+from datetime import datetime
+from typing import Iterator
+import argparse
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import pytz
+
+from .db import iter_completed_workouts, iter_workout_logs, iter_weekly_summaries
+from .timezones import get_tz
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "jsonl")
+FIELDS = ["kind", "telegram_id", "at", "text", "reminder_id",
+          "exercise", "sets", "reps", "weight", "done", "planned"]
+CHUNK = 1000
+BUFFER = 1024 * 1024
+MAX_DOCUMENT_BYTES = 50 * 1024 * 1024   # лимит Bot API на отправку файла
+
+
+def iter_rows(user_id: int | None = None, tz_str: str | None = None,
+              chunk: int = CHUNK) -> Iterator[dict]:
+    """Все записи пользователя (или всех): выполнения, журнал подходов, недели."""
+    tz = get_tz(tz_str)
+
+    def local(at: datetime | None) -> str:
+        return pytz.utc.localize(at).astimezone(tz).isoformat(timespec="seconds") if at else ""
+
+    for tg_id, at, text, reminder_id in iter_completed_workouts(user_id, chunk):
+        yield {"kind": "workout", "telegram_id": tg_id, "at": local(at), "text": text or "",
+               "reminder_id": reminder_id}
+    for tg_id, at, exercise, sets, reps, weight in iter_workout_logs(user_id, chunk):
+        yield {"kind": "log", "telegram_id": tg_id, "at": local(at), "exercise": exercise,
+               "sets": sets, "reps": reps, "weight": weight}
+    for tg_id, week_start, done, planned in iter_weekly_summaries(user_id, chunk):
+        yield {"kind": "week", "telegram_id": tg_id, "at": local(week_start)[:10],
+               "done": done, "planned": planned}
+
+
+def write_rows(fileobj, rows: Iterator[dict], fmt: str, with_user: bool = True) -> int:
+    """Записать строки в текстовый файл. Возвращает их число."""
+    fields = FIELDS if with_user else [f for f in FIELDS if f != "telegram_id"]
+    n = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(fileobj, fieldnames=fields, restval="", extrasaction="ignore")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            n += 1
+    elif fmt == "jsonl":
+        for row in rows:
+            if not with_user:
+                row.pop("telegram_id", None)
+            fileobj.write(json.dumps({k: v for k, v in row.items() if v is not None},
+                                     ensure_ascii=False))
+            fileobj.write("\n")
+            n += 1
+    else:
+        raise ValueError(f"формат: {', '.join(FORMATS)}")
+    return n
+
+
+def export_to(path: str, user_id: int | None = None, fmt: str = "csv", compress: bool = False,
+              tz_str: str | None = None, with_user: bool = True) -> int:
+    """Выгрузка в файл path (gzip, если compress). Возвращает число строк."""
+    raw = gzip.open(path, "wb", compresslevel=6) if compress else open(path, "wb")
+    with raw, io.TextIOWrapper(io.BufferedWriter(raw, BUFFER), encoding="utf-8", newline="") as f:
+        # utf-8-sig для CSV: Excel иначе показывает кириллицу кракозябрами
+        if fmt == "csv":
+            f.write("\ufeff")
+        return write_rows(f, iter_rows(user_id, tz_str), fmt, with_user)
+
+
+def export_user(user_id: int, fmt: str = "csv", compress: bool = False,
+                tz_str: str | None = None) -> tuple[str, str, int]:
+    """Выгрузка пользователя во временный файл: (путь, имя файла, строк). Файл удаляет вызывающий."""
+    name = f"workouts-{datetime.now().strftime('%Y%m%d')}.{fmt}" + (".gz" if compress else "")
+    fd, path = tempfile.mkstemp(prefix="export-", suffix="-" + name)
+    os.close(fd)
+    try:
+        n = export_to(path, user_id, fmt, compress, tz_str, with_user=False)
+    except Exception:
+        os.unlink(path)
+        raise
+    return path, name, n
+
+
+def parse_args(tokens: list[str]) -> tuple[str, bool]:
+    """'/export json gz' -> ('jsonl', True). Бросает ValueError."""
+    fmt, compress = "csv", False
+    for t in (t.lower() for t in tokens):
+        if t == "csv":
+            fmt = "csv"
+        elif t in ("json", "jsonl"):
+            fmt = "jsonl"
+        elif t in ("gz", "gzip", "zip"):
+            compress = True
+        else:
+            raise ValueError(f"не понимаю «{t}»")
+    return fmt, compress
+
+
+def main(argv: list[str] | None = None) -> int:
+    from .config import DEFAULT_TENANT
+    from .db import init_db, get_user_id_by_telegram_id
+
+    parser = argparse.ArgumentParser(description="Export workout history")
+    parser.add_argument("--user", type=int, help="telegram id (default: all users)")
+    parser.add_argument("--tenant", default=DEFAULT_TENANT, help="bot name from BOT_TOKENS")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--tz", default="UTC", help="timezone for timestamps (default UTC)")
+    parser.add_argument("-o", "--output", help="output file (default: export.<format>[.gz])")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    init_db()
+
+    user_id = None
+    if args.user is not None:
+        user_id = get_user_id_by_telegram_id(args.user, tenant=args.tenant)
+        if user_id is None:
+            print(f"Пользователь {args.user} не найден")
+            return 1
+    output = args.output or f"export.{args.format}" + (".gz" if args.gzip else "")
+
+    started = time.perf_counter()
+    n = export_to(output, user_id, args.format, args.gzip, args.tz)
+    elapsed = time.perf_counter() - started
+    print(f"{output}: {n} строк, {os.path.getsize(output) / 1024 / 1024:.1f} МБ за {elapsed:.1f} с")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
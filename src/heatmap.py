@@ -0,0 +1,228 @@
+"""
+Календарь тренировок за год картинкой (/heatmap), как у GitHub.
+
+Данные — один агрегат по completed_workouts (db.get_done_by_day: число
+выполнений по локальным дням) и план по текущим напоминаниям, начиная с
+дня регистрации. PNG рисуется на чистом Python (zlib + struct, без Pillow):
+53 недели × 7 дней — это около тысячи прямоугольников, картинка собирается
+за миллисекунды.
+
+Картинки кешируются по хешу дневных счётчиков: одинаковый календарь (в том
+числе у разных пользователей, например пустой) второй раз не рисуется и не
+загружается — в Telegram уходит сохранённый file_id. Кеш — LRU на
+HEATMAP_CACHE_SIZE записей в памяти процесса.
+
+    python -m src.heatmap --user 123456789 -o heatmap.png
+"""
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+import argparse
+import hashlib
+import logging
+import math
+import struct
+import sys
+import zlib
+
+import pytz
+
+from .config import HEATMAP_CACHE_SIZE
+from .db import get_done_by_day, get_plan_rows_for_users, _planned_from_rows
+from .timezones import get_tz, local_today
+
+logger = logging.getLogger(__name__)
+
+WEEKS = 53
+CELL = 14
+GAP = 3
+MARGIN = 12
+SCALE = 2                       # пиксель шрифта цифр
+LABEL_HEIGHT = 5 * SCALE + 6
+RENDER_VERSION = b"heatmap-1"   # сменить при изменении картинки — старый кеш не подойдёт
+
+BACKGROUND = (255, 255, 255)
+TEXT = (87, 96, 106)
+EMPTY = (235, 237, 240)
+MISSED = (246, 214, 214)
+LEVELS = [(155, 233, 168), (64, 196, 99), (48, 161, 78), (33, 110, 57)]
+
+# цифры 3×5 для номеров месяцев
+DIGITS = {
+    "0": ("111", "101", "101", "101", "111"), "1": ("010", "110", "010", "010", "111"),
+    "2": ("111", "001", "111", "100", "111"), "3": ("111", "001", "111", "001", "111"),
+    "4": ("101", "101", "111", "001", "001"), "5": ("111", "100", "111", "001", "111"),
+    "6": ("111", "100", "111", "101", "111"), "7": ("111", "001", "010", "010", "010"),
+    "8": ("111", "101", "111", "101", "111"), "9": ("111", "101", "111", "001", "111"),
+}
+
+
+# ---------- данные ----------
+
+def year_counts(user_id: int, tz_str: str | None = None, registered: datetime | None = None,
+                today: date | None = None) -> tuple[date, list[tuple[int, int]]]:
+    """
+    (понедельник первой недели, [(выполнено, план), ...] по дням до сегодня).
+    План — по текущим напоминаниям и только с дня регистрации.
+    """
+    tz = get_tz(tz_str)
+    today = today or local_today(tz_str)
+    start = today - timedelta(days=today.weekday() + 7 * (WEEKS - 1))
+    first = tz.localize(datetime(start.year, start.month, start.day))
+    nxt = today + timedelta(days=1)
+    last = tz.localize(datetime(nxt.year, nxt.month, nxt.day))
+
+    done = get_done_by_day(user_id, first.astimezone(pytz.utc).replace(tzinfo=None),
+                           last.astimezone(pytz.utc).replace(tzinfo=None), tz)
+    plan = get_plan_rows_for_users([user_id])[user_id]
+    since = pytz.utc.localize(registered).astimezone(tz).date() if registered else start
+
+    counts = []
+    for i in range((today - start).days + 1):
+        d = start + timedelta(days=i)
+        counts.append((done.get(d, 0), _planned_from_rows(plan, d) if d >= since else 0))
+    return start, counts
+
+
+def digest(start: date, counts: list[tuple[int, int]]) -> str:
+    """Ключ кеша: от дат (подписи месяцев) и дневных счётчиков."""
+    h = hashlib.sha256(RENDER_VERSION)
+    h.update(start.isoformat().encode())
+    h.update(struct.pack(f"<{2 * len(counts)}I", *(n for pair in counts for n in pair)))
+    return h.hexdigest()
+
+
+def level(done: int, planned: int) -> tuple[int, int, int]:
+    if not done:
+        return MISSED if planned else EMPTY
+    ratio = done / planned if planned else 1.0
+    return LEVELS[min(3, math.ceil(4 * ratio) - 1)]
+
+
+def caption(counts: list[tuple[int, int]]) -> str:
+    total = sum(d for d, _ in counts)
+    active = sum(1 for d, _ in counts if d)
+    planned_days = [(d, p) for d, p in counts if p]
+    text = f"🗓 За год: {total} тренировок, активных дней {active}"
+    if planned_days:
+        hit = sum(1 for d, p in planned_days if d >= p)
+        text += f"\n🎯 План выполнен в {hit} из {len(planned_days)} дней"
+    return text
+
+
+# ---------- PNG ----------
+
+def _chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def encode_png(rows: list[bytearray], width: int) -> bytes:
+    """RGB 8 бит, без фильтров (у календаря длинные одноцветные участки — zlib их сожмёт)."""
+    raw = b"".join(b"\x00" + bytes(row) for row in rows)
+    header = struct.pack(">IIBBBBB", width, len(rows), 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + _chunk(b"IHDR", header)
+            + _chunk(b"IDAT", zlib.compress(raw, 9)) + _chunk(b"IEND", b""))
+
+
+def _fill(rows: list[bytearray], x: int, y: int, w: int, h: int, color: tuple[int, int, int]) -> None:
+    line = bytes(color) * w
+    for row in rows[y:y + h]:
+        row[3 * x:3 * (x + w)] = line
+
+
+def _text(rows: list[bytearray], x: int, y: int, text: str, color=TEXT) -> None:
+    for ch in text:
+        for dy, bits in enumerate(DIGITS[ch]):
+            for dx, bit in enumerate(bits):
+                if bit == "1":
+                    _fill(rows, x + dx * SCALE, y + dy * SCALE, SCALE, SCALE, color)
+        x += 4 * SCALE
+
+
+def render(start: date, counts: list[tuple[int, int]]) -> bytes:
+    """PNG: колонки — недели (слева направо), строки — пн…вс, над колонками — номер месяца."""
+    step = CELL + GAP
+    width = 2 * MARGIN + WEEKS * step - GAP
+    height = 2 * MARGIN + LABEL_HEIGHT + 7 * step - GAP
+    rows = [bytearray(bytes(BACKGROUND) * width) for _ in range(height)]
+    top = MARGIN + LABEL_HEIGHT
+
+    month = None
+    for week in range(WEEKS):
+        monday = start + timedelta(weeks=week)
+        if monday.month != month and week < WEEKS - 1:
+            month = monday.month
+            _text(rows, MARGIN + week * step, MARGIN, str(month))
+        for day in range(7):
+            i = 7 * week + day
+            if i >= len(counts):
+                break
+            _fill(rows, MARGIN + week * step, top + day * step, CELL, CELL, level(*counts[i]))
+    return encode_png(rows, width)
+
+
+# ---------- кеш file_id ----------
+
+class FileCache:
+    """LRU: "бот:хеш данных" -> file_id уже загруженной картинки (file_id у каждого бота свой)."""
+
+    def __init__(self, size: int = HEATMAP_CACHE_SIZE):
+        self.size = size
+        self._items: OrderedDict[str, str] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> str | None:
+        file_id = self._items.get(key)
+        if file_id is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return file_id
+
+    def put(self, key: str, file_id: str) -> None:
+        if self.size <= 0:
+            return
+        self._items[key] = file_id
+        self._items.move_to_end(key)
+        while len(self._items) > self.size:
+            self._items.popitem(last=False)
+
+    def forget(self, key: str) -> None:
+        self._items.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+cache = FileCache()
+
+
+def main(argv: list[str] | None = None) -> int:
+    from .config import DEFAULT_TENANT
+    from .db import init_db, get_user_id_by_telegram_id
+
+    parser = argparse.ArgumentParser(description="Render a user's workout heatmap to PNG")
+    parser.add_argument("--user", type=int, required=True, help="telegram id")
+    parser.add_argument("--tenant", default=DEFAULT_TENANT, help="bot name from BOT_TOKENS")
+    parser.add_argument("--tz", help="timezone (default: TIMEZONE from config)")
+    parser.add_argument("-o", "--output", default="heatmap.png")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    init_db()
+
+    user_id = get_user_id_by_telegram_id(args.user, tenant=args.tenant)
+    if user_id is None:
+        print(f"Пользователь {args.user} не найден")
+        return 1
+    start, counts = year_counts(user_id, args.tz)
+    with open(args.output, "wb") as f:
+        f.write(render(start, counts))
+    print(f"{args.output}: {digest(start, counts)[:12]}")
+    print(caption(counts))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+Массовый импорт напоминаний.
+
+Используется командой /import (несколько строк в одном сообщении) и из
+командной строки для переноса пользователей из других инструментов:
+
+    python -m src.importer reminders.txt --telegram-id 123456
+    python -m src.importer all_users.txt          # строки вида "123456 /days пн,ср 07:00 Пресс"
+
+Строки — в синтаксисе /add, /everyday, /days; пустые и начинающиеся с '#'
+пропускаются. Если хоть одна строка невалидна, не импортируется ничего.
+CLI только пишет в БД: запущенный бот подхватит напоминания при рестарте.
+"""
+from datetime import datetime
+import argparse
+import logging
+import sys
+
+import pytz
+
+from .config import TIMEZONE, DEFAULT_TENANT
+from .db import init_db, bulk_create_reminders
+from .parsing import ReminderSpec, parse_reminder_line
+
+logger = logging.getLogger(__name__)
+
+MAX_IMPORT_LINES = 200
+
+
+def parse_import_lines(lines: list[str], now: datetime | None = None
+                       ) -> tuple[list[ReminderSpec], list[str]]:
+    """Разобрать все строки. Возвращает (specs, errors); errors — 'строка N: причина'."""
+    now = now or datetime.now(pytz.timezone(TIMEZONE))
+    specs, errors = [], []
+    for n, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            specs.append(parse_reminder_line(line, now))
+        except ValueError as e:
+            errors.append(f"строка {n}: {e}")
+    if len(specs) > MAX_IMPORT_LINES:
+        errors.append(f"слишком много строк: {len(specs)} (максимум {MAX_IMPORT_LINES})")
+    return specs, errors
+
+
+def _group_by_user(lines: list[str]) -> tuple[dict[int, list[str]], list[str]]:
+    """'123 /add ...' -> {123: ['/add ...']}."""
+    grouped: dict[int, list[str]] = {}
+    errors = []
+    for n, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        head, _, rest = line.partition(" ")
+        if not head.isdigit() or not rest.strip():
+            errors.append(f"строка {n}: ожидается 'telegram_id команда'")
+            continue
+        grouped.setdefault(int(head), []).append(rest)
+    return grouped, errors
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Bulk import of reminders")
+    parser.add_argument("file", help="text file, one reminder per line ('-' for stdin)")
+    parser.add_argument("--telegram-id", type=int,
+                        help="owner of all lines; without it each line starts with telegram_id")
+    parser.add_argument("--dry-run", action="store_true", help="only validate")
+    parser.add_argument("--tenant", default=DEFAULT_TENANT, help="bot name from BOT_TOKENS")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    f = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")
+    with f:
+        lines = f.read().splitlines()
+
+    if args.telegram_id is not None:
+        grouped, errors = {args.telegram_id: lines}, []
+    else:
+        grouped, errors = _group_by_user(lines)
+
+    parsed: dict[int, list[ReminderSpec]] = {}
+    for tg_id, user_lines in grouped.items():
+        specs, errs = parse_import_lines(user_lines)
+        errors.extend(f"{tg_id}: {e}" for e in errs)
+        parsed[tg_id] = specs
+
+    if errors:
+        print("Ошибки, ничего не импортировано:", file=sys.stderr)
+        for e in errors:
+            print(f"  {e}", file=sys.stderr)
+        return 1
+
+    total = sum(len(s) for s in parsed.values())
+    if args.dry_run:
+        print(f"OK: {total} напоминаний для {len(parsed)} пользователей")
+        return 0
+
+    init_db()
+    for tg_id, specs in parsed.items():
+        bulk_create_reminders(tg_id, specs, tenant=args.tenant)
+    print(f"Импортировано {total} напоминаний для {len(parsed)} пользователей. "
+          f"Перезапусти бота, чтобы они были запланированы.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+"""
+Сглаживание пиков отправки и приоритет напоминаний над массовыми рассылками.
+
+Напоминания кучкуются на 07:00, 18:00, 20:00: корзина срабатывает в начале
+минуты и раньше пыталась отправить всё сразу. LoadPlanner знает гистограмму
+«сколько напоминаний должно сработать в каждую минуту» (один GROUP BY по
+reminders, обновляется job'ом) и растягивает отправки минуты на окно
+n / LOAD_SEND_RATE секунд, но не больше LOAD_SPREAD_MAX. Сдвиг пользователя
+внутри окна — детерминированный хеш его chat_id: он каждый раз получает
+напоминание с одной и той же задержкой, и она не больше окна.
+
+Пока корзина отправляется (draining), рассылки и дайджесты пропущенного
+(RateLimitedSender с admit=planner.admit) ждут — лимит Telegram достаётся
+напоминаниям. С USE_OUTBOX отправляет другой процесс, и там приоритета нет.
+
+Прогноз нагрузки на сутки вперёд:
+
+    python -m src.loadplan --hours 24
+"""
+from collections import Counter
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+import argparse
+import asyncio
+import logging
+import sys
+
+import pytz
+
+from .config import LOAD_SEND_RATE, LOAD_SPREAD_MAX
+from .db import get_recurring_groups, count_once_by_fire_at
+from .parsing import parse_days
+from .timezones import get_tz
+
+logger = logging.getLogger(__name__)
+
+HORIZON_HOURS = 25
+
+
+def _minute(at: datetime) -> datetime:
+    return at.replace(second=0, microsecond=0)
+
+
+def due_histogram(start_utc: datetime, hours: float = 24) -> Counter:
+    """Naive UTC-минута -> сколько напоминаний должно сработать (повторяющиеся + разовые)."""
+    start = _minute(start_utc)
+    end = start + timedelta(hours=hours)
+    hist: Counter[datetime] = Counter()
+    for tz_str, time_str, reminder_type, days, n in get_recurring_groups():
+        tz = get_tz(tz_str)
+        weekdays = None
+        if reminder_type == "days":
+            ok, parsed = parse_days(days or "")
+            if not ok:
+                continue
+            weekdays = set(parsed)
+        hour, minute = map(int, time_str.split(":"))
+        d = pytz.utc.localize(start).astimezone(tz).date()
+        last = pytz.utc.localize(end).astimezone(tz).date()
+        while d <= last:
+            if weekdays is None or d.weekday() in weekdays:
+                local = tz.localize(datetime(d.year, d.month, d.day, hour, minute))
+                at = local.astimezone(pytz.utc).replace(tzinfo=None)
+                if start <= at < end:
+                    hist[at] += n
+            d += timedelta(days=1)
+    for fire_at, n in count_once_by_fire_at(start, end):
+        hist[_minute(fire_at)] += n
+    return hist
+
+
+def window(n: int, rate: float = LOAD_SEND_RATE, max_window: float = LOAD_SPREAD_MAX) -> float:
+    """На сколько секунд растянуть n отправок одной минуты."""
+    if n <= 1 or rate <= 0:
+        return 0.0
+    return min(max_window, n / rate)
+
+
+def jitter(chat_id: int) -> float:
+    """Детерминированная доля [0, 1) для chat_id (фибоначчиево хеширование)."""
+    return (chat_id * 0x9E3779B97F4A7C15 & 0xFFFFFFFFFFFFFFFF) / 2 ** 64
+
+
+def smoothed(hist: Counter, rate: float = LOAD_SEND_RATE,
+             max_window: float = LOAD_SPREAD_MAX) -> Counter:
+    """Та же нагрузка после растягивания: отправок по минутам (дробные — среднее)."""
+    out: Counter[datetime] = Counter()
+    for minute, n in hist.items():
+        w = window(n, rate, max_window)
+        if w <= 60:
+            out[minute] += n
+            continue
+        per_second = n / w
+        k = 0
+        while w > 0:
+            out[minute + timedelta(minutes=k)] += per_second * min(60.0, w)
+            w -= 60
+            k += 1
+    return out
+
+
+class LoadPlanner:
+    def __init__(self, rate: float = LOAD_SEND_RATE, max_window: float = LOAD_SPREAD_MAX):
+        self.rate = rate
+        self.max_window = max_window
+        self.histogram: Counter[datetime] = Counter()
+        self.refreshed_at: datetime | None = None
+        self._draining = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        # счётчики
+        self.drains = 0
+        self.spread = 0          # напоминаний отправлено со сдвигом
+        self.max_delay = 0.0
+        self.held = 0            # массовых отправок, ждавших окончания корзины
+
+    def refresh(self, now: datetime | None = None) -> int:
+        """Пересчитать гистограмму на HORIZON_HOURS вперёд. Возвращает число минут с отправками."""
+        now = now or datetime.utcnow()
+        self.histogram = due_histogram(now, HORIZON_HOURS)
+        self.refreshed_at = now
+        return len(self.histogram)
+
+    def offsets(self, chat_ids: list[int], now: datetime | None = None) -> list[float]:
+        """Задержки (с) для отправок этой минуты: окно по прогнозу, сдвиг по chat_id."""
+        if self.max_window <= 0:
+            return [0.0] * len(chat_ids)
+        expected = max(len(chat_ids), self.histogram.get(_minute(now or datetime.utcnow()), 0))
+        w = window(expected, self.rate, self.max_window)
+        out = [w * jitter(c) for c in chat_ids]
+        if w:
+            self.spread += len(out)
+            self.max_delay = max(self.max_delay, max(out))
+        return out
+
+    @asynccontextmanager
+    async def draining(self):
+        """Пока внутри — идёт отправка напоминаний, массовые ждут в admit()."""
+        self._draining += 1
+        self.drains += 1
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self._draining -= 1
+            if not self._draining:
+                self._idle.set()
+
+    async def admit(self) -> None:
+        """Для некритичных отправок (рассылки, дайджесты): дождаться конца корзины."""
+        if not self._idle.is_set():
+            self.held += 1
+            await self._idle.wait()
+
+    def stats(self) -> dict:
+        peak = max(self.histogram.items(), key=lambda kv: kv[1], default=(None, 0))
+        return {
+            "draining": self._draining, "drains": self.drains, "spread": self.spread,
+            "max_delay": self.max_delay, "held": self.held,
+            "peak_minute": peak[0], "peak_due": peak[1],
+        }
+
+
+planner = LoadPlanner()
+
+
+def format_curve(hist: Counter, after: Counter, start: datetime, hours: float, tz,
+                 width: int = 40) -> str:
+    """Поминутная таблица: время (tz), срабатываний, отправок/мин после сглаживания, полоска."""
+    peak = max(after.values(), default=0)
+    lines = [f"{'время':>5}  {'срабат.':>7}  {'отправок':>8}"]
+    end = _minute(start) + timedelta(hours=hours)
+    for minute in sorted(set(hist) | set(after)):
+        if minute >= end:
+            continue
+        sends = after.get(minute, 0)
+        bar = "█" * max(1, round(width * sends / peak)) if peak and sends else ""
+        local = pytz.utc.localize(minute).astimezone(tz)
+        lines.append(f"{local:%H:%M}  {hist.get(minute, 0):>7}  {sends:>8.0f}  {bar}")
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    from .config import TIMEZONE
+    from .db import init_db
+
+    parser = argparse.ArgumentParser(description="Predicted per-minute reminder load")
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--rate", type=float, default=LOAD_SEND_RATE, help="sends per second")
+    parser.add_argument("--window", type=float, default=LOAD_SPREAD_MAX, help="max spread, seconds")
+    parser.add_argument("--tz", default=TIMEZONE, help="timezone for the time column")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    init_db()
+
+    now = datetime.utcnow()
+    hist = due_histogram(now, args.hours)
+    after = smoothed(hist, args.rate, args.window)
+    print(format_curve(hist, after, now, args.hours, get_tz(args.tz)))
+
+    total = sum(hist.values())
+    peak_due = max(hist.values(), default=0)
+    worst = max((window(n, args.rate, args.window) for n in hist.values()), default=0.0)
+    peak_rate = max((n / w if w else n for n, w in
+                     ((n, window(n, args.rate, args.window)) for n in hist.values())), default=0)
+    print(f"\nЗа {args.hours:g} ч: {total} напоминаний в {len(hist)} минутах")
+    print(f"Пик: {peak_due} срабатываний в одну секунду без сглаживания, "
+          f"со сглаживанием — не больше {peak_rate:.0f}/с")
+    print(f"Максимальная задержка напоминания: {worst:.0f} с (лимит {args.window:g} с, {args.rate:g}/с)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
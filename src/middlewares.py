@@ -0,0 +1,145 @@
+from typing import Any, Awaitable, Callable
+import logging
+
+from aiogram import BaseMiddleware, Router
+from aiogram.filters import Command
+from aiogram.types import TelegramObject, Update, Message, CallbackQuery
+
+from . import querystats, profiler, tenants
+from .ratelimit import BucketRegistry
+
+logger = logging.getLogger(__name__)
+
+# Метки метрик — только команды с хендлерами (register_commands): иначе каждая
+# присланная /aaa1, /aaa2 … заводила бы свою строку в querystats и profiler.timings.
+OTHER_COMMAND = "/other"
+OTHER_CALLBACK = "cb:other"
+known_commands: set[str] = set()
+known_callbacks: set[str] = set()
+
+
+def message_command(text: str | None) -> str:
+    """'/weeks@my_bot 12' -> '/weeks'; обычный текст -> 'message'."""
+    text = text or ""
+    if text.startswith("/"):
+        return text.split(maxsplit=1)[0].split("@", 1)[0].lower()
+    return "message"
+
+
+def callback_command(data: str | None) -> str:
+    """'done_15' -> 'cb:done'."""
+    return f"cb:{(data or '').split('_', 1)[0]}"
+
+
+def register_commands(router: Router, callbacks: set[str] = frozenset()) -> None:
+    """Запомнить команды из фильтров Command(...) хендлеров router и префиксы колбэков ('done_…')."""
+    for handler in router.message.handlers:
+        for f in handler.filters or ():
+            if isinstance(f.callback, Command):
+                known_commands.update(f"/{c}".lower() for c in f.callback.commands if isinstance(c, str))
+    known_callbacks.update(f"cb:{c}" for c in callbacks)
+
+
+def command_name(update: Update) -> str:
+    """Тег апдейта для метрик: '/stats', 'cb:done', 'message'; незнакомые — '/other', 'cb:other'."""
+    if update.message is not None:
+        command = message_command(update.message.text)
+        return command if command == "message" or command in known_commands else OTHER_COMMAND
+    if update.callback_query is not None:
+        command = callback_command(update.callback_query.data)
+        return command if command in known_callbacks else OTHER_CALLBACK
+    return update.event_type
+
+
+class QueryStatsMiddleware(BaseMiddleware):
+    """Считает SQL-выражения, время в БД и сессии на каждый апдейт."""
+
+    def __init__(self, slow_ms: float):
+        self.slow_ms = slow_ms
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        with querystats.track(command_name(event), slow_ms=self.slow_ms):
+            return await handler(event, data)
+
+
+class TaskTimingMiddleware(BaseMiddleware):
+    """Wall/CPU апдейта по командам (profiler.timings) и метка для сэмплера."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        return await profiler.measure(command_name(event), handler(event, data))
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Антиспам на пользователя.
+
+    У каждого пользователя два token bucket'а: для дешёвых и для тяжёлых
+    команд (агрегации /stats, /weeks). Если токенов нет — отвечаем коротким
+    «подожди» (один раз за окно) и не зовём хендлер. Одинаковая тяжёлая
+    команда, которая уже выполняется у этого пользователя, не запускается
+    второй раз: ответ придёт от первой.
+
+    Ключ — (арендатор, пользователь): у одного человека в двух ботах
+    (tenants.py) лимиты и выполняющиеся команды раздельные.
+    """
+
+    def __init__(self, heavy_commands: set[str],
+                 cheap: BucketRegistry, heavy: BucketRegistry):
+        self.heavy_commands = heavy_commands
+        self.cheap = cheap
+        self.heavy = heavy
+        self._in_flight: set[tuple[str, int, str]] = set()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user = getattr(event, "from_user", None)
+        if user is None:
+            return await handler(event, data)
+
+        if isinstance(event, Message):
+            command, payload = message_command(event.text), event.text
+        elif isinstance(event, CallbackQuery):
+            command, payload = callback_command(event.data), event.data
+        else:
+            return await handler(event, data)
+
+        is_heavy = command in self.heavy_commands
+        registry = self.heavy if is_heavy else self.cheap
+        tenant = tenants.current()
+        bucket = registry.get((tenant, user.id))
+
+        key = (tenant, user.id, (payload or "").strip()) if is_heavy else None
+        if key is not None and key in self._in_flight:
+            await event.answer("⏳ Подожди, уже считаю — ответ скоро придёт.")
+            return None
+
+        if not bucket.try_acquire():
+            if not bucket.warned:
+                bucket.warned = True
+                await event.answer(
+                    f"⏳ Подожди {max(1, int(bucket.delay() + 0.999))} сек. и повтори."
+                )
+            logger.debug(f"Throttled {command} for user {user.id}")
+            return None
+
+        if key is None:
+            return await handler(event, data)
+        self._in_flight.add(key)
+        try:
+            return await handler(event, data)
+        finally:
+            self._in_flight.discard(key)
@@ -1,6 +1,9 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text, Date
+from sqlalchemy import (
+    Column, Integer, BigInteger, String, DateTime, Boolean, ForeignKey, Text, Date, Float, Index,
+    UniqueConstraint, select
+)
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, column_property
 from datetime import datetime
 
 Base = declarative_base()
@@ -8,19 +11,49 @@ Base = declarative_base()
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # один и тот же человек у двух ботов — два пользователя (см. tenants.py)
+        UniqueConstraint("tenant", "telegram_id", name="uq_users_tenant_telegram"),
+    )
 
     id = Column(Integer, primary_key=True)
-    telegram_id = Column(Integer, unique=True, nullable=False)
+    tenant = Column(String(32))                         # имя бота из BOT_TOKENS
+    telegram_id = Column(Integer, nullable=False)
     username = Column(String(255))
     first_name = Column(String(255))
     last_name = Column(String(255))
     created_at = Column(DateTime, default=datetime.utcnow)
     is_active = Column(Boolean, default=True)
+    timezone = Column(String(64))                       # IANA или '+05:30'; NULL — config.TIMEZONE
+
+    # серия 100%-дней; считается инкрементально (см. streaks.py)
+    current_streak = Column(Integer, default=0)
+    best_streak = Column(Integer, default=0)
+    last_evaluated_date = Column(Date)                  # последний учтённый локальный день
 
     reminders = relationship("Reminder", back_populates="user")
     completed_workouts = relationship("CompletedWorkout", back_populates="user")
 
 
+class InternedText(Base):
+    """
+    Словарь текстов: одинаковые тексты напоминаний и выполнений хранятся один
+    раз, строки ссылаются на них по text_id (см. db.intern_texts). Поиск — по
+    8-байтному хешу без уникального индекса: индекс по body хранил бы каждый
+    текст второй раз. Строки не меняются и не удаляются.
+    """
+    __tablename__ = "texts"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    hash = Column(BigInteger, nullable=False, index=True)
+    body = Column(Text, nullable=False)
+
+
+def _text_of(text_id):
+    # read-only: при загрузке ORM-объекта текст подтягивается подзапросом по PK
+    return column_property(select(InternedText.body).where(InternedText.id == text_id).scalar_subquery())
+
+
 class Reminder(Base):
     __tablename__ = "reminders"
 
@@ -29,22 +62,28 @@ class Reminder(Base):
     reminder_type = Column(String(50), nullable=False)  # once, everyday, days
     time = Column(String(5), nullable=False)            # HH:MM
     days = Column(String(20))                           # 'пн,ср,пт' для type='days'
-    text = Column(Text, nullable=False)
+    text_id = Column(Integer, ForeignKey("texts.id"), nullable=False)
+    text = _text_of(text_id)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     job_id = Column(String(100))                        # APScheduler job ID
+    fire_at = Column(DateTime, index=True)              # для once: момент срабатывания (UTC)
 
     user = relationship("User", back_populates="reminders")
 
 
 class CompletedWorkout(Base):
     __tablename__ = "completed_workouts"
+    __table_args__ = (
+        Index("ix_completed_workouts_user", "user_id", "completed_at"),
+    )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     reminder_id = Column(Integer, ForeignKey("reminders.id"))
     completed_at = Column(DateTime, default=datetime.utcnow)
-    text = Column(Text)
+    text_id = Column(Integer, ForeignKey("texts.id"))
+    text = _text_of(text_id)
 
     user = relationship("User", back_populates="completed_workouts")
     reminder = relationship("Reminder")
@@ -67,3 +106,202 @@ class WeeklySummary(Base):
     user = relationship("User")
 
 
+
+class Broadcast(Base):
+    __tablename__ = "broadcasts"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    tenant = Column(String(32))                        # чей бот рассылает и кому
+    text = Column(Text, nullable=False)
+    created_by = Column(Integer, nullable=False)       # telegram_id админа
+    status = Column(String(20), default="running", nullable=False)  # running, done, cancelled
+
+    # прогресс: последний обработанный users.id (keyset-пагинация по возрастанию id)
+    last_user_id = Column(Integer, default=0, nullable=False)
+    total = Column(Integer, default=0, nullable=False)  # активных пользователей на старте
+    sent = Column(Integer, default=0, nullable=False)
+    failed = Column(Integer, default=0, nullable=False)
+    blocked = Column(Integer, default=0, nullable=False)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime)
+
+class BotState(Base):
+    """Служебные значения процесса (heartbeat и т.п.) в виде key/value."""
+    __tablename__ = "bot_state"
+
+    key = Column(String(64), primary_key=True)
+    value = Column(Text)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class Challenge(Base):
+    """Групповой челлендж: % выполнения плана за период."""
+    __tablename__ = "challenges"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    code = Column(String(12), unique=True, nullable=False)   # код для /join
+    title = Column(String(255), nullable=False)
+    start_date = Column(Date, nullable=False)                # локальные даты, включительно
+    end_date = Column(Date, nullable=False)
+    planned_through = Column(Date)                           # план участников добавлен по этот день
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ChallengeMember(Base):
+    __tablename__ = "challenge_members"
+    __table_args__ = (
+        UniqueConstraint("challenge_id", "user_id"),
+        Index("ix_challenge_members_rank", "challenge_id", "score"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    challenge_id = Column(Integer, ForeignKey("challenges.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    done = Column(Integer, default=0, nullable=False)
+    planned = Column(Integer, default=0, nullable=False)
+    score = Column(Integer, default=0, nullable=False)       # % выполнения × 100 (0..10000)
+    joined_at = Column(DateTime, default=datetime.utcnow)
+
+
+class WorkoutLog(Base):
+    """Запись /log: одно упражнение (подходы × повторы × вес)."""
+    __tablename__ = "workout_logs"
+    __table_args__ = (
+        Index("ix_workout_logs_user_exercise", "user_id", "exercise", "logged_at"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    completed_id = Column(Integer, ForeignKey("completed_workouts.id"))  # если записано после «✅»
+    exercise = Column(String(64), nullable=False)             # нормализованное название
+    sets = Column(Integer, nullable=False)
+    reps = Column(Integer, nullable=False)
+    weight = Column(Float)                                    # кг; None — без веса
+    logged_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ExerciseStats(Base):
+    """Итоги по упражнению пользователя; обновляются при каждой записи /log."""
+    __tablename__ = "exercise_stats"
+    __table_args__ = (UniqueConstraint("user_id", "exercise"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    exercise = Column(String(64), nullable=False)
+    entries = Column(Integer, default=0, nullable=False)
+    total_reps = Column(Integer, default=0, nullable=False)
+    total_volume = Column(Float, default=0, nullable=False)   # Σ подходы × повторы × вес
+    best_weight = Column(Float)
+    best_weight_at = Column(DateTime)
+    best_reps = Column(Integer)                               # максимум повторов в подходе
+    best_volume = Column(Float)                               # максимум объёма за одну запись
+    last_sets = Column(Integer)
+    last_reps = Column(Integer)
+    last_weight = Column(Float)
+    last_at = Column(DateTime)
+
+
+class ExerciseWeek(Base):
+    """Объём по упражнению за локальную неделю (week_start — понедельник)."""
+    __tablename__ = "exercise_weeks"
+    __table_args__ = (UniqueConstraint("user_id", "exercise", "week_start"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    exercise = Column(String(64), nullable=False)
+    week_start = Column(Date, nullable=False)
+    sets = Column(Integer, default=0, nullable=False)
+    reps = Column(Integer, default=0, nullable=False)
+    volume = Column(Float, default=0, nullable=False)
+
+
+class Event(Base):
+    """
+    Журнал изменений: только INSERT, без вторичных индексов. Проекции
+    (proj_*) строятся из него, см. projections.py. id монотонный
+    (AUTOINCREMENT) — годится как счётчик изменений.
+    """
+    __tablename__ = "events"
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    type = Column(String(32), nullable=False)
+    user_id = Column(Integer)                  # без FK: события переживают удаление строк
+    reminder_id = Column(Integer)
+    at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    data = Column(Text)                        # JSON с деталями события
+
+
+class ProjReminder(Base):
+    """Проекция: напоминания (включая удалённые) по журналу событий."""
+    __tablename__ = "proj_reminders"
+
+    reminder_id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(Integer, nullable=False, index=True)
+    reminder_type = Column(String(20), nullable=False)
+    time = Column(String(5), nullable=False)
+    days = Column(String(50))
+    text = Column(Text, nullable=False)
+    is_active = Column(Boolean, default=True, nullable=False)
+    deleted = Column(Boolean, default=False, nullable=False)
+    created_at = Column(DateTime)
+
+
+class ProjUser(Base):
+    """Проекция: по какой локальный день пользователю начислен план."""
+    __tablename__ = "proj_users"
+
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    planned_through = Column(Date)
+    timezone = Column(String(64))                       # зона на checkpoint; NULL — config.TIMEZONE
+
+
+class ProjDaily(Base):
+    """Проекция: план / отправлено / выполнено за локальный день."""
+    __tablename__ = "proj_daily"
+
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    day = Column(Date, primary_key=True)
+    planned = Column(Integer, default=0, nullable=False)
+    sent = Column(Integer, default=0, nullable=False)
+    done = Column(Integer, default=0, nullable=False)
+
+
+class ProjWeekly(Base):
+    """Проекция: то же за неделю (week_start — локальный понедельник)."""
+    __tablename__ = "proj_weekly"
+
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    week_start = Column(Date, primary_key=True)
+    planned = Column(Integer, default=0, nullable=False)
+    sent = Column(Integer, default=0, nullable=False)
+    done = Column(Integer, default=0, nullable=False)
+
+
+class OutboxMessage(Base):
+    """
+    Исходящие сообщения для отдельного процесса-отправщика (python -m src.sender).
+    Строка пишется в той же транзакции, что и изменение состояния; отправщик
+    забирает строки с арендой (lease_until) и помечает результат.
+    """
+    __tablename__ = "outbox"
+    __table_args__ = (
+        Index("ix_outbox_pending", "status", "available_at"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    tenant = Column(String(32))                        # через какого бота отправлять
+    chat_id = Column(Integer, nullable=False)          # telegram_id получателя
+    text = Column(Text, nullable=False)
+    reply_markup = Column(Text)                        # JSON клавиатуры
+    reminder_ids = Column(Text)                        # JSON [id] — для событий reminder_sent
+    status = Column(String(20), default="pending", nullable=False)  # pending, sent, failed, blocked
+    attempts = Column(Integer, default=0, nullable=False)
+    available_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    lease_owner = Column(String(64))
+    lease_until = Column(DateTime)
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime)
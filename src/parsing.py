@@ -0,0 +1,210 @@
+"""
+Разбор пользовательского ввода: время, дни недели, строки напоминаний.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import re
+
+import pytz
+
+
+def validate_time_format(time_str: str) -> bool:
+    return bool(re.match(r'^([01]?[0-9]|2[0-3]):([0-5][0-9])$', time_str))
+
+
+def parse_days(days_str: str):
+    mapping = {
+        'пн': 0, 'вт': 1, 'ср': 2, 'чт': 3, 'пт': 4, 'сб': 5, 'вс': 6,
+        'mon': 0, 'tue': 1, 'wed': 2, 'thu': 3, 'fri': 4, 'sat': 5, 'sun': 6
+    }
+    items = [d.strip().lower() for d in days_str.split(',') if d.strip()]
+    if not items:
+        return False, "Не указаны дни недели."
+    nums = []
+    for d in items:
+        if d not in mapping:
+            return False, f"Неизвестный день недели: {d}"
+        nums.append(mapping[d])
+    seen, out = set(), []
+    for x in nums:
+        if x not in seen:
+            out.append(x)
+            seen.add(x)
+    return True, out
+
+
+def days_list_to_str(days: list[int]) -> str:
+    back = ['пн', 'вт', 'ср', 'чт', 'пт', 'сб', 'вс']
+    return ",".join(back[d] for d in days)
+
+
+def parse_once_when(tokens: list[str], now: datetime) -> tuple[datetime, int]:
+    """
+    Когда сработать разовому напоминанию. Понимает:
+      HH:MM               — сегодня
+      завтра HH:MM        — и «послезавтра»
+      +3d HH:MM           — через N дней в указанное время
+      +2h / +30m          — через N часов / минут от текущего момента
+      25.12 HH:MM         — дата (ближайшая будущая), можно 25.12.2026
+    `now` — текущее локальное (aware) время. Возвращает (локальное aware-время,
+    сколько токенов съедено). Бросает ValueError.
+    """
+    if not tokens:
+        raise ValueError("не указано время")
+    head = tokens[0].lower()
+
+    rel = re.fullmatch(r'\+(\d{1,3})([dhmдчм])', head)
+    if rel and int(rel.group(1)) == 0:
+        raise ValueError("интервал должен быть больше нуля")
+    if rel and rel.group(2) in "hmчм":
+        n = int(rel.group(1))
+        delta = timedelta(hours=n) if rel.group(2) in "hч" else timedelta(minutes=n)
+        target = now + delta
+        if hasattr(now.tzinfo, "normalize"):  # pytz: поправить смещение после перехода DST
+            target = now.tzinfo.normalize(target)
+        target = target.replace(second=0, microsecond=0)
+        if target <= now:
+            raise ValueError("это время уже прошло")
+        return target, 1
+
+    if head in ("завтра", "послезавтра") or rel:
+        offset = 1 if head == "завтра" else 2 if head == "послезавтра" else int(rel.group(1))
+        day = now.date() + timedelta(days=offset)
+        time_tokens = tokens[1:]
+        consumed = 2
+    else:
+        date_m = re.fullmatch(r'(\d{1,2})\.(\d{1,2})(?:\.(\d{4}))?', head)
+        if date_m:
+            d, mth, y = int(date_m.group(1)), int(date_m.group(2)), date_m.group(3)
+            try:
+                day = datetime(int(y) if y else now.year, mth, d).date()
+            except ValueError:
+                raise ValueError(f"неверная дата: {tokens[0]}")
+            if not y and day < now.date():
+                day = day.replace(year=day.year + 1)
+            time_tokens = tokens[1:]
+            consumed = 2
+        else:
+            day = now.date()
+            time_tokens = tokens
+            consumed = 1
+
+    if not time_tokens or not validate_time_format(time_tokens[0]):
+        raise ValueError("время должно быть HH:MM")
+    h, m = map(int, time_tokens[0].split(":"))
+    naive = datetime(day.year, day.month, day.day, h, m)
+    target = now.tzinfo.localize(naive) if hasattr(now.tzinfo, "localize") \
+        else naive.replace(tzinfo=now.tzinfo)
+    if target <= now:
+        raise ValueError("это время уже прошло")
+    return target, consumed
+
+
+@dataclass(slots=True, frozen=True)
+class ReminderSpec:
+    reminder_type: str      # once, everyday, days
+    time: str               # HH:MM
+    text: str
+    days: str | None = None
+    fire_at: datetime | None = None   # для once: момент срабатывания, naive UTC
+
+
+def parse_once_args(rest: str, now: datetime) -> ReminderSpec:
+    """Аргументы /add: '[дата] HH:MM текст' или '+2h текст'."""
+    tokens = rest.split()
+    when, consumed = parse_once_when(tokens, now)
+    text = rest.split(maxsplit=consumed)[consumed].strip() if len(tokens) > consumed else ""
+    if not text:
+        raise ValueError("не указан текст напоминания")
+    fire_at = when.astimezone(pytz.utc).replace(tzinfo=None)
+    return ReminderSpec("once", when.strftime("%H:%M"), text, fire_at=fire_at)
+
+
+def parse_reminder_line(line: str, now: datetime) -> ReminderSpec:
+    """
+    Строка в синтаксисе команд (слэш необязателен):
+      /add [дата] HH:MM текст
+      /everyday HH:MM текст
+      /days пн,ср,пт HH:MM текст
+    `now` — текущее локальное время (для проверки, что разовое ещё не прошло).
+    Бросает ValueError с понятным пользователю текстом.
+    """
+    parts = line.strip().split(maxsplit=1)
+    if not parts:
+        raise ValueError("пустая строка")
+    command = parts[0].lstrip("/").split("@", 1)[0].lower()
+    rest = parts[1] if len(parts) > 1 else ""
+
+    if command == "add":
+        return parse_once_args(rest, now)
+
+    if command == "everyday":
+        args = rest.split(maxsplit=1)
+        if len(args) < 2:
+            raise ValueError(f"формат: /{command} HH:MM текст")
+        time_str, text = args[0].strip(), args[1].strip()
+        if not validate_time_format(time_str):
+            raise ValueError("время должно быть HH:MM")
+        return ReminderSpec("everyday", time_str, text)
+
+    if command == "days":
+        args = rest.split(maxsplit=2)
+        if len(args) < 3:
+            raise ValueError("формат: /days дни HH:MM текст")
+        ok, parsed = parse_days(args[0])
+        if not ok:
+            raise ValueError(parsed)
+        time_str, text = args[1].strip(), args[2].strip()
+        if not validate_time_format(time_str):
+            raise ValueError("время должно быть HH:MM")
+        return ReminderSpec("days", time_str, text, days_list_to_str(parsed))
+
+    raise ValueError(f"неизвестная команда: {parts[0]}")
+
+
+@dataclass(slots=True, frozen=True)
+class LogEntry:
+    exercise: str           # нормализованное: нижний регистр, ё -> е
+    sets: int
+    reps: int
+    weight: float | None    # кг
+
+    @property
+    def volume(self) -> float:
+        return self.sets * self.reps * (self.weight or 0)
+
+
+MAX_SETS, MAX_REPS, MAX_WEIGHT = 100, 1000, 1000
+
+
+def parse_log_entries(text: str) -> list[LogEntry]:
+    """
+    Строки вида 'жим 3x8 80кг', 'присед 5х5 100', 'подтягивания 4x10',
+    несколько упражнений — через ';' или с новой строки. Без 'NxM' — один
+    подход: 'планка 60'. Бросает ValueError.
+    """
+    out = []
+    for chunk in re.split(r"[;\n]+", text):
+        chunk = chunk.strip().lower().replace("ё", "е")
+        if not chunk:
+            continue
+        sr = re.search(r"(\d+)\s*[xх×*]\s*(\d+)", chunk)
+        rest = chunk[:sr.start()] + " " + chunk[sr.end():] if sr else chunk
+        w = re.search(r"(\d+(?:[.,]\d+)?)\s*(?:кг|kg)?(?!\S)", rest)
+        name = re.sub(r"\s+", " ", rest[:w.start()] + " " + rest[w.end():] if w else rest).strip(" -:,")
+        if not name:
+            raise ValueError(f"не указано упражнение: {chunk}")
+
+        if sr:
+            sets, reps = int(sr.group(1)), int(sr.group(2))
+            weight = float(w.group(1).replace(",", ".")) if w else None
+        elif w:
+            sets, reps, weight = 1, int(float(w.group(1).replace(",", "."))), None
+        else:
+            raise ValueError(f"укажи подходы и повторы, например: {name} 3x10")
+        if not (0 < sets <= MAX_SETS and 0 < reps <= MAX_REPS) or (weight is not None and not 0 <= weight <= MAX_WEIGHT):
+            raise ValueError(f"слишком большие числа: {chunk}")
+        out.append(LogEntry(name[:64], sets, reps, weight))
+    if not out:
+        raise ValueError("пустая запись")
+    return out
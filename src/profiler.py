@@ -0,0 +1,302 @@
+"""
+Профилирование в продакшене: сэмплер стеков и замер wall/CPU по задачам.
+
+Сэмплер — отдельный поток, который каждые `interval` секунд снимает стеки
+всех потоков через sys._current_frames() (поток цикла событий и потоки
+планировщика/БД) и копит их в формате collapsed stacks:
+
+    MainThread;/weeks;aiogram.dispatcher...;src.bot.weeks_command;src.db.get_week_summaries 42
+
+Файл PROFILE_DIR/profile-*.collapsed открывается flamegraph.pl, speedscope
+или inferno. Первый кадр — поток, второй — метка задачи, которая в этот
+момент выполнялась (команда апдейта или job:имя), если включён замер
+(TASK_TIMING). Запуск: /profile [секунд] у админа или `kill -USR1 <pid>`.
+Пока профиль не запущен, потока нет.
+
+Замер задач: апдейты (TaskTimingMiddleware) и job'ы планировщика идут через
+measure(), который считает wall-время и CPU именно этой корутины — время
+потока только на её шагах, без чужих задач, выполнявшихся между await'ами.
+"""
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable
+import asyncio
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+
+from .config import PROFILE_DIR, PROFILE_INTERVAL, TASK_TIMING
+
+logger = logging.getLogger(__name__)
+
+MAX_DEPTH = 64
+IDLE = "<idle>"
+
+# поток -> метка задачи, шаг которой сейчас выполняется
+_labels: dict[int, str] = {}
+
+
+# ---------- замер задач ----------
+
+@dataclass(slots=True)
+class TaskTiming:
+    count: int = 0
+    errors: int = 0
+    wall: float = 0.0
+    cpu: float = 0.0
+    max_wall: float = 0.0
+    max_cpu: float = 0.0
+
+    def as_dict(self) -> dict:
+        n = self.count or 1
+        return {
+            "count": self.count, "errors": self.errors,
+            "avg_wall_ms": 1000 * self.wall / n, "avg_cpu_ms": 1000 * self.cpu / n,
+            "max_wall_ms": 1000 * self.max_wall, "max_cpu_ms": 1000 * self.max_cpu,
+            "cpu_share": self.cpu / self.wall if self.wall else 0.0,
+        }
+
+
+timings: dict[str, TaskTiming] = {}
+
+
+def record(name: str, wall: float, cpu: float, ok: bool = True) -> None:
+    t = timings.get(name)
+    if t is None:
+        t = timings[name] = TaskTiming()
+    t.count += 1
+    t.errors += not ok
+    t.wall += wall
+    t.cpu += cpu
+    t.max_wall = max(t.max_wall, wall)
+    t.max_cpu = max(t.max_cpu, cpu)
+
+
+class _Measured:
+    """Обёртка корутины: CPU считается вокруг каждого её шага (send/throw)."""
+
+    __slots__ = ("name", "coro")
+
+    def __init__(self, name: str, coro):
+        self.name = name
+        self.coro = coro
+
+    def __await__(self):
+        coro, name = self.coro, self.name
+        tid = threading.get_ident()
+        started = time.perf_counter()
+        cpu = 0.0
+        ok = False
+        value, exc = None, None
+        try:
+            while True:
+                prev = _labels.get(tid)
+                _labels[tid] = name
+                t = time.thread_time()
+                try:
+                    yielded = coro.throw(exc) if exc is not None else coro.send(value)
+                except StopIteration as e:
+                    ok = True
+                    return e.value
+                finally:
+                    cpu += time.thread_time() - t
+                    if prev is None:
+                        _labels.pop(tid, None)
+                    else:
+                        _labels[tid] = prev
+                try:
+                    value, exc = (yield yielded), None
+                except BaseException as e:
+                    value, exc = None, e
+        finally:
+            record(name, time.perf_counter() - started, cpu, ok)
+
+
+async def measure(name: str, coro):
+    """await coro с замером; при TASK_TIMING=0 — просто await."""
+    if not TASK_TIMING:
+        return await coro
+    return await _Measured(name, coro)
+
+
+def timed_job(func: Callable) -> Callable:
+    """Обёртка функции job'а планировщика (async — в цикле, sync — в потоке исполнителя)."""
+    name = f"job:{getattr(func, '__name__', 'job')}"
+    if getattr(func, "_timed", False):
+        return func
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def run(*args, **kwargs):
+            return await measure(name, func(*args, **kwargs))
+    else:
+        @functools.wraps(func)
+        def run(*args, **kwargs):
+            if not TASK_TIMING:
+                return func(*args, **kwargs)
+            tid = threading.get_ident()
+            _labels[tid] = name
+            started, cpu = time.perf_counter(), time.thread_time()
+            ok = False
+            try:
+                result = func(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                _labels.pop(tid, None)
+                record(name, time.perf_counter() - started, time.thread_time() - cpu, ok)
+    run._timed = True
+    return run
+
+
+def format_timings(limit: int = 20) -> str:
+    if not timings:
+        return "⏱ Замеров пока нет (TASK_TIMING=0 или ещё не было задач)."
+    rows = sorted(timings.items(), key=lambda kv: -kv[1].cpu)[:limit]
+    lines = ["⏱ Задачи по CPU (среднее / макс):\n"]
+    for name, t in rows:
+        d = t.as_dict()
+        lines.append(
+            f"{name}: {d['count']}×, wall {d['avg_wall_ms']:.1f}/{d['max_wall_ms']:.0f} мс, "
+            f"CPU {d['avg_cpu_ms']:.1f}/{d['max_cpu_ms']:.0f} мс"
+            + (f", ошибок {d['errors']}" if d["errors"] else "")
+        )
+    return "\n".join(lines)
+
+
+# ---------- сэмплер ----------
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}.{getattr(code, 'co_qualname', code.co_name)}"
+
+
+# на чём стоит простаивающий поток: select цикла событий, ожидание очереди исполнителя
+_IDLE_FUNCS = {"select", "poll", "epoll", "_run_once", "wait", "_wait_for_tstate_lock"}
+
+
+def collapse(frame, label: str | None, thread_name: str) -> str:
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    names.reverse()
+    if label is None and names and names[-1].rsplit(".", 1)[-1] in _IDLE_FUNCS:
+        return f"{thread_name};{IDLE}"
+    head = [thread_name] + ([label] if label else [])
+    return ";".join(head + names)
+
+
+class Sampler:
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.started_at: float | None = None
+        self.elapsed = 0.0
+
+    def _run(self, duration: float) -> None:
+        me = threading.get_ident()
+        deadline = time.monotonic() + duration
+        self.started_at = time.monotonic()
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                self.stacks[collapse(frame, _labels.get(tid), names.get(tid, str(tid)))] += 1
+            self.samples += 1
+            self._stop.wait(self.interval)
+        self.elapsed = time.monotonic() - self.started_at
+
+    def start(self, duration: float) -> None:
+        self._thread = threading.Thread(target=self._run, args=(duration,), name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def write(self, path: Path) -> Path:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in self.stacks.most_common():
+                f.write(f"{stack} {n}\n")
+        return path
+
+    def summary(self, limit: int = 10) -> str:
+        busy = {s: n for s, n in self.stacks.items() if not s.endswith(IDLE)}
+        total = sum(self.stacks.values()) or 1
+        inclusive: Counter[str] = Counter()
+        leaves: Counter[str] = Counter()
+        for stack, n in busy.items():
+            frames = stack.split(";")[1:]
+            leaves[frames[-1]] += n
+            for name in set(frames):
+                inclusive[name] += n
+        lines = [f"🔥 {self.samples} сэмплов за {self.elapsed:.1f} с, "
+                 f"занято {100 * sum(busy.values()) / total:.0f}% снимков\n", "Собственное время:"]
+        lines += [f"{100 * n / total:5.1f}% {name}" for name, n in leaves.most_common(limit)]
+        lines.append("\nВключая вызовы (src.*):")
+        lines += [f"{100 * n / total:5.1f}% {name}" for name, n in inclusive.most_common()
+                  if name.startswith("src.")][:limit]
+        return "\n".join(lines)
+
+
+_active: Sampler | None = None
+
+
+def is_running() -> bool:
+    return _active is not None
+
+
+async def profile(duration: float, interval: float = PROFILE_INTERVAL,
+                  out_dir: str | Path = PROFILE_DIR) -> tuple[Path, Sampler] | None:
+    """Снять профиль за duration секунд. None — уже идёт другой."""
+    global _active
+    if _active is not None:
+        return None
+    sampler = _active = Sampler(interval)
+    try:
+        sampler.start(duration)
+        while sampler.is_alive():
+            await asyncio.sleep(0.2)
+        name = f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.collapsed"
+        path = sampler.write(Path(out_dir) / name)
+    finally:
+        _active = None
+    logger.info(f"Profile written to {path}: {sampler.samples} samples, {len(sampler.stacks)} stacks")
+    return path, sampler
+
+
+def start_in_background(duration: float, done: Callable[[Path, Sampler], Awaitable[None]] | None = None) -> bool:
+    """Запустить профиль задачей цикла (для сигнала). False — уже идёт."""
+    if _active is not None:
+        return False
+
+    async def _run():
+        result = await profile(duration)
+        if result and done:
+            await done(*result)
+
+    asyncio.get_running_loop().create_task(_run())
+    return True
+
+
+def install_signal_handler(duration: float, done=None) -> bool:
+    """SIGUSR1 -> профиль на duration секунд (только Unix)."""
+    import signal
+
+    if not hasattr(signal, "SIGUSR1"):
+        return False
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGUSR1, lambda: start_in_background(duration, done))
+    return True
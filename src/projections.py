@@ -0,0 +1,353 @@
+"""
+Проекции из журнала событий (events).
+
+Запись в БД дописывает событие в той же транзакции, что и изменение
+(см. db._event). Отсюда строятся таблицы proj_*:
+
+    proj_reminders — напоминания, включая удалённые и переименованные
+    proj_daily     — план / отправлено / выполнено за локальный день
+    proj_weekly    — то же за неделю
+
+План за день считается по набору напоминаний на конец этого дня, так что
+удаление или правка напоминания не переписывает прошлые дни. День — локальный
+в зоне пользователя на момент события (timezone_changed её меняет).
+
+Реплеер идёт от checkpoint (id последнего учтённого события в bot_state):
+
+    python -m src.projections catchup     # дочитать новые события
+    python -m src.projections rebuild     # с нуля по всему журналу
+    python -m src.projections bench --users 1000 --days 365
+
+Одновременно должен работать один реплеер: в боте это job "projections",
+rebuild из консоли лучше запускать при остановленном боте. Если checkpoint
+всё же сдвинул кто-то другой, save_projection ничего не пишет, а catch_up
+падает с CheckpointMoved — следующий проход начнёт с нового checkpoint.
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+import argparse
+import json
+import logging
+import random
+import sys
+import time
+
+import pytz
+
+from .config import TIMEZONE
+from .timezones import get_tz
+from .db import (
+    init_db, get_events, get_state, load_projection_users, get_proj_users_to_close,
+    save_projection, reset_projections
+)
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_KEY = "projections_last_event"
+RU_DAYS = {'пн': 0, 'вт': 1, 'ср': 2, 'чт': 3, 'пт': 4, 'сб': 5, 'вс': 6}
+
+
+def _weekdays(reminder_type: str, days: str | None) -> list[int]:
+    if reminder_type == "everyday":
+        return list(range(7))
+    if reminder_type == "days":
+        return [RU_DAYS[d.strip()] for d in (days or "").split(",") if d.strip() in RU_DAYS]
+    return []
+
+
+class Projector:
+    """
+    Состояние проекций в памяти. apply() — одно событие, flush() — накопленные
+    изменения для save_projection. Счётчики дней/недель копятся как дельты,
+    поэтому работают и при полной пересборке, и при догоне.
+    """
+
+    def __init__(self, tz_str: str = TIMEZONE, loader=None):
+        self.tz = get_tz(tz_str)        # для пользователей без своей зоны
+        self.loader = loader            # loader(user_ids) -> (reminders, {uid: planned_through}, {uid: tz}); None — пустая БД
+        self.reminders: dict[int, dict] = {}
+        self.plan: dict[int, list[int]] = {}          # user_id -> напоминаний на каждый день недели
+        self.planned_through: dict[int, date | None] = {}
+        self.zones: dict[int, str | None] = {}        # user_id -> users.timezone на текущем событии
+        self.daily = defaultdict(lambda: [0, 0, 0])   # (user_id, day) -> [planned, sent, done]
+        self.weekly = defaultdict(lambda: [0, 0, 0])  # (user_id, week_start) -> ...
+        self._dirty_reminders: set[int] = set()
+        self._dirty_users: set[int] = set()
+        self._offsets: dict[tuple[str | None, datetime], timedelta] = {}
+
+    # ---------- состояние пользователей ----------
+
+    def ensure_loaded(self, user_ids) -> None:
+        missing = [uid for uid in user_ids if uid not in self.plan]
+        if not missing:
+            return
+        for uid in missing:
+            self.plan[uid] = [0] * 7
+            self.planned_through[uid] = None
+            self.zones[uid] = None
+        if self.loader is None:
+            return
+        reminders, through, zones = self.loader(missing)
+        self.planned_through.update(through)
+        self.zones.update(zones)
+        for r in reminders:
+            self.reminders[r["reminder_id"]] = r
+            self._plan_add(r, +1)
+
+    def _plan_add(self, r: dict, sign: int) -> None:
+        if not r["is_active"] or r["deleted"]:
+            return
+        counts = self.plan[r["user_id"]]
+        for wd in _weekdays(r["reminder_type"], r["days"]):
+            counts[wd] += sign
+
+    def local_day(self, at_utc: datetime, zone: str | None = None) -> date:
+        # смещение зоны кэшируем по часу UTC: событий много, а переходы — на границе часа
+        hour = at_utc.replace(minute=0, second=0, microsecond=0)
+        offset = self._offsets.get((zone, hour))
+        if offset is None:
+            if len(self._offsets) > 100_000:
+                self._offsets.clear()
+            tz = get_tz(zone) if zone else self.tz
+            offset = self._offsets[(zone, hour)] = pytz.utc.localize(hour).astimezone(tz).utcoffset()
+        return (at_utc + offset).date()
+
+    def yesterday(self, user_id: int) -> date:
+        """Вчерашний локальный день пользователя — по него начисляется план."""
+        zone = self.zones.get(user_id)
+        return datetime.now(get_tz(zone) if zone else self.tz).date() - timedelta(days=1)
+
+    def advance(self, user_id: int, through: date) -> None:
+        """Начислить план за дни (planned_through, through] по текущему набору напоминаний."""
+        last = self.planned_through.get(user_id)
+        if last is None or last >= through:
+            return
+        counts = self.plan[user_id]
+        if any(counts):
+            d = last + timedelta(days=1)
+            while d <= through:
+                n = counts[d.weekday()]
+                if n:
+                    self.daily[(user_id, d)][0] += n
+                    self.weekly[(user_id, d - timedelta(days=d.weekday()))][0] += n
+                d += timedelta(days=1)
+        self.planned_through[user_id] = through
+        self._dirty_users.add(user_id)
+
+    def _count(self, user_id: int, day: date, idx: int) -> None:
+        self.daily[(user_id, day)][idx] += 1
+        self.weekly[(user_id, day - timedelta(days=day.weekday()))][idx] += 1
+
+    # ---------- события ----------
+
+    def apply(self, ev: tuple) -> None:
+        _, type_, user_id, reminder_id, at, data = ev
+        r = self.reminders.get(reminder_id) if reminder_id is not None else None
+        if user_id is None:
+            user_id = r["user_id"] if r else None
+        if user_id is None:
+            return
+        if user_id not in self.plan:
+            self.ensure_loaded((user_id,))
+        if r is None and reminder_id is not None:
+            r = self.reminders.get(reminder_id)
+
+        day = self.local_day(at, self.zones[user_id])
+        # дни до события закрываются по набору напоминаний, действовавшему до него
+        self.advance(user_id, day - timedelta(days=1))
+        if self.planned_through[user_id] is None:
+            self.planned_through[user_id] = day - timedelta(days=1)
+            self._dirty_users.add(user_id)
+
+        if type_ == "reminder_created":
+            payload = json.loads(data) if data else {}
+            r = {
+                "reminder_id": reminder_id, "user_id": user_id,
+                "reminder_type": payload.get("reminder_type", "once"),
+                "time": payload.get("time", "00:00"), "days": payload.get("days"),
+                "text": payload.get("text", ""), "is_active": True, "deleted": False,
+                "created_at": at,
+            }
+            self.reminders[reminder_id] = r
+            self._plan_add(r, +1)
+        elif type_ == "workout_completed":
+            self._count(user_id, day, 2)
+            return
+        elif type_ == "timezone_changed":
+            # дни до события уже закрыты в старой зоне, дальше считаем в новой
+            payload = json.loads(data) if data else {}
+            self.zones[user_id] = payload.get("tz")
+            self._dirty_users.add(user_id)
+            return
+        elif r is None:
+            return
+        elif type_ == "reminder_sent":
+            self._count(user_id, day, 1)
+            return
+        elif type_ == "reminder_renamed":
+            payload = json.loads(data) if data else {}
+            r["text"] = payload.get("text", r["text"])
+        elif type_ == "reminder_deactivated":
+            self._plan_add(r, -1)
+            r["is_active"] = False
+        elif type_ == "reminder_deleted":
+            self._plan_add(r, -1)
+            r["deleted"] = True
+        else:
+            return
+        self._dirty_reminders.add(reminder_id)
+
+    def flush(self) -> dict:
+        out = {
+            "reminders": [self.reminders[rid] for rid in self._dirty_reminders],
+            "users": {uid: (self.planned_through[uid], self.zones[uid]) for uid in self._dirty_users},
+            "daily": dict(self.daily),
+            "weekly": dict(self.weekly),
+        }
+        self._dirty_reminders.clear()
+        self._dirty_users.clear()
+        self.daily.clear()
+        self.weekly.clear()
+        return out
+
+
+class CheckpointMoved(RuntimeError):
+    """checkpoint в БД сдвинул другой реплеер — наши дельты посчитаны бы дважды."""
+
+
+def _save(p: Projector, expected: int, checkpoint: int) -> None:
+    ch = p.flush()
+    if not save_projection(ch["reminders"], ch["users"], ch["daily"], ch["weekly"],
+                           CHECKPOINT_KEY, checkpoint, expected):
+        raise CheckpointMoved(f"{CHECKPOINT_KEY} is no longer {expected}")
+
+
+def catch_up(batch: int = 5000, tz_str: str = TIMEZONE, fresh: bool = False,
+             close_through: date | None = None) -> int:
+    """
+    Дочитать события после checkpoint и начислить план по вчерашний день
+    (в зоне каждого пользователя; close_through — один день для всех).
+    fresh — проекции пусты (после reset), состояние пользователей из БД не читаем.
+    Возвращает число обработанных событий.
+    """
+    checkpoint = 0 if fresh else int(get_state(CHECKPOINT_KEY) or 0)
+    p = Projector(tz_str, loader=None if fresh else load_projection_users)
+
+    n = 0
+    while True:
+        events = get_events(checkpoint, batch)
+        if not events:
+            break
+        # состояние всей пачки — одним запросом
+        p.ensure_loaded({ev[2] for ev in events if ev[2] is not None})
+        for ev in events:
+            p.apply(ev)
+        _save(p, checkpoint, events[-1][0])
+        checkpoint = events[-1][0]
+        n += len(events)
+
+    # выборка — по самой восточной зоне (UTC+14), advance сам не зайдёт дальше вчера пользователя
+    bound = close_through or (datetime.utcnow() + timedelta(hours=14)).date() - timedelta(days=1)
+    after = 0
+    while True:
+        ids = get_proj_users_to_close(after, batch, bound)
+        if not ids:
+            break
+        after = ids[-1]
+        p.loader = load_projection_users
+        p.ensure_loaded(ids)
+        for uid in ids:
+            p.advance(uid, close_through or p.yesterday(uid))
+        _save(p, checkpoint, checkpoint)
+
+    if n:
+        logger.info(f"Projections caught up: {n} events, checkpoint {checkpoint}")
+    return n
+
+
+def rebuild(batch: int = 5000, tz_str: str = TIMEZONE) -> int:
+    """Пересобрать проекции с нуля по всему журналу."""
+    reset_projections(CHECKPOINT_KEY)
+    return catch_up(batch, tz_str, fresh=True)
+
+
+# ---------- бенчмарк ----------
+
+def synthetic_events(users: int, days: int, seed: int = 1) -> list[tuple]:
+    """Год «типичной» активности: 3–5 напоминаний, отправки, выполнения, правки."""
+    rnd = random.Random(seed)
+    start = datetime(2025, 1, 1)
+    events = []
+    rid = 0
+    for uid in range(1, users + 1):
+        mine = []
+        for _ in range(rnd.randint(3, 5)):
+            rid += 1
+            kind = rnd.choice(["everyday", "days", "days"])
+            payload = json.dumps({"reminder_type": kind, "time": "18:00",
+                                  "days": "пн,ср,пт" if kind == "days" else None, "text": "Тренировка"},
+                                 ensure_ascii=False)
+            at = start + timedelta(days=rnd.randint(0, 30), minutes=rnd.randint(0, 1439))
+            events.append(("reminder_created", uid, rid, at, payload))
+            mine.append((rid, at))
+        for d in range(days):
+            base = start + timedelta(days=d, hours=12)
+            for r, created in mine:
+                if base < created or rnd.random() < 0.3:
+                    continue
+                events.append(("reminder_sent", uid, r, base, None))
+                if rnd.random() < 0.6:
+                    events.append(("workout_completed", uid, r, base + timedelta(minutes=30), None))
+        r, created = rnd.choice(mine)
+        events.append(("reminder_renamed", uid, r, created + timedelta(days=40), '{"text": "Бег"}'))
+        r, created = rnd.choice(mine)
+        events.append(("reminder_deleted", uid, r, created + timedelta(days=200), None))
+    events.sort(key=lambda e: e[3])
+    return [(i, *e) for i, e in enumerate(events, start=1)]
+
+
+def bench(users: int, days: int, tz_str: str = TIMEZONE) -> dict:
+    t0 = time.perf_counter()
+    events = synthetic_events(users, days)
+    t1 = time.perf_counter()
+    p = Projector(tz_str)
+    for ev in events:
+        p.apply(ev)
+    last = max(ev[4] for ev in events).date()
+    for uid in list(p.plan):
+        p.advance(uid, last)
+    t2 = time.perf_counter()
+    out = p.flush()
+    return {
+        "events": len(events), "generate_s": t1 - t0, "replay_s": t2 - t1,
+        "events_per_s": len(events) / (t2 - t1) if t2 > t1 else 0.0,
+        "daily_rows": len(out["daily"]), "weekly_rows": len(out["weekly"]),
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Event-log projections")
+    parser.add_argument("command", choices=["catchup", "rebuild", "bench"])
+    parser.add_argument("--batch", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=1000, help="bench: users")
+    parser.add_argument("--days", type=int, default=365, help="bench: days of history")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.command == "bench":
+        r = bench(args.users, args.days)
+        print(f"Событий: {r['events']}, генерация {r['generate_s']:.1f} с, "
+              f"реплей {r['replay_s']:.2f} с ({r['events_per_s']:,.0f} соб./с), "
+              f"строк: {r['daily_rows']} дневных, {r['weekly_rows']} недельных")
+        return 0
+
+    init_db()
+    t0 = time.perf_counter()
+    n = rebuild(args.batch) if args.command == "rebuild" else catch_up(args.batch)
+    print(f"Обработано событий: {n} за {time.perf_counter() - t0:.1f} с")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""
+Учёт SQL-запросов по апдейтам.
+
+На движок вешаются события SQLAlchemy, которые считают выражения и время
+в БД для текущего апдейта (через contextvar). Middleware в middlewares.py
+открывает `track(command)` на каждый апдейт, здесь же копятся агрегаты
+по командам и пишется лог медленных апдейтов.
+
+Для тестов есть `assert_max_queries(n)`:
+
+    with assert_max_queries(3):
+        get_active_reminders(user_id=1)
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Generator
+import logging
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class UpdateStats:
+    command: str
+    statements: int = 0
+    db_time: float = 0.0      # секунды внутри cursor.execute
+    sessions: int = 0
+    statements_sql: list[str] | None = None  # заполняется только в assert_max_queries
+
+
+@dataclass(slots=True)
+class CommandAggregate:
+    updates: int = 0
+    statements: int = 0
+    db_time: float = 0.0
+    sessions: int = 0
+    wall_time: float = 0.0
+    max_statements: int = 0
+    slow_updates: int = 0
+
+    def as_dict(self) -> dict:
+        n = self.updates or 1
+        return {
+            "updates": self.updates,
+            "statements": self.statements,
+            "avg_statements": self.statements / n,
+            "max_statements": self.max_statements,
+            "sessions": self.sessions,
+            "avg_db_ms": 1000 * self.db_time / n,
+            "avg_wall_ms": 1000 * self.wall_time / n,
+            "slow_updates": self.slow_updates,
+        }
+
+
+_current: ContextVar[UpdateStats | None] = ContextVar("querystats_current", default=None)
+_aggregates: dict[str, CommandAggregate] = {}
+
+
+def install(engine: Engine) -> None:
+    """Подписаться на события движка (вызывается один раз из db.py)."""
+    if getattr(engine, "_querystats_installed", False):
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None:
+            conn.info.setdefault("querystats_t0", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        stats = _current.get()
+        if stats is None:
+            return
+        stack = conn.info.get("querystats_t0")
+        if stack:
+            stats.db_time += time.perf_counter() - stack.pop()
+        stats.statements += 1
+        if stats.statements_sql is not None:
+            stats.statements_sql.append(statement)
+
+    engine._querystats_installed = True
+
+
+def note_session() -> None:
+    """Отметить открытие сессии (зовётся из get_db)."""
+    stats = _current.get()
+    if stats is not None:
+        stats.sessions += 1
+
+
+@contextmanager
+def track(command: str, slow_ms: float | None = None) -> Generator[UpdateStats, None, None]:
+    """Считать запросы внутри блока и добавить их в агрегаты `command`."""
+    stats = UpdateStats(command=command)
+    token = _current.set(stats)
+    t0 = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+        wall = time.perf_counter() - t0
+        agg = _aggregates.setdefault(command, CommandAggregate())
+        agg.updates += 1
+        agg.statements += stats.statements
+        agg.db_time += stats.db_time
+        agg.sessions += stats.sessions
+        agg.wall_time += wall
+        agg.max_statements = max(agg.max_statements, stats.statements)
+        if slow_ms is not None and wall * 1000 >= slow_ms:
+            agg.slow_updates += 1
+            logger.warning(
+                f"Slow update {command}: {wall * 1000:.0f} ms, "
+                f"{stats.statements} statements, {stats.db_time * 1000:.0f} ms in DB, "
+                f"{stats.sessions} sessions"
+            )
+
+
+def get_aggregates() -> dict[str, dict]:
+    """Снимок агрегатов по командам: {command: {...}}."""
+    return {cmd: agg.as_dict() for cmd, agg in _aggregates.items()}
+
+
+def reset_aggregates() -> None:
+    _aggregates.clear()
+
+
+@contextmanager
+def assert_max_queries(limit: int) -> Generator[UpdateStats, None, None]:
+    """Упасть с AssertionError, если внутри блока было больше `limit` SQL-выражений."""
+    stats = UpdateStats(command="assert_max_queries", statements_sql=[])
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+    if stats.statements > limit:
+        listing = "\n".join(f"  {i}. {sql}" for i, sql in enumerate(stats.statements_sql, 1))
+        raise AssertionError(
+            f"Expected at most {limit} queries, got {stats.statements}:\n{listing}"
+        )
@@ -0,0 +1,112 @@
+"""
+Token bucket, ограниченный по памяти реестр бакетов и async-лимитер отправки.
+"""
+from collections import OrderedDict
+from typing import Hashable
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Классический token bucket: `rate` токенов в секунду, максимум `capacity`."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated", "warned")
+
+    def __init__(self, rate: float, capacity: float, now: float | None = None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic() if now is None else now
+        self.warned = False  # уже предупредили пользователя в этом окне
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def try_acquire(self, now: float | None = None, cost: float = 1.0) -> bool:
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            self.warned = False
+            return True
+        return False
+
+    def delay(self, now: float | None = None, cost: float = 1.0) -> float:
+        """Сколько секунд ждать, пока наберётся `cost` токенов."""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+
+class BucketRegistry:
+    """
+    Бакеты по ключу с ограничением по памяти.
+
+    Хранятся в OrderedDict в порядке последнего обращения: бакеты, к которым
+    не обращались дольше `idle_ttl`, и всё сверх `max_size` выкидываются
+    с головы. Выкинутый бакет эквивалентен полному — пользователь долго молчал.
+    """
+
+    def __init__(self, rate: float, capacity: float,
+                 max_size: int = 10_000, idle_ttl: float = 600.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self._buckets: OrderedDict[Hashable, TokenBucket] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def get(self, key: Hashable, now: float | None = None) -> TokenBucket:
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.capacity, now)
+            self._buckets[key] = bucket
+        else:
+            self._buckets.move_to_end(key)
+            bucket._refill(now)
+        self._evict(now)
+        return bucket
+
+    def _evict(self, now: float) -> None:
+        buckets = self._buckets
+        while len(buckets) > self.max_size:
+            buckets.popitem(last=False)
+        while buckets:
+            key, oldest = next(iter(buckets.items()))
+            if now - oldest.updated < self.idle_ttl:
+                break
+            del buckets[key]
+
+
+class AsyncRateLimiter:
+    """
+    Общий лимит для исходящих запросов: ждём, пока в бакете появится токен.
+
+    `pause(seconds)` сдвигает всех ожидающих (например, после 429 от Telegram).
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self._bucket = TokenBucket(rate, burst)
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                if self._bucket.try_acquire(now):
+                    return
+                await asyncio.sleep(self._bucket.delay(now))
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
@@ -2,74 +2,202 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.jobstores.memory import MemoryJobStore
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.date import DateTrigger
-from datetime import datetime
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import asyncio
+import os
 import pytz
 import logging
+import time
 
-from .config import TIMEZONE
-from .db import get_active_reminders, set_reminder_inactive
+from .config import (
+    TIMEZONE, COALESCE_REMINDERS, COALESCE_WINDOW, ONCE_HORIZON_HOURS,
+    SNOOZE_SNAPSHOT, SNOOZE_MAX, USE_OUTBOX, SCHEDULE_SNAPSHOT, SCHEDULE_SNAPSHOT_MINUTES
+)
+from .coalesce import ReminderCoalescer, DueReminder
+from .snooze import SnoozeTimers, SnoozeEntry
+from .timezones import get_tz, tz_name, trigger_tz
+from .profiler import timed_job, measure
+from .loadplan import planner
+from . import tenants, warmstart
+from .db import (
+    get_active_reminders, record_reminders_sent, set_reminder_job_ids,
+    get_pending_once_reminders, enqueue_reminder_message, get_reminders_by_ids,
+    get_last_event_id, get_event_at, get_changes_since
+)
 
 logger = logging.getLogger(__name__)
 
-scheduler = AsyncIOScheduler(
+# как часто подгружать разовые, подошедшие к горизонту
+ONCE_LOAD_INTERVAL_MINUTES = 30
+
+# варианты кнопки «отложить», минуты
+SNOOZE_MINUTES = (10, 30)
+
+class _TimedScheduler(AsyncIOScheduler):
+    """Каждый job замеряется (wall/CPU в profiler.timings)."""
+
+    def add_job(self, func, *args, **kwargs):
+        return super().add_job(timed_job(func), *args, **kwargs)
+
+
+scheduler = _TimedScheduler(
     jobstores={'default': MemoryJobStore()},
     timezone=pytz.timezone(TIMEZONE)
 )
 
-# Bot instance to send messages
-bot_instance = None
+def reminder_keyboard(items: list[DueReminder]):
+    """One '✅' button per reminder; callback_data stays done_{id}."""
+    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
+    if len(items) == 1:
+        rows = [[
+            InlineKeyboardButton(text="✅ Выполнено", callback_data=f"done_{items[0].reminder_id}")
+        ]]
+    else:
+        rows = [
+            [InlineKeyboardButton(text=f"✅ {_short(it.text)}", callback_data=f"done_{it.reminder_id}")]
+            for it in items
+        ]
+    # откладывается всё, что осталось неотмеченным в сообщении
+    rows.append([
+        InlineKeyboardButton(text=f"⏰ +{m} мин", callback_data=f"snooze_{m}")
+        for m in SNOOZE_MINUTES
+    ])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
 
-def set_bot_instance(bot):
-    """Store aiogram Bot instance for sending messages."""
-    global bot_instance
-    bot_instance = bot
 
+def _short(text: str, limit: int = 32) -> str:
+    return text if len(text) <= limit else text[:limit - 1] + "…"
 
-async def send_reminder(user_telegram_id: int, reminder_id: int, text: str,
-                        reminder_type: str | None = None):
-    """Send message with 'Done' button. For once-reminders mark them inactive."""
-    if not bot_instance:
-        logger.error("Bot instance not set")
-        return
-    try:
-        from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
-        kb = InlineKeyboardMarkup(inline_keyboard=[[
-            InlineKeyboardButton(text="✅ Выполнено", callback_data=f"done_{reminder_id}")
-        ]])
+def reminder_message_text(items: list[DueReminder]) -> str:
+    if len(items) == 1:
+        return f"💪 Время тренировки!\n\n{items[0].text}"
+    body = "\n".join(f"• {it.text}" for it in items)
+    return f"💪 Время тренировки!\n\n{body}"
 
-        await bot_instance.send_message(
+
+async def deliver_reminders(user_telegram_id: int, items: list[DueReminder], tenant: str | None = None):
+    """
+    Send one message (via the tenant's bot) for one or several due reminders. Once-reminders become inactive.
+    Snoozed re-sends get no second reminder_sent event (the projections would count the reminder twice).
+    """
+    ids = [it.reminder_id for it in items]
+    sent_ids = [it.reminder_id for it in items if not it.snoozed]
+    once_ids = [it.reminder_id for it in items if it.reminder_type == "once"]
+    if USE_OUTBOX:
+        # отправит python -m src.sender; здесь только запись в outbox
+        try:
+            markup = reminder_keyboard(items).model_dump_json(exclude_none=True)
+            msg_id = enqueue_reminder_message(user_telegram_id, reminder_message_text(items), markup,
+                                              sent_ids, once_ids, tenant=tenant)
+            logger.info(f"Queued reminders {ids} for user {user_telegram_id} (outbox {msg_id})")
+        except Exception as e:
+            logger.error(f"Failed to queue reminders {ids} for user {user_telegram_id}: {e}")
+        return
+    t = tenants.get(tenant)
+    if not t:
+        logger.error(f"Bot {tenant} is not running, reminders {ids} not sent")
+        return
+    try:
+        await t.bot.send_message(
             chat_id=user_telegram_id,
-            text=f"💪 Время тренировки!\n\n{text}",
-            reply_markup=kb
+            text=reminder_message_text(items),
+            reply_markup=reminder_keyboard(items)
         )
 
         # ВАЖНО: одноразовые помечаем неактивными (оставляем запись для колбэка)
-        if reminder_type == "once":
-            set_reminder_inactive(reminder_id)
+        record_reminders_sent(sent_ids, once_ids)
+        t.stats.reminders += 1
 
-        logger.info(f"Sent reminder {reminder_id} to user {user_telegram_id}")
+        logger.info(f"Sent reminders {ids} to user {user_telegram_id} ({t.name})")
     except Exception as e:
-        logger.error(f"Failed to send reminder {reminder_id} to user {user_telegram_id}: {e}")
+        t.stats.failed += 1
+        logger.error(f"Failed to send reminders {ids} to user {user_telegram_id} ({t.name}): {e}")
+
+
+async def _deliver_measured(user_telegram_id: int, items: list[DueReminder], tenant: str | None = None):
+    await measure("deliver_reminders", deliver_reminders(user_telegram_id, items, tenant))
+
+
+coalescer = ReminderCoalescer(_deliver_measured, window=COALESCE_WINDOW)
+
+
+async def _fire_snoozed(entry: SnoozeEntry):
+    await send_reminder(entry.chat_id, entry.reminder_id, entry.text, entry.reminder_type, entry.tenant,
+                        snoozed=True)
+
+
+snoozes = SnoozeTimers(_fire_snoozed, snapshot_path=SNOOZE_SNAPSHOT, max_size=SNOOZE_MAX)
+
+
+def snooze_reminders(user_telegram_id: int, reminders, minutes: int) -> int:
+    """Re-send given reminders (ReminderView) in `minutes`. Returns how many were snoozed."""
+    n = 0
+    for r in reminders:
+        entry = SnoozeEntry(user_telegram_id, r.id, r.text, r.reminder_type, r.tenant)
+        if snoozes.add(entry, minutes * 60):
+            n += 1
+    return n
+
+
+async def send_reminder(user_telegram_id: int, reminder_id: int, text: str,
+                        reminder_type: str | None = None, tenant: str | None = None,
+                        snoozed: bool = False):
+    """Send message with 'Done' button (merged with other reminders due this minute)."""
+    item = DueReminder(reminder_id, text, reminder_type, snoozed)
+    if COALESCE_REMINDERS:
+        await coalescer.add(user_telegram_id, item, tenant)
+    else:
+        await deliver_reminders(user_telegram_id, [item], tenant)
+
+
+async def _send_at(delay: float, user_telegram_id: int, reminder_id: int, text: str,
+                   reminder_type: str | None, tenant: str | None = None):
+    if delay > 0:
+        await asyncio.sleep(delay)
+    await send_reminder(user_telegram_id, reminder_id, text, reminder_type, tenant)
+
+
+async def send_planned(user_telegram_id: int, reminder_id: int, text: str,
+                       reminder_type: str | None = None, tenant: str | None = None):
+    """Разовое по расписанию: со сдвигом пользователя внутри окна своей минуты (loadplan)."""
+    delay, = planner.offsets([user_telegram_id])
+    async with planner.draining():
+        await _send_at(delay, user_telegram_id, reminder_id, text, reminder_type, tenant)
 
 
 def schedule_once_reminder(reminder_id: int, user_telegram_id: int,
-                           time_str: str, text: str) -> str | None:
-    """Plan one-time reminder for today (if time not passed)."""
+                           time_str: str, text: str, fire_at: datetime | None = None,
+                           tz: str | None = None, tenant: str | None = None) -> str | None:
+    """
+    Plan one-time reminder at fire_at (naive UTC) or, without it, today at time_str in tz.
+    Reminders further than ONCE_HORIZON_HOURS are not put into the scheduler yet:
+    load_upcoming_once() picks them up when they approach.
+    tenant — бот пользователя (по умолчанию — бот текущего апдейта).
+    """
+    tenant = tenant or tenants.current()
     try:
-        hour, minute = map(int, time_str.split(':'))
-        tz = pytz.timezone(TIMEZONE)
-        now = datetime.now(tz)
-        target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        job_id = f"once_{reminder_id}_{user_telegram_id}"
+        if fire_at is not None:
+            target = pytz.utc.localize(fire_at)
+            now = datetime.now(pytz.utc)
+        else:
+            hour, minute = map(int, time_str.split(':'))
+            now = datetime.now(get_tz(tz))
+            target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
         if target <= now:
             return None
 
-        job_id = f"once_{reminder_id}_{user_telegram_id}"
+        if target - now > timedelta(hours=ONCE_HORIZON_HOURS):
+            logger.info(f"Once reminder {reminder_id} at {target} is beyond horizon, deferred")
+            return job_id
+
         scheduler.add_job(
-            send_reminder,
+            send_planned,
             trigger=DateTrigger(run_date=target),
-            args=[user_telegram_id, reminder_id, text, "once"],
+            args=[user_telegram_id, reminder_id, text, "once", tenant],
             id=job_id,
             replace_existing=True
         )
@@ -80,67 +208,212 @@ def schedule_once_reminder(reminder_id: int, user_telegram_id: int,
         return None
 
 
+def load_upcoming_once() -> int:
+    """Put once-reminders due within the horizon into the scheduler (one range query)."""
+    now = datetime.utcnow()
+    upcoming = get_pending_once_reminders(now, now + timedelta(hours=ONCE_HORIZON_HOURS))
+    for r in upcoming:
+        schedule_once_reminder(r.id, r.tg_id, r.time, r.text, fire_at=r.fire_at, tz=r.tz, tenant=r.tenant)
+    if upcoming:
+        logger.info(f"Loaded {len(upcoming)} upcoming once reminders")
+    return len(upcoming)
+
+
+# ---------- повторяющиеся: общие корзины (зона, HH:MM) ----------
+#
+# Вместо CronTrigger на каждое напоминание — один job на пару (зона, время):
+# все «каждый день в 18:00 по Москве» срабатывают одним job'ом, который
+# сам отбирает тех, у кого сегодня нужный день недели. Число job'ов
+# ограничено числом (зона, минута), а не числом напоминаний. Переходы на
+# летнее/зимнее время обрабатывает CronTrigger в зоне корзины. Корзины общие
+# для всех ботов процесса: бот пользователя хранится в участнике.
+
+@dataclass(slots=True)
+class BucketMember:
+    tg_id: int
+    text: str
+    reminder_type: str
+    weekdays: frozenset[int] | None      # None — каждый день
+    tenant: str | None = None
+
+
+# (зона, 'HH:MM') -> {reminder_id: BucketMember}
+buckets: dict[tuple[str, str], dict[int, BucketMember]] = {}
+_bucket_of: dict[int, tuple[str, str]] = {}
+
+# корзины, ещё не разобранные из снимка (warmstart.py): ключ -> номер в снимке
+_snapshot: warmstart.Snapshot | None = None
+_packed: dict[tuple[str, str], int] = {}
+_dirty = False
+
+RU_DAYS = {'пн': 0, 'вт': 1, 'ср': 2, 'чт': 3, 'пт': 4, 'сб': 5, 'вс': 6}
+
+
+def _bucket_job_id(key: tuple[str, str]) -> str:
+    return f"bucket_{key[0]}_{key[1]}"
+
+
+def _members(key: tuple[str, str]) -> dict[int, BucketMember] | None:
+    """Участники корзины; корзину из снимка разбираем при первом обращении."""
+    members = buckets.get(key)
+    if members is None and key in _packed:
+        members = buckets[key] = {}
+        for m in _snapshot.read(_packed.pop(key)):
+            members[m.reminder_id] = BucketMember(m.tg_id, m.text, m.reminder_type, m.weekdays, m.tenant)
+            _bucket_of[m.reminder_id] = key
+    return members
+
+
+def _packed_key_of(reminder_id: int) -> tuple[str, str] | None:
+    """Корзина напоминания по индексу снимка — если она ещё не разобрана."""
+    if not _packed:
+        return None
+    no = _snapshot.bucket_of(reminder_id)
+    if no is None:
+        return None
+    key = _snapshot.keys[no]
+    return key if _packed.get(key) == no else None
+
+
+def _add_bucket_job(key: tuple[str, str]) -> None:
+    hour, minute = map(int, key[1].split(':'))
+    scheduler.add_job(
+        fire_bucket,
+        trigger=CronTrigger(hour=hour, minute=minute, timezone=trigger_tz(key[0])),
+        args=[key],
+        id=_bucket_job_id(key),
+        replace_existing=True
+    )
+
+
+async def fire_bucket(key: tuple[str, str]):
+    """Срабатывание корзины: отправить всем, у кого сегодня (в зоне корзины) подходящий день."""
+    members = _members(key)
+    if not members:
+        return
+    weekday = datetime.now(get_tz(key[0])).weekday()
+    due = [(rid, m) for rid, m in members.items() if m.weekdays is None or weekday in m.weekdays]
+    if not due:
+        return
+    # пиковые минуты растягиваются на окно, у каждого пользователя свой постоянный сдвиг
+    offsets = planner.offsets([m.tg_id for _, m in due])
+    logger.info(f"Bucket {key[0]} {key[1]}: {len(due)} reminders due, spread over {max(offsets):.0f}s")
+    async with planner.draining():
+        await asyncio.gather(*(
+            _send_at(delay, m.tg_id, rid, m.text, m.reminder_type, m.tenant)
+            for (rid, m), delay in zip(due, offsets)
+        ))
+
+
+def add_to_bucket(reminder_id: int, member: BucketMember, time_str: str, tz: str | None = None) -> None:
+    global _dirty
+    hour, minute = map(int, time_str.split(':'))
+    key = (tz_name(tz), f"{hour:02d}:{minute:02d}")
+    remove_from_bucket(reminder_id)
+    members = _members(key)
+    if members is None:
+        members = buckets[key] = {}
+        _add_bucket_job(key)
+    members[reminder_id] = member
+    _bucket_of[reminder_id] = key
+    _dirty = True
+
+
+def remove_from_bucket(reminder_id: int) -> bool:
+    global _dirty
+    key = _bucket_of.pop(reminder_id, None)
+    if key is None:
+        key = _packed_key_of(reminder_id)
+        if key is None:
+            return False
+        _members(key)
+        _bucket_of.pop(reminder_id, None)
+    _dirty = True
+    members = buckets.get(key, {})
+    members.pop(reminder_id, None)
+    if not members:
+        buckets.pop(key, None)
+        if scheduler.get_job(_bucket_job_id(key)):
+            scheduler.remove_job(_bucket_job_id(key))
+    return True
+
+
+def _weekday_set(days_any) -> frozenset[int]:
+    """'пн,ср,пт' или list[int] (0=пн..6=вс)."""
+    if isinstance(days_any, str):
+        days = [d.strip().lower() for d in days_any.split(',') if d.strip()]
+        return frozenset(RU_DAYS[d] for d in days if d in RU_DAYS)
+    return frozenset(int(x) for x in days_any)
+
+
 def schedule_everyday_reminder(reminder_id: int, user_telegram_id: int,
-                               time_str: str, text: str) -> str | None:
-    """Plan daily reminder."""
+                               time_str: str, text: str, tz: str | None = None,
+                               tenant: str | None = None) -> str | None:
+    """Plan daily reminder (tz — зона пользователя)."""
     try:
-        hour, minute = map(int, time_str.split(':'))
-        job_id = f"everyday_{reminder_id}_{user_telegram_id}"
-        scheduler.add_job(
-            send_reminder,
-            trigger=CronTrigger(hour=hour, minute=minute, timezone=TIMEZONE),
-            args=[user_telegram_id, reminder_id, text, "everyday"],
-            id=job_id,
-            replace_existing=True
-        )
-        logger.info(f"Scheduled everyday reminder {reminder_id} at {time_str}")
-        return job_id
+        member = BucketMember(user_telegram_id, text, "everyday", None, tenant or tenants.current())
+        add_to_bucket(reminder_id, member, time_str, tz)
+        logger.info(f"Scheduled everyday reminder {reminder_id} at {time_str} {tz_name(tz)}")
+        return f"everyday_{reminder_id}_{user_telegram_id}"
     except Exception as e:
         logger.error(f"Failed to schedule everyday reminder {reminder_id}: {e}")
         return None
 
 
 def schedule_days_reminder(reminder_id: int, user_telegram_id: int,
-                           time_str: str, days_any, text: str) -> str | None:
+                           time_str: str, days_any, text: str, tz: str | None = None,
+                           tenant: str | None = None) -> str | None:
     """
     Plan reminder for chosen weekdays.
     days_any: 'пн,ср,пт' ИЛИ list[int] where 0=пн..6=вс.
     """
     try:
-        hour, minute = map(int, time_str.split(':'))
-
-        mapping_str_to_num = {'пн': 0, 'вт': 1, 'ср': 2, 'чт': 3, 'пт': 4, 'сб': 5, 'вс': 6}
-        if isinstance(days_any, str):
-            days = [d.strip().lower() for d in days_any.split(',') if d.strip()]
-            day_numbers = [mapping_str_to_num[d] for d in days if d in mapping_str_to_num]
-        else:
-            day_numbers = sorted({int(x) for x in days_any})
-
-        if not day_numbers:
+        weekdays = _weekday_set(days_any)
+        if not weekdays:
             return None
-
-        day_of_week = ",".join(map(str, day_numbers))
-        job_id = f"days_{reminder_id}_{user_telegram_id}"
-
-        scheduler.add_job(
-            send_reminder,
-            trigger=CronTrigger(
-                hour=hour, minute=minute, day_of_week=day_of_week, timezone=TIMEZONE
-            ),
-            args=[user_telegram_id, reminder_id, text, "days"],
-            id=job_id,
-            replace_existing=True
-        )
-        logger.info(f"Scheduled days reminder {reminder_id} for {day_of_week} at {time_str}")
-        return job_id
+        member = BucketMember(user_telegram_id, text, "days", weekdays, tenant or tenants.current())
+        add_to_bucket(reminder_id, member, time_str, tz)
+        logger.info(f"Scheduled days reminder {reminder_id} for {sorted(weekdays)} at {time_str} {tz_name(tz)}")
+        return f"days_{reminder_id}_{user_telegram_id}"
     except Exception as e:
         logger.error(f"Failed to schedule days reminder {reminder_id}: {e}")
         return None
 
 
+def schedule_reminder(reminder_id: int, user_telegram_id: int, reminder_type: str,
+                      time_str: str, text: str, days=None, fire_at=None,
+                      tz: str | None = None, tenant: str | None = None) -> str | None:
+    """Plan reminder of any type."""
+    if reminder_type == "once":
+        return schedule_once_reminder(reminder_id, user_telegram_id, time_str, text, fire_at, tz, tenant)
+    if reminder_type == "everyday":
+        return schedule_everyday_reminder(reminder_id, user_telegram_id, time_str, text, tz, tenant)
+    if reminder_type == "days":
+        return schedule_days_reminder(reminder_id, user_telegram_id, time_str, days, text, tz, tenant)
+    return None
+
+
+def schedule_many(reminder_ids: list[int], user_telegram_id: int, specs, tz: str | None = None,
+                  tenant: str | None = None) -> int:
+    """Plan a batch of new reminders and store their job ids with one UPDATE."""
+    job_ids = {}
+    for rid, sp in zip(reminder_ids, specs):
+        job_id = schedule_reminder(rid, user_telegram_id, sp.reminder_type, sp.time, sp.text,
+                                   sp.days, sp.fire_at, tz, tenant)
+        if job_id:
+            job_ids[rid] = job_id
+    set_reminder_job_ids(job_ids)
+    return len(job_ids)
+
+
 def remove_job(job_id: str):
-    """Unschedule job if exists."""
+    """Unschedule job if exists (повторяющиеся — убрать из корзины)."""
     try:
+        kind, _, rest = job_id.partition("_")
+        if kind in ("everyday", "days"):
+            if remove_from_bucket(int(rest.split("_")[0])):
+                logger.info(f"Removed job {job_id}")
+            return
         if scheduler.get_job(job_id):
             scheduler.remove_job(job_id)
             logger.info(f"Removed job {job_id}")
@@ -148,32 +421,245 @@ def remove_job(job_id: str):
         logger.error(f"Failed to remove job {job_id}: {e}")
 
 
+def _schedule_recurring(r) -> str | None:
+    if r.reminder_type == "everyday":
+        return schedule_everyday_reminder(r.id, r.tg_id, r.time, r.text, r.tz, r.tenant)
+    if r.reminder_type == "days":
+        return schedule_days_reminder(r.id, r.tg_id, r.time, r.days, r.text, r.tz, r.tenant)
+    return None
+
+
+def _restore_recurring() -> int:
+    """Холодный старт: все активные повторяющиеся — из БД в корзины."""
+    job_ids = {}
+    restored = 0
+    for r in get_active_reminders():
+        job_id = _schedule_recurring(r)
+        if job_id:
+            restored += 1
+            if job_id != r.job_id:
+                job_ids[r.id] = job_id
+
+    # job_id пишем одним UPDATE, а не сессией на каждое напоминание
+    set_reminder_job_ids(job_ids)
+    return restored
+
+
 def restore_reminders_from_db():
-    """Reschedule all active reminders on startup (skip past 'once')."""
+    """
+    Reschedule all active reminders on startup (once: only those due within the horizon).
+    Recurring ones come from the schedule snapshot when it is valid, else from the DB.
+    """
     try:
-        reminders = get_active_reminders()
-        restored = 0
-        for r in reminders:
-            job_id = None
-            if r.reminder_type == "everyday":
-                job_id = schedule_everyday_reminder(r.id, r.user.telegram_id, r.time, r.text)
-            elif r.reminder_type == "days":
-                job_id = schedule_days_reminder(r.id, r.user.telegram_id, r.time, r.days, r.text)
-
-            if job_id:
-                from .db import get_db
-                with get_db() as dbs:
-                    db_obj = dbs.query(r.__class__).filter(r.__class__.id == r.id).first()
-                    if db_obj:
-                        db_obj.job_id = job_id
-                        dbs.commit()
-                restored += 1
-
-        logger.info(f"Restored {restored} reminders from database")
+        restored = load_schedule_snapshot()
+        if restored is None:
+            restored = _restore_recurring()
+        restored += load_upcoming_once()
+        scheduler.add_job(
+            load_upcoming_once,
+            trigger="interval",
+            minutes=ONCE_LOAD_INTERVAL_MINUTES,
+            id="load_upcoming_once",
+            replace_existing=True
+        )
+        logger.info(f"Restored {restored} reminders ({len(buckets) + len(_packed)} time buckets)")
     except Exception as e:
         logger.error(f"Failed to restore reminders from database: {e}")
 
 
+# ---------- снимок корзин для быстрого рестарта ----------
+
+# события, после которых корзины надо сверить с БД
+SCHEDULE_EVENTS = ("reminder_created", "reminder_deleted", "reminder_renamed",
+                   "reminder_deactivated", "timezone_changed")
+
+
+def _apply_changes(after_id: int) -> int:
+    """Дочитать напоминания и пользователей, изменившихся после события after_id."""
+    rows = get_changes_since(after_id, SCHEDULE_EVENTS)
+    reminder_ids = {rid for _, rid in rows if rid is not None}
+    user_ids = {uid for uid, rid in rows if rid is None and uid is not None}
+    for rid in reminder_ids:
+        remove_from_bucket(rid)
+    current = get_reminders_by_ids(sorted(reminder_ids), active_only=True)
+    for uid in user_ids:
+        current += get_active_reminders(user_id=uid)
+    for r in current:
+        _schedule_recurring(r)
+    return len(reminder_ids) + len(user_ids)
+
+
+def load_schedule_snapshot(path: str | None = SCHEDULE_SNAPSHOT) -> int | None:
+    """
+    Корзины из снимка (участники — лениво, из mmap) плюс изменения после него.
+    Возвращает число повторяющихся напоминаний; None — снимка нет или он не подходит.
+    """
+    global _snapshot
+    if not path or not os.path.exists(path):
+        return None
+    started = time.perf_counter()
+    try:
+        snap = warmstart.Snapshot(path)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Schedule snapshot {path} is unreadable, full restore: {e}")
+        return None
+    if not snap.matches(TIMEZONE, get_event_at(snap.event_id)):
+        logger.info(f"Schedule snapshot {path} does not match the database, full restore")
+        snap.close()
+        return None
+
+    _snapshot = snap
+    for no, key in enumerate(snap.keys):
+        _packed[key] = no
+        _add_bucket_job(key)
+    changed = _apply_changes(snap.event_id)
+    total = sum(snap.count(no) for no in _packed.values()) + sum(len(m) for m in buckets.values())
+    logger.info(f"Warm start from {path} (saved {snap.saved_at:%Y-%m-%d %H:%M} UTC): "
+                f"{total} reminders in {len(buckets) + len(_packed)} buckets, {changed} changed since, "
+                f"{1000 * (time.perf_counter() - started):.0f} ms")
+    return total
+
+
+async def save_schedule_snapshot(path: str | None = SCHEDULE_SNAPSHOT, force: bool = False) -> int | None:
+    """Сохранить корзины, если они менялись. Запись — в потоке. Возвращает размер файла."""
+    global _dirty
+    if not path or not (_dirty or force):
+        return None
+    event_id = get_last_event_id()
+    if not event_id:
+        return None
+    event_at = get_event_at(event_id)
+    # в цикле — только неглубокие копии, кодирование и запись — в потоке
+    loaded = [(key, list(members.items())) for key, members in buckets.items() if members]
+    packed = list(_packed.items())
+    snap = _snapshot
+    _dirty = False
+
+    def parts():
+        for key, items in loaded:
+            ids, records = warmstart.encode_members(
+                warmstart.Member(rid, m.tg_id, m.reminder_type, m.weekdays, m.text, m.tenant)
+                for rid, m in items
+            )
+            yield key, ids, records
+        for key, no in packed:
+            yield (key, *snap.raw(no))
+
+    try:
+        size = await asyncio.to_thread(warmstart.write, path, event_id, event_at, TIMEZONE, parts())
+    except Exception as e:
+        _dirty = True
+        logger.error(f"Failed to save schedule snapshot: {e}")
+        return None
+    logger.info(f"Schedule snapshot saved to {path}: {size / 1024:.0f} KB, events up to {event_id}")
+    return size
+
+
+def schedule_snapshots(minutes: int = SCHEDULE_SNAPSHOT_MINUTES):
+    """Periodically save the bucket snapshot (only when something changed)."""
+    if not SCHEDULE_SNAPSHOT or minutes <= 0:
+        return
+    scheduler.add_job(
+        save_schedule_snapshot,
+        trigger="interval",
+        minutes=minutes,
+        id="schedule_snapshot",
+        replace_existing=True
+    )
+
+
+def schedule_load_planner(minutes: int = 30):
+    """Refresh the per-minute due histogram now and periodically (one GROUP BY, runs in a thread)."""
+    scheduler.add_job(
+        planner.refresh,
+        trigger="interval",
+        minutes=minutes,
+        next_run_time=datetime.now(pytz.utc),   # первый проход сразу, но в executor, а не в цикле
+        id="load_planner",
+        replace_existing=True
+    )
+
+
+def start_heartbeat(interval_seconds: int = 60):
+    """Periodically store 'alive' timestamp for missed-reminder catch-up."""
+    from .catchup import write_heartbeat
+
+    write_heartbeat()
+    scheduler.add_job(
+        write_heartbeat,
+        trigger="interval",
+        seconds=interval_seconds,
+        id="heartbeat",
+        replace_existing=True
+    )
+
+
+def day_rollover():
+    """Закрыть вчерашний день для серий, добавить план на сегодня в челленджи.
+
+    Проекции сюда не входят: их дочитывает только job "projections", чтобы два
+    реплеера не начислили одни и те же события дважды.
+    """
+    from .streaks import close_yesterday
+    from .challenges import open_day
+
+    close_yesterday()
+    open_day()
+
+
+def schedule_projections(minutes: int = 10):
+    """Periodically replay new events into the projections."""
+    from .projections import catch_up
+
+    scheduler.add_job(
+        catch_up,
+        trigger="interval",
+        minutes=minutes,
+        id="projections",
+        replace_existing=True
+    )
+
+
+def schedule_backup(hour: int | None):
+    """Daily online SQLite backup (runs in the executor thread, the loop is not blocked)."""
+    from .backup import backup, database_path
+
+    if hour is None:
+        return
+    try:
+        database_path()
+    except ValueError:
+        logger.info("Scheduled backup skipped: database is not a SQLite file")
+        return
+    scheduler.add_job(
+        backup,
+        trigger=CronTrigger(hour=hour, minute=0, timezone=TIMEZONE),
+        id="backup",
+        replace_existing=True
+    )
+
+def reschedule_user(reminders, tz: str | None) -> int:
+    """После смены зоны: перенести повторяющиеся напоминания пользователя в корзины новой зоны."""
+    n = 0
+    for r in reminders:
+        if r.reminder_type == "everyday":
+            n += bool(schedule_everyday_reminder(r.id, r.tg_id, r.time, r.text, tz, r.tenant))
+        elif r.reminder_type == "days":
+            n += bool(schedule_days_reminder(r.id, r.tg_id, r.time, r.days, r.text, tz, r.tenant))
+    return n
+
+
+def schedule_day_close():
+    """Hourly job closing yesterday for streaks in zones past midnight (also catches up right away)."""
+    scheduler.add_job(
+        day_rollover,
+        trigger=CronTrigger(minute=5, timezone=TIMEZONE),
+        next_run_time=datetime.now(pytz.utc),   # догон после простоя — тоже в executor
+        id="day_close",
+        replace_existing=True
+    )
+
+
 def start_scheduler():
     if not scheduler.running:
         scheduler.start()
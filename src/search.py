@@ -0,0 +1,83 @@
+"""
+/find — полнотекстовый поиск по напоминаниям и истории выполнений.
+
+Индекс (FTS5) и триггеры, которые держат его в актуальном состоянии,
+создаются в db.init_db. Здесь — разбор запроса пользователя и форматирование
+страницы результатов.
+"""
+from collections import OrderedDict
+from datetime import datetime
+import re
+
+import pytz
+
+from .db import search_history
+from .timezones import get_tz
+
+PAGE_SIZE = 10
+MAX_TERMS = 8
+MAX_REMEMBERED = 1000
+
+
+def build_match(query: str) -> str | None:
+    """
+    Текст пользователя -> FTS5-выражение: каждое слово в кавычках как префикс,
+    все слова обязательны. Операторы FTS5 из ввода не проходят.
+    """
+    words = re.findall(r"\w+", query.lower().replace("ё", "е"))[:MAX_TERMS]
+    if not words:
+        return None
+    return " ".join(f'"{w}"*' for w in words)
+
+
+# последний запрос в чате — для кнопок «дальше/назад»
+_queries: "OrderedDict[int, str]" = OrderedDict()
+
+
+def remember_query(chat_id: int, query: str) -> None:
+    _queries[chat_id] = query
+    _queries.move_to_end(chat_id)
+    if len(_queries) > MAX_REMEMBERED:
+        _queries.popitem(last=False)
+
+
+def last_query(chat_id: int) -> str | None:
+    return _queries.get(chat_id)
+
+
+def find_page(user_id: int, query: str, page: int) -> tuple[list[dict], bool]:
+    """(результаты страницы, есть ли следующая)."""
+    match = build_match(query)
+    if match is None:
+        return [], False
+    rows = search_history(user_id, match, PAGE_SIZE, offset=page * PAGE_SIZE)
+    return rows[:PAGE_SIZE], len(rows) > PAGE_SIZE
+
+
+def format_page(query: str, rows: list[dict], page: int, tz_str: str | None) -> str:
+    if not rows:
+        return f"🔎 По запросу «{query}» ничего не найдено."
+    tz = get_tz(tz_str)
+    lines = [f"🔎 «{query}» — стр. {page + 1}\n"]
+    for r in rows:
+        if r["kind"] == "reminder":
+            when = {"everyday": f"каждый день {r['time']}",
+                    "days": f"{r['days']} {r['time']}"}.get(r["reminder_type"], r["time"])
+            status = "" if r["is_active"] else " (неактивно)"
+            lines.append(f"⏰ [{r['id']}] {when}: {r['snippet']}{status}")
+        else:
+            at: datetime = r["completed_at"]
+            local = pytz.utc.localize(at).astimezone(tz) if at else None
+            lines.append(f"✅ {local.strftime('%d.%m.%Y %H:%M') if local else '—'}: {r['snippet']}")
+    return "\n".join(lines)
+
+
+def page_keyboard(page: int, has_next: bool):
+    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+    row = []
+    if page > 0:
+        row.append(InlineKeyboardButton(text="◀ Назад", callback_data=f"find_{page - 1}"))
+    if has_next:
+        row.append(InlineKeyboardButton(text="Дальше ▶", callback_data=f"find_{page + 1}"))
+    return InlineKeyboardMarkup(inline_keyboard=[row]) if row else None
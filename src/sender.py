@@ -0,0 +1,182 @@
+"""
+Отдельный процесс отправки напоминаний из outbox.
+
+При USE_OUTBOX=1 бот не ходит в Telegram за напоминаниями: scheduler пишет
+готовое сообщение в таблицу outbox (в той же транзакции, что и деактивация
+разовых), а этот процесс забирает их пачками и отправляет через общий лимит
+(SEND_RATE / SEND_CONCURRENCY). Медленный API или 429 во время массовой
+отправки не задерживают ответы бота, и наоборот.
+
+    python -m src.sender              # работать, пока не остановят
+    python -m src.sender --once       # отправить накопившееся и выйти
+
+Строки берутся в аренду (lease_until): если отправщик упал посреди пачки,
+после истечения аренды их заберёт следующий. Можно запустить несколько
+отправщиков на одну БД — общий лимит тогда делится между ними.
+
+С BOT_TOKENS сообщение уходит от бота из outbox.tenant; у каждого бота свой
+лимит (Telegram считает его на бота), HTTP-сессия общая.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+import sys
+
+from .config import (
+    TENANTS, DEFAULT_TENANT, SEND_RATE, SEND_CONCURRENCY, OUTBOX_BATCH, OUTBOX_LEASE,
+    OUTBOX_MAX_ATTEMPTS
+)
+from .db import (
+    init_db, claim_outbox, complete_outbox, purge_outbox, deactivate_users_by_telegram_id
+)
+from .delivery import RateLimitedSender, DeliveryResult
+from .session import create_session, metrics as api_metrics, format_metrics
+
+logger = logging.getLogger(__name__)
+
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
+KEEP_DAYS = 7
+
+
+def retry_delay(attempts: int) -> float:
+    """30 с, 1 мин, 2 мин ... не больше часа."""
+    return min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** max(0, attempts - 1))
+
+
+class OutboxWorker:
+    def __init__(self, senders: dict[str, RateLimitedSender], owner: str, batch: int = OUTBOX_BATCH,
+                 lease: float = OUTBOX_LEASE, max_attempts: int = OUTBOX_MAX_ATTEMPTS):
+        self.senders = senders          # арендатор -> отправитель его бота
+        self.owner = owner
+        self.batch = batch
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.sent = 0
+        self.retried = 0
+        self.dropped = 0
+
+    async def _send_chat(self, messages: list[dict]) -> list[tuple[dict, DeliveryResult]]:
+        # сообщения одного чата — по порядку, разные чаты — параллельно
+        from aiogram.types import InlineKeyboardMarkup
+
+        out = []
+        for m in messages:
+            sender = self.senders.get(m["tenant"] or DEFAULT_TENANT)
+            if sender is None:
+                # бота нет в BOT_TOKENS этого отправщика — повторим позже
+                logger.warning(f"Outbox {m['id']}: no bot for tenant {m['tenant']}")
+                out.append((m, DeliveryResult.FAILED))
+                continue
+            kwargs = {}
+            if m["reply_markup"]:
+                kwargs["reply_markup"] = InlineKeyboardMarkup.model_validate_json(m["reply_markup"])
+            out.append((m, await sender.send(m["chat_id"], m["text"], **kwargs)))
+        return out
+
+    async def run_once(self) -> int:
+        """Одна пачка: взять, отправить, записать итог. Возвращает размер пачки."""
+        batch = claim_outbox(self.owner, self.batch, self.lease)
+        if not batch:
+            return 0
+        by_chat = defaultdict(list)
+        for m in batch:
+            by_chat[m["tenant"], m["chat_id"]].append(m)
+        results = await asyncio.gather(*(self._send_chat(ms) for ms in by_chat.values()))
+
+        now = datetime.utcnow()
+        sent, retry, dead, blocked = [], {}, {}, defaultdict(list)
+        for m, res in (pair for chat in results for pair in chat):
+            if res == DeliveryResult.OK:
+                sent.append(m["id"])
+            elif res == DeliveryResult.BLOCKED:
+                dead[m["id"]] = ("blocked", "bot blocked or chat not found")
+                blocked[m["tenant"]].append(m["chat_id"])
+            elif m["attempts"] >= self.max_attempts:
+                dead[m["id"]] = ("failed", f"gave up after {m['attempts']} attempts")
+            else:
+                retry[m["id"]] = now + timedelta(seconds=retry_delay(m["attempts"]))
+        complete_outbox(self.owner, sent, retry, dead)
+        for tenant, chat_ids in blocked.items():
+            deactivate_users_by_telegram_id(chat_ids, tenant=tenant or DEFAULT_TENANT)
+
+        self.sent += len(sent)
+        self.retried += len(retry)
+        self.dropped += len(dead)
+        logger.info(f"Outbox batch: {len(batch)} messages, sent={len(sent)} "
+                    f"retry={len(retry)} dropped={len(dead)}")
+        return len(batch)
+
+    async def run(self, stop: asyncio.Event, poll: float = 1.0) -> None:
+        last_purge = None
+        while not stop.is_set():
+            try:
+                n = await self.run_once()
+                if last_purge is None or datetime.utcnow() - last_purge > timedelta(hours=1):
+                    last_purge = datetime.utcnow()
+                    purged = purge_outbox(last_purge - timedelta(days=KEEP_DAYS))
+                    if purged:
+                        logger.info(f"Purged {purged} old outbox messages")
+            except Exception as e:
+                logger.exception(f"Outbox worker error: {e}")
+                n = 0
+            if n < self.batch:
+                # очередь пуста или почти пуста — ждём новых сообщений
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=poll)
+                except asyncio.TimeoutError:
+                    pass
+
+
+async def _main(args) -> int:
+    from aiogram import Bot
+
+    init_db()
+    session = create_session()
+    senders = {name: RateLimitedSender(Bot(token=token, session=session), rate=args.rate,
+                                       concurrency=args.concurrency)
+               for name, token in TENANTS}
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    worker = OutboxWorker(senders, owner, batch=args.batch, lease=args.lease)
+    if args.batch > args.rate * args.lease:
+        logger.warning("Batch takes longer than the lease to send; lower --batch or raise --lease")
+    try:
+        if args.once:
+            while await worker.run_once():
+                pass
+        else:
+            stop = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, stop.set)
+            logger.info(f"Outbox sender {owner} started")
+            await worker.run(stop, poll=args.poll)
+    finally:
+        await session.close()
+    logger.info(f"Outbox sender stopped: sent={worker.sent} retried={worker.retried} "
+                f"dropped={worker.dropped}")
+    logger.info(format_metrics(api_metrics.snapshot()))
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Send queued reminders from the outbox table")
+    parser.add_argument("--batch", type=int, default=OUTBOX_BATCH, help="messages per claim")
+    parser.add_argument("--lease", type=float, default=OUTBOX_LEASE, help="lease, seconds")
+    parser.add_argument("--poll", type=float, default=1.0, help="idle poll interval, seconds")
+    parser.add_argument("--rate", type=float, default=SEND_RATE, help="messages per second")
+    parser.add_argument("--concurrency", type=int, default=SEND_CONCURRENCY)
+    parser.add_argument("--once", action="store_true", help="drain the outbox and exit")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    return asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,293 @@
+"""
+HTTP-сессия для Bot API: настроенный пул соединений и метрики.
+
+Стандартная AiohttpSession держит до 100 соединений без лимита на хост, с
+keep-alive 15 с и одним общим таймаутом. При отправке тысяч напоминаний в
+минуту это даёт лишние соединения и TLS-рукопожатия. TunedSession берёт
+размеры пула, keep-alive, кеш DNS и таймауты из конфига и через TraceConfig
+aiohttp считает по каждому методу API задержку, число запросов в полёте,
+новые и переиспользованные соединения.
+
+Проверка на локальном сервере, который изображает Bot API:
+
+    python -m src.session selftest --requests 2000
+"""
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Any, cast
+import argparse
+import asyncio
+import logging
+import sys
+import time
+
+from aiohttp import ClientError, ClientSession, ClientTimeout, TraceConfig
+from aiohttp.hdrs import USER_AGENT
+from aiohttp.http import SERVER_SOFTWARE
+from aiogram import __version__ as aiogram_version
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer, PRODUCTION
+from aiogram.exceptions import TelegramNetworkError
+
+from .config import (
+    HTTP_POOL_LIMIT, HTTP_LIMIT_PER_HOST, HTTP_KEEPALIVE, HTTP_DNS_TTL,
+    HTTP_CONNECT_TIMEOUT, HTTP_TIMEOUT, TELEGRAM_API_URL
+)
+
+logger = logging.getLogger(__name__)
+
+LATENCY_SAMPLES = 1000
+
+
+@dataclass(slots=True)
+class MethodStats:
+    requests: int = 0
+    errors: int = 0
+    in_flight: int = 0
+    max_in_flight: int = 0
+    total_time: float = 0.0
+    max_time: float = 0.0
+    new_connections: int = 0
+    reused_connections: int = 0
+    latencies: deque = field(default_factory=lambda: deque(maxlen=LATENCY_SAMPLES))
+
+    def as_dict(self) -> dict:
+        lat = sorted(self.latencies)
+
+        def pct(p: float) -> float:
+            return 1000 * lat[min(len(lat) - 1, int(p * len(lat)))] if lat else 0.0
+
+        conns = self.new_connections + self.reused_connections
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "avg_ms": 1000 * self.total_time / self.requests if self.requests else 0.0,
+            "p50_ms": pct(0.5),
+            "p95_ms": pct(0.95),
+            "max_ms": 1000 * self.max_time,
+            "new_connections": self.new_connections,
+            "reused_connections": self.reused_connections,
+            "reuse_ratio": self.reused_connections / conns if conns else 0.0,
+        }
+
+
+class ApiMetrics:
+    """Счётчики по методам Bot API (sendMessage, getUpdates, ...)."""
+
+    def __init__(self):
+        self.methods: dict[str, MethodStats] = defaultdict(MethodStats)
+        self.dns_hits = 0
+        self.dns_misses = 0
+
+    def started(self, method: str) -> None:
+        m = self.methods[method]
+        m.in_flight += 1
+        m.max_in_flight = max(m.max_in_flight, m.in_flight)
+
+    def finished(self, method: str, elapsed: float, ok: bool) -> None:
+        m = self.methods[method]
+        m.in_flight -= 1
+        m.requests += 1
+        m.errors += not ok
+        m.total_time += elapsed
+        m.max_time = max(m.max_time, elapsed)
+        m.latencies.append(elapsed)
+
+    def connection(self, method: str, reused: bool) -> None:
+        m = self.methods[method]
+        if reused:
+            m.reused_connections += 1
+        else:
+            m.new_connections += 1
+
+    def trace_config(self) -> TraceConfig:
+        """TraceConfig для ClientSession; метод API приходит в trace_request_ctx."""
+        tc = TraceConfig()
+
+        async def on_create(session, ctx, params):
+            self.connection(ctx.trace_request_ctx or "?", reused=False)
+
+        async def on_reuse(session, ctx, params):
+            self.connection(ctx.trace_request_ctx or "?", reused=True)
+
+        async def on_dns_hit(session, ctx, params):
+            self.dns_hits += 1
+
+        async def on_dns_miss(session, ctx, params):
+            self.dns_misses += 1
+
+        tc.on_connection_create_end.append(on_create)
+        tc.on_connection_reuseconn.append(on_reuse)
+        tc.on_dns_cache_hit.append(on_dns_hit)
+        tc.on_dns_cache_miss.append(on_dns_miss)
+        return tc
+
+    def snapshot(self) -> dict[str, dict]:
+        return {name: m.as_dict() for name, m in self.methods.items()}
+
+
+metrics = ApiMetrics()
+
+
+class TunedSession(AiohttpSession):
+    """AiohttpSession с настраиваемым пулом, раздельными таймаутами и метриками."""
+
+    def __init__(self, limit: int = HTTP_POOL_LIMIT, limit_per_host: int = HTTP_LIMIT_PER_HOST,
+                 keepalive: float = HTTP_KEEPALIVE, dns_ttl: int = HTTP_DNS_TTL,
+                 connect_timeout: float = HTTP_CONNECT_TIMEOUT, timeout: float = HTTP_TIMEOUT,
+                 api: TelegramAPIServer = PRODUCTION, metrics: ApiMetrics = metrics):
+        super().__init__(limit=limit, api=api, timeout=timeout)
+        self._connector_init.update(
+            limit_per_host=limit_per_host,
+            keepalive_timeout=keepalive,
+            ttl_dns_cache=dns_ttl,
+        )
+        self.connect_timeout = connect_timeout
+        self.metrics = metrics
+
+    async def create_session(self) -> ClientSession:
+        if self._should_reset_connector:
+            await self.close()
+
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=self._connector_type(**self._connector_init),
+                headers={USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{aiogram_version}"},
+                trace_configs=[self.metrics.trace_config()],
+            )
+            self._should_reset_connector = False
+
+        return self._session
+
+    async def make_request(self, bot, method, timeout: int | None = None) -> Any:
+        # повторяет AiohttpSession.make_request, но с отдельным таймаутом на
+        # соединение и именем метода в trace_request_ctx
+        name = method.__api_method__
+        session = await self.create_session()
+        url = self.api.api_url(token=bot.token, method=name)
+        form = self.build_form_data(bot=bot, method=method)
+        total = self.timeout if timeout is None else timeout
+
+        self.metrics.started(name)
+        started = time.perf_counter()
+        ok = False
+        try:
+            try:
+                async with session.post(
+                    url,
+                    data=form,
+                    timeout=ClientTimeout(total=total, sock_connect=self.connect_timeout),
+                    trace_request_ctx=name,
+                ) as resp:
+                    raw_result = await resp.text()
+            except asyncio.TimeoutError as e:
+                raise TelegramNetworkError(method=method, message="Request timeout error") from e
+            except ClientError as e:
+                raise TelegramNetworkError(method=method, message=f"{type(e).__name__}: {e}") from e
+            response = self.check_response(
+                bot=bot,
+                method=method,
+                status_code=resp.status,
+                content=raw_result,
+            )
+            ok = True
+            return cast(Any, response.result)
+        finally:
+            self.metrics.finished(name, time.perf_counter() - started, ok)
+
+
+def create_session(api_url: str | None = TELEGRAM_API_URL) -> TunedSession:
+    """Сессия для Bot(...) с настройками из конфига (api_url — свой Bot API сервер)."""
+    api = TelegramAPIServer.from_base(api_url) if api_url else PRODUCTION
+    return TunedSession(api=api)
+
+
+def format_metrics(snapshot: dict[str, dict]) -> str:
+    if not snapshot:
+        return "🌐 Запросов к Bot API ещё не было."
+    lines = ["🌐 Bot API по методам:\n"]
+    for name, m in sorted(snapshot.items(), key=lambda kv: -kv[1]["requests"]):
+        lines.append(
+            f"{name}: {m['requests']} запр., ошибок {m['errors']}, в полёте {m['in_flight']} "
+            f"(макс {m['max_in_flight']}), p50 {m['p50_ms']:.0f} мс, p95 {m['p95_ms']:.0f} мс, "
+            f"соединений новых {m['new_connections']}, повторно {m['reuse_ratio']:.0%}"
+        )
+    return "\n".join(lines)
+
+
+# ---------- проверка на локальном сервере ----------
+
+async def selftest(requests: int = 2000, concurrency: int = 50, latency_ms: float = 20.0,
+                   limit: int = HTTP_POOL_LIMIT, keepalive: float = HTTP_KEEPALIVE) -> dict:
+    """
+    Поднять на 127.0.0.1 сервер, отвечающий как Bot API (sendMessage с задержкой
+    latency_ms), и отправить через TunedSession `requests` сообщений.
+    """
+    from aiohttp import web
+    from aiogram import Bot
+
+    connections = set()
+
+    async def handle(request: web.Request) -> web.Response:
+        connections.add(request.transport.get_extra_info("peername"))
+        await asyncio.sleep(latency_ms / 1000)
+        return web.json_response({"ok": True, "result": {
+            "message_id": 1, "date": int(time.time()),
+            "chat": {"id": 1, "type": "private"}, "text": "ok",
+        }})
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    m = ApiMetrics()
+    session = TunedSession(limit=limit, limit_per_host=limit, keepalive=keepalive,
+                           api=TelegramAPIServer.from_base(f"http://127.0.0.1:{port}"), metrics=m)
+    bot = Bot(token="42:selftest", session=session)
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with sem:
+            await bot.send_message(chat_id=1, text=f"selftest {i}")
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(one(i) for i in range(requests)))
+    finally:
+        elapsed = time.perf_counter() - started
+        await session.close()
+        await runner.cleanup()
+    out = m.snapshot().get("sendMessage", {})
+    out.update(elapsed_s=elapsed, rps=requests / elapsed if elapsed else 0.0,
+               server_connections=len(connections))
+    return out
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Bot API session tools")
+    parser.add_argument("command", choices=["selftest"])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="stand-in server delay")
+    parser.add_argument("--limit", type=int, default=HTTP_POOL_LIMIT, help="connection pool size")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    r = asyncio.run(selftest(args.requests, args.concurrency, args.latency_ms, args.limit))
+    print(f"Запросов: {r['requests']} за {r['elapsed_s']:.2f} с ({r['rps']:.0f}/с), ошибок {r['errors']}")
+    print(f"Задержка: p50 {r['p50_ms']:.1f} мс, p95 {r['p95_ms']:.1f} мс, макс {r['max_ms']:.1f} мс")
+    print(f"Соединений: новых {r['new_connections']}, переиспользовано {r['reused_connections']} "
+          f"({r['reuse_ratio']:.1%}), на сервере {r['server_connections']}; "
+          f"в полёте макс {r['max_in_flight']}")
+    return 0 if r["errors"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+"""
+Отложенные напоминания («⏰ +10 мин») без строк в БД и задач APScheduler.
+
+Таймеры лежат в min-heap по времени срабатывания, одна asyncio-задача
+спит до ближайшего. Размер ограничен `max_size`. Состояние сохраняется
+маленьким JSON-снимком (атомарная замена файла), чтобы пережить рестарт;
+просроченные за время простоя таймеры срабатывают сразу после загрузки.
+Изменения только помечают снимок грязным: запись — не чаще раза в
+`save_delay` секунд в потоке (asyncio.to_thread) и последний раз в stop().
+"""
+from dataclasses import dataclass, asdict
+from typing import Awaitable, Callable
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True, frozen=True)
+class SnoozeEntry:
+    chat_id: int
+    reminder_id: int
+    text: str
+    reminder_type: str | None
+    tenant: str | None = None           # бот; в старых снимках нет — бот по умолчанию
+
+
+# fire(entry) — отправить напоминание обычным путём
+Fire = Callable[[SnoozeEntry], Awaitable[None]]
+
+
+class SnoozeTimers:
+    def __init__(self, fire: Fire, snapshot_path: str | None, max_size: int = 10_000,
+                 save_delay: float = 2.0):
+        self.fire = fire
+        self.snapshot_path = snapshot_path
+        self.max_size = max_size
+        self.save_delay = save_delay
+        self._heap: list[tuple[float, int, SnoozeEntry]] = []
+        # (chat_id, reminder_id) -> seq актуальной записи; старые записи в куче пропускаются
+        self._live: dict[tuple[int, int], int] = {}
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._dirty = False
+        self._save_task: asyncio.Task | None = None
+        self._write_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._live)
+
+    def add(self, entry: SnoozeEntry, delay_seconds: float, at: float | None = None) -> bool:
+        """Отложить (повторное откладывание того же напоминания заменяет старое). False — нет места."""
+        key = (entry.chat_id, entry.reminder_id)
+        if key not in self._live and len(self._live) >= self.max_size:
+            return False
+        fire_at = (time.time() + delay_seconds) if at is None else at
+        seq = next(self._seq)
+        self._live[key] = seq
+        heapq.heappush(self._heap, (fire_at, seq, entry))
+        self._compact()
+        self._wakeup.set()
+        self._mark_dirty()
+        return True
+
+    def cancel(self, chat_id: int, reminder_id: int) -> bool:
+        """Снять отложенное (например, если уже отметили выполненным)."""
+        if self._live.pop((chat_id, reminder_id), None) is None:
+            return False
+        self._mark_dirty()
+        return True
+
+    def _compact(self) -> None:
+        # если протухших записей в куче слишком много — пересобираем её
+        if len(self._heap) > 2 * len(self._live) + 64:
+            self._heap = [item for item in self._heap
+                          if self._live.get((item[2].chat_id, item[2].reminder_id)) == item[1]]
+            heapq.heapify(self._heap)
+
+    def _pop_due(self, now: float) -> list[SnoozeEntry]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, seq, entry = heapq.heappop(self._heap)
+            key = (entry.chat_id, entry.reminder_id)
+            if self._live.get(key) == seq:
+                del self._live[key]
+                due.append(entry)
+        return due
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            due = self._pop_due(now)
+            if due:
+                self._mark_dirty()
+                for entry in due:
+                    # отдельной задачей: отправка может ждать склейку/лимиты
+                    asyncio.create_task(self._fire_one(entry))
+                continue
+            timeout = (self._heap[0][0] - now) if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire_one(self, entry: SnoozeEntry) -> None:
+        try:
+            await self.fire(entry)
+        except Exception as e:
+            logger.error(f"Failed to fire snoozed reminder {entry.reminder_id}: {e}")
+
+    def start(self) -> None:
+        self.load_snapshot()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        for task in (self._task, self._save_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._save_task = None
+        self.save_snapshot()
+
+    # ---------- снимок ----------
+
+    def _live_items(self) -> list[tuple[float, SnoozeEntry]]:
+        return [(at, entry) for at, seq, entry in self._heap
+                if self._live.get((entry.chat_id, entry.reminder_id)) == seq]
+
+    def _mark_dirty(self) -> None:
+        """Снимок устарел: записать через save_delay (одна запись на всю пачку изменений)."""
+        if not self.snapshot_path:
+            return
+        self._dirty = True
+        if self._save_task is not None and not self._save_task.done():
+            return
+        try:
+            self._save_task = asyncio.get_running_loop().create_task(self._save_later())
+        except RuntimeError:
+            self.save_snapshot()        # вне цикла (CLI, загрузка) — сразу
+
+    async def _save_later(self) -> None:
+        # изменения во время записи — ещё один круг
+        while self._dirty:
+            await asyncio.sleep(self.save_delay)
+            self._dirty = False
+            # список записей — в цикле (куча меняется только в нём), JSON и файл — в потоке
+            data = self._snapshot_data()
+            await asyncio.to_thread(self._write, data)
+
+    def _snapshot_data(self) -> list[dict]:
+        return [{"at": at, **asdict(entry)} for at, entry in self._live_items()]
+
+    def save_snapshot(self) -> None:
+        """Записать снимок сейчас (синхронно)."""
+        if not self.snapshot_path:
+            return
+        self._dirty = False
+        self._write(self._snapshot_data())
+
+    def _write(self, data: list[dict]) -> None:
+        tmp = f"{self.snapshot_path}.tmp"
+        # отменённая в stop() запись могла ещё идти в потоке
+        with self._write_lock:
+            self._write_file(tmp, data)
+
+    def _write_file(self, tmp: str, data: list[dict]) -> None:
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, self.snapshot_path)
+        except OSError as e:
+            logger.error(f"Failed to save snooze snapshot: {e}")
+
+    def load_snapshot(self) -> int:
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return 0
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load snooze snapshot: {e}")
+            return 0
+        for item in data[:self.max_size]:
+            at = item.pop("at")
+            entry = SnoozeEntry(**item)
+            seq = next(self._seq)
+            self._live[(entry.chat_id, entry.reminder_id)] = seq
+            heapq.heappush(self._heap, (at, seq, entry))
+        logger.info(f"Loaded {len(data)} snoozed reminders")
+        return len(data)
@@ -0,0 +1,182 @@
+"""
+Серии 100%-дней, которые ведутся инкрементально.
+
+У пользователя хранятся current_streak, best_streak и last_evaluated_date.
+Ночной job закрывает прошедшие дни: для каждого пользователя считаются
+только дни после last_evaluated_date. Отметка «✅» закрывает текущий день
+досрочно, если план на сегодня уже выполнен. Чтение серии — одна строка
+users, O(1).
+
+День без плана серию не меняет, выполненный план продлевает её на 1,
+невыполненный обнуляет. Дни — в часовом поясе пользователя, поэтому job
+запускается ежечасно и закрывает день тем, у кого уже наступила полночь.
+Пересчёт всей истории:
+
+    python -m src.streaks rebuild [--telegram-id N]
+"""
+from collections import Counter
+from datetime import date, datetime, timedelta
+import argparse
+import logging
+import sys
+
+import pytz
+
+from .config import DEFAULT_TENANT
+from .timezones import get_tz, local_today
+from .db import (
+    init_db, get_streak, get_streak_states, get_plan_rows_for_users,
+    get_done_times, save_streaks, reset_streaks, get_user_id_by_telegram_id,
+    get_user_timezones, _planned_from_rows
+)
+
+logger = logging.getLogger(__name__)
+
+
+def day_bounds_utc(first: date, last: date, tz) -> tuple[datetime, datetime]:
+    """[first 00:00, last+1 00:00) локального времени -> naive UTC."""
+    start = tz.localize(datetime(first.year, first.month, first.day))
+    nxt = last + timedelta(days=1)
+    end = tz.localize(datetime(nxt.year, nxt.month, nxt.day))
+    return (start.astimezone(pytz.utc).replace(tzinfo=None),
+            end.astimezone(pytz.utc).replace(tzinfo=None))
+
+
+def advance(current: int, best: int, planned: int, done: int) -> tuple[int, int]:
+    """Учесть один день."""
+    if planned == 0:
+        return current, best
+    if done >= planned:
+        current += 1
+        return current, max(best, current)
+    return 0, best
+
+
+def close_days(up_to: date | None = None, user_ids: list[int] = None,
+               chunk_size: int = 500) -> int:
+    """
+    Досчитать серии всех (или указанных) пользователей по день `up_to`
+    включительно; None — по вчерашний день в зоне каждого пользователя.
+    """
+    # без up_to граница — вчера в каждой зоне: выбираются только те, у кого
+    # после прошлого запуска закончился локальный день, а не все пользователи
+    by_tz = None
+    if up_to is None:
+        by_tz = {name: datetime.now(get_tz(name)).date() - timedelta(days=1)
+                 for name in get_user_timezones()}
+    after, updated = 0, 0
+    while True:
+        states = get_streak_states(after, chunk_size, up_to=up_to, user_ids=user_ids,
+                                   up_to_by_tz=by_tz)
+        if not states:
+            break
+        after = states[-1][0]
+
+        spans = {}   # uid -> (tz, первый день, последний день)
+        fresh = []   # зарегистрировались сегодня: отметить «закрыто по вчера», чтобы не выбирать снова
+        for uid, current, best, last, created, user_tz in states:
+            tz = get_tz(user_tz)
+            end = up_to or datetime.now(tz).date() - timedelta(days=1)
+            if last:
+                start = last + timedelta(days=1)
+            elif created:
+                start = created.replace(tzinfo=pytz.utc).astimezone(tz).date()
+            else:
+                start = end
+            if start <= end:
+                spans[uid] = (tz, start, end)
+            elif last is None:
+                fresh.append({"id": uid, "current_streak": current or 0, "best_streak": best or 0,
+                              "last_evaluated_date": end})
+        save_streaks(fresh)
+        if not spans:
+            continue
+        ids = list(spans)
+
+        # выполнения всей пачки одним запросом -> счётчик по (user, локальный день)
+        bounds = [day_bounds_utc(start, end, tz) for tz, start, end in spans.values()]
+        done = Counter(
+            (uid, completed_at.replace(tzinfo=pytz.utc).astimezone(spans[uid][0]).date())
+            for uid, completed_at in get_done_times(ids, min(b[0] for b in bounds),
+                                                    max(b[1] for b in bounds))
+        )
+        plans = get_plan_rows_for_users(ids)
+
+        out = []
+        for uid, current, best, _, _, _ in states:
+            if uid not in spans:
+                continue
+            _, d, end = spans[uid]
+            current, best = current or 0, best or 0
+            while d <= end:
+                current, best = advance(current, best, _planned_from_rows(plans[uid], d), done[(uid, d)])
+                d += timedelta(days=1)
+            out.append({"id": uid, "current_streak": current, "best_streak": best,
+                        "last_evaluated_date": end})
+        save_streaks(out)
+        updated += len(out)
+
+    if updated:
+        logger.info(f"Closed days{f' up to {up_to}' if up_to else ''} for {updated} users")
+    return updated
+
+
+def close_yesterday() -> int:
+    """Ежечасный job: закрыть вчерашний (и все пропущенные) дни там, где уже наступила полночь."""
+    return close_days()
+
+
+def on_workout_completed(user_id: int, tz_str: str = None) -> None:
+    """После отметки: если план на сегодня выполнен — засчитать день сразу. tz_str — зона пользователя."""
+    tz = get_tz(tz_str)
+    today = local_today(tz_str)
+    st = get_streak(user_id)
+    last = st["last_evaluated_date"]
+    if last and last >= today:
+        return
+
+    yesterday = today - timedelta(days=1)
+    if last is None or last < yesterday:
+        close_days(yesterday, user_ids=[user_id])
+        st = get_streak(user_id)
+
+    start_utc, end_utc = day_bounds_utc(today, today, tz)
+    done = len(get_done_times([user_id], start_utc, end_utc))
+    planned = _planned_from_rows(get_plan_rows_for_users([user_id])[user_id], today)
+    if planned > 0 and done >= planned:
+        current, best = advance(st["current"], st["best"], planned, done)
+        save_streaks([{"id": user_id, "current_streak": current, "best_streak": best,
+                       "last_evaluated_date": today}])
+
+
+def rebuild(user_ids: list[int] = None) -> int:
+    """Пересчитать серии с нуля по всей истории выполнений."""
+    reset_streaks(user_ids)
+    return close_days(user_ids=user_ids)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Streak maintenance")
+    parser.add_argument("command", choices=["rebuild", "close"])
+    parser.add_argument("--telegram-id", type=int, help="only this user")
+    parser.add_argument("--tenant", default=DEFAULT_TENANT, help="bot name from BOT_TOKENS")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    init_db()
+
+    user_ids = None
+    if args.telegram_id is not None:
+        user_id = get_user_id_by_telegram_id(args.telegram_id, tenant=args.tenant)
+        if user_id is None:
+            print("Пользователь не найден", file=sys.stderr)
+            return 1
+        user_ids = [user_id]
+
+    n = rebuild(user_ids) if args.command == "rebuild" else close_yesterday()
+    print(f"Обновлено пользователей: {n}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""
+Несколько ботов в одном процессе (BOT_TOKENS): по арендатору (tenant) на бота.
+
+Арендатор — имя бота из конфига. Оно записано в users.tenant (уникален
+telegram_id в пределах арендатора), остальные данные принадлежат
+пользователю и этим отделены; у рассылок и outbox — своя колонка tenant.
+
+Все боты опрашивает один Dispatcher (start_polling(*bots)): хендлеры,
+middleware и FSM-хранилище общие (ключ FSM и так содержит bot_id). Свой у
+каждого бота RateLimitedSender: лимит Telegram считается на бота, рассылка
+одного зала не съедает лимит другого. Общие — планировщик (корзины
+напоминаний всех ботов), пул БД и HTTP-сессия Bot API.
+
+Арендатор текущего апдейта лежит в contextvar (TenantMiddleware, по
+data["bot"]); функции db.py, которые ищут пользователя по telegram_id,
+берут его оттуда. Задачи планировщика и фоновые рассылки передают
+арендатора явно.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+import logging
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.types import TelegramObject
+
+from .config import DEFAULT_TENANT
+from .delivery import RateLimitedSender
+
+logger = logging.getLogger(__name__)
+
+_current: ContextVar[str] = ContextVar("tenant", default=DEFAULT_TENANT)
+
+
+def current() -> str:
+    return _current.get()
+
+
+@contextmanager
+def use(name: str | None):
+    """Выполнить блок от имени арендатора (None — по умолчанию)."""
+    token = _current.set(name or DEFAULT_TENANT)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+@dataclass(slots=True)
+class TenantStats:
+    updates: int = 0
+    reminders: int = 0      # напоминаний доставлено (сообщений с напоминаниями)
+    failed: int = 0         # не удалось отправить напоминание
+
+
+@dataclass
+class Tenant:
+    name: str
+    bot: Bot
+    sender: RateLimitedSender
+    stats: TenantStats = field(default_factory=TenantStats)
+
+
+registry: dict[str, Tenant] = {}
+_by_bot: dict[int, Tenant] = {}
+
+
+def register(tenant: Tenant) -> Tenant:
+    registry[tenant.name] = tenant
+    _by_bot[tenant.bot.id] = tenant
+    return tenant
+
+
+def get(name: str | None) -> Tenant | None:
+    return registry.get(name or DEFAULT_TENANT)
+
+
+def sender_for(name: str | None) -> RateLimitedSender | None:
+    tenant = get(name)
+    return tenant.sender if tenant else None
+
+
+class TenantMiddleware(BaseMiddleware):
+    """Outer-middleware апдейтов: арендатор бота, принявшего апдейт, в contextvar; счётчик апдейтов."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        bot = data.get("bot")
+        tenant = _by_bot.get(bot.id) if bot else None
+        if tenant is None:
+            return await handler(event, data)
+        tenant.stats.updates += 1
+        with use(tenant.name):
+            return await handler(event, data)
+
+
+def format_stats(users: dict[str, int]) -> str:
+    """Сводка по арендаторам; users — {арендатор: активных пользователей}."""
+    lines = ["🏢 Боты:\n"]
+    for name, t in registry.items():
+        s = t.stats
+        lines.append(
+            f"{name}: пользователей {users.get(name, 0)}, апдейтов {s.updates}\n"
+            f"  напоминаний {s.reminders}, ошибок {s.failed}; "
+            f"рассылки ✅ {t.sender.sent} 🚫 {t.sender.blocked} ❌ {t.sender.failed}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,133 @@
+"""
+Часовые пояса пользователей.
+
+В users.timezone хранится имя зоны IANA ('Europe/Moscow') или фиксированное
+смещение ('+05:30'); NULL — зона по умолчанию из config.TIMEZONE. Объекты
+зон кешируются: pytz.timezone() заметно дороже обращения к словарю, а
+вызывается на каждый пересчёт статистики и каждое срабатывание.
+"""
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+import re
+
+import pytz
+
+from .config import TIMEZONE
+
+# частые названия городов -> зона
+ALIASES = {
+    "москва": "Europe/Moscow", "мск": "Europe/Moscow", "спб": "Europe/Moscow",
+    "питер": "Europe/Moscow", "санкт-петербург": "Europe/Moscow",
+    "алматы": "Asia/Almaty", "алма-ата": "Asia/Almaty", "астана": "Asia/Almaty",
+    "ташкент": "Asia/Tashkent", "бишкек": "Asia/Bishkek", "киев": "Europe/Kyiv",
+    "минск": "Europe/Minsk", "екатеринбург": "Asia/Yekaterinburg",
+    "новосибирск": "Asia/Novosibirsk", "владивосток": "Asia/Vladivostok",
+    "калининград": "Europe/Kaliningrad", "самара": "Europe/Samara",
+    "тбилиси": "Asia/Tbilisi", "ереван": "Asia/Yerevan", "баку": "Asia/Baku",
+    "берлин": "Europe/Berlin", "лондон": "Europe/London", "нью-йорк": "America/New_York",
+}
+
+_BY_LOWER = {name.lower(): name for name in pytz.all_timezones}
+
+
+@lru_cache(maxsize=None)
+def get_tz(name: str | None = None):
+    """tzinfo по имени из users.timezone (None — зона по умолчанию)."""
+    if not name:
+        name = TIMEZONE
+    m = re.fullmatch(r"([+-])(\d{2}):(\d{2})", name)
+    if m:
+        minutes = int(m.group(2)) * 60 + int(m.group(3))
+        return pytz.FixedOffset(-minutes if m.group(1) == "-" else minutes)
+    return pytz.timezone(name)
+
+
+def trigger_tz(name: str | None = None):
+    """Зона для триггеров APScheduler: pytz.FixedOffset он не принимает, нужен datetime.timezone."""
+    tz = get_tz(name)
+    if getattr(tz, "zone", "") is None:
+        return timezone(tz.utcoffset(None))
+    return tz
+
+
+def tz_name(name: str | None) -> str:
+    return name or TIMEZONE
+
+
+def parse_tz(text: str) -> str:
+    """
+    Ввод пользователя -> значение для users.timezone. Понимает имена IANA
+    (без учёта регистра), города из ALIASES и смещения 'UTC+3', '+5:30', '-4'.
+    Бросает ValueError.
+    """
+    raw = text.strip()
+    key = raw.lower()
+    if key in ALIASES:
+        return ALIASES[key]
+    if key in _BY_LOWER:
+        return _BY_LOWER[key]
+
+    m = re.fullmatch(r"(?:utc|gmt)?\s*([+-])\s*(\d{1,2})(?::?(\d{2}))?", key)
+    if m:
+        hours, minutes = int(m.group(2)), int(m.group(3) or 0)
+        if hours > 14 or minutes >= 60 or (hours == 14 and minutes):
+            raise ValueError("смещение должно быть от -14:00 до +14:00")
+        if not minutes and hours:
+            # у Etc/GMT знак обратный: UTC+3 -> Etc/GMT-3
+            return f"Etc/GMT{'-' if m.group(1) == '+' else '+'}{hours}"
+        if not minutes:
+            return "UTC"
+        return f"{m.group(1)}{hours:02d}:{minutes:02d}"
+    if key in ("utc", "gmt"):
+        return "UTC"
+    raise ValueError(f"не знаю зону «{raw}»")
+
+
+def local_now(name: str | None = None) -> datetime:
+    return datetime.now(get_tz(name))
+
+
+def local_today(name: str | None = None) -> date:
+    return local_now(name).date()
+
+
+def offset_periods(tz, start_utc: datetime, end_utc: datetime) -> list[tuple[datetime, datetime, int]]:
+    """
+    [start, end) в naive UTC -> отрезки, где смещение зоны постоянно:
+    [(от, до, смещение в минутах)]. Переходы DST ищутся по дням, затем
+    с точностью до минуты; у фиксированных зон отрезок один.
+    """
+    fixed = tz.utcoffset(None)
+    if fixed is not None:
+        return [(start_utc, end_utc, int(fixed.total_seconds() // 60))]
+
+    def minutes(at: datetime) -> int:
+        return int(pytz.utc.localize(at).astimezone(tz).utcoffset().total_seconds() // 60)
+
+    periods = []
+    begin, current = start_utc, minutes(start_utc)
+    t = start_utc
+    while t < end_utc:
+        nxt = min(t + timedelta(days=1), end_utc)
+        if minutes(nxt) != current:
+            lo, hi = 0, int((nxt - t).total_seconds() // 60)
+            while hi - lo > 1:
+                mid = (lo + hi) // 2
+                if minutes(t + timedelta(minutes=mid)) == current:
+                    lo = mid
+                else:
+                    hi = mid
+            edge = t + timedelta(minutes=hi)
+            if edge >= end_utc:
+                break
+            periods.append((begin, edge, current))
+            begin, current = edge, minutes(edge)
+        t = nxt
+    periods.append((begin, end_utc, current))
+    return periods
+
+
+def describe(name: str | None) -> str:
+    """'Europe/Moscow (UTC+03:00)'"""
+    offset = local_now(name).strftime("%z")
+    return f"{tz_name(name)} (UTC{offset[:3]}:{offset[3:]})"
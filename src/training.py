@@ -0,0 +1,107 @@
+"""
+Журнал упражнений (/log) и прогресс (/progress).
+
+Каждая запись /log в той же транзакции обновляет готовые итоги:
+exercise_stats (рекорды, последний подход, суммарный объём) и
+exercise_weeks (объём за неделю). /progress читает только их — журнал
+workout_logs при этом не сканируется.
+"""
+from datetime import date, datetime, timedelta
+
+import pytz
+
+from .db import add_workout_logs, get_exercise_stats, get_exercise_weeks, find_exercises
+from .parsing import LogEntry, parse_log_entries
+from .timezones import get_tz
+
+PROGRESS_WEEKS = 8
+LOG_HINT = "Например: /log жим 3x8 80кг; подтягивания 4x10"
+
+
+def week_start(tz_str: str = None, now_utc: datetime | None = None) -> date:
+    now_utc = now_utc or datetime.utcnow()
+    today = pytz.utc.localize(now_utc).astimezone(get_tz(tz_str)).date()
+    return today - timedelta(days=today.weekday())
+
+
+def log(user_id: int, text: str, completed_id: int = None,
+        tz_str: str = None) -> tuple[list[LogEntry], list[tuple[str, str, float]]]:
+    """Разобрать и записать. Бросает ValueError с понятным пользователю текстом."""
+    entries = parse_log_entries(text)
+    records = add_workout_logs(user_id, entries, week_start(tz_str), completed_id)
+    return entries, records
+
+
+def _num(x: float) -> str:
+    return f"{x:g}"
+
+
+def format_entry(e: LogEntry) -> str:
+    weight = f" × {_num(e.weight)} кг" if e.weight else ""
+    return f"{e.exercise}: {e.sets}×{e.reps}{weight}"
+
+
+def format_logged(entries: list[LogEntry], records: list[tuple[str, str, float]]) -> str:
+    lines = ["📝 Записал:"] + [f"• {format_entry(e)}" for e in entries]
+    labels = {"weight": "вес {} кг", "reps": "{} повторов", "volume": "объём {} кг"}
+    for exercise, kind, value in records:
+        lines.append(f"🏆 Новый рекорд — {exercise}: {labels[kind].format(_num(value))}!")
+    return "\n".join(lines)
+
+
+def resolve_exercise(user_id: int, query: str) -> tuple[str | None, list[str]]:
+    """Точное название или единственное по префиксу; иначе (None, варианты)."""
+    name = " ".join(query.lower().replace("ё", "е").split())
+    if get_exercise_stats(user_id, name, limit=1):
+        return name, []
+    options = find_exercises(user_id, name)
+    if len(options) == 1:
+        return options[0], []
+    return None, options
+
+
+def format_progress(user_id: int, exercise: str, tz_str: str = None) -> str:
+    st = get_exercise_stats(user_id, exercise, limit=1)[0]
+    tz = get_tz(tz_str)
+    since = week_start(tz_str) - timedelta(weeks=PROGRESS_WEEKS - 1)
+    weeks = {w[0]: w for w in get_exercise_weeks(user_id, exercise, since)}
+
+    def local(at: datetime) -> str:
+        return pytz.utc.localize(at).astimezone(tz).strftime("%d.%m.%Y")
+
+    lines = [f"📈 {exercise}\n"]
+    last_weight = f" × {_num(st['last_weight'])} кг" if st["last_weight"] else ""
+    lines.append(f"Последний раз: {st['last_sets']}×{st['last_reps']}{last_weight} ({local(st['last_at'])})")
+    if st["best_weight"]:
+        lines.append(f"🏆 Рекорд веса: {_num(st['best_weight'])} кг ({local(st['best_weight_at'])})")
+    lines.append(f"🏆 Больше всего повторов в подходе: {st['best_reps']}")
+    if st["best_volume"]:
+        lines.append(f"🏆 Лучший объём за запись: {_num(st['best_volume'])} кг")
+    lines.append(f"Всего: {st['entries']} записей, {st['total_reps']} повторов"
+                 + (f", {_num(round(st['total_volume']))} кг" if st["total_volume"] else ""))
+
+    lines.append(f"\nПо неделям ({PROGRESS_WEEKS}):")
+    use_volume = st["total_volume"] > 0
+    values = []
+    for i in range(PROGRESS_WEEKS):
+        ws = since + timedelta(weeks=i)
+        w = weeks.get(ws)
+        values.append((ws, (w[3] if use_volume else w[2]) if w else 0))
+    top = max(v for _, v in values) or 1
+    for ws, v in values:
+        bar = "█" * round(10 * v / top) if v else "·"
+        unit = "кг" if use_volume else "повт."
+        lines.append(f"{ws.strftime('%d.%m')} {bar} {_num(round(v))} {unit}")
+    return "\n".join(lines)
+
+
+def format_overview(user_id: int) -> str | None:
+    rows = get_exercise_stats(user_id)
+    if not rows:
+        return None
+    lines = ["📈 Твои упражнения:\n"]
+    for st in rows:
+        best = f", рекорд {_num(st['best_weight'])} кг" if st["best_weight"] else f", макс {st['best_reps']} повт."
+        lines.append(f"• {st['exercise']} — {st['entries']} записей{best}")
+    lines.append("\nПодробно: /progress название")
+    return "\n".join(lines)
@@ -0,0 +1,32 @@
+"""
+Лёгкие read-модели для чтения из БД.
+
+Запросы в db.py выбирают только нужные колонки и возвращают эти объекты
+вместо ORM-сущностей: у них нет identity map / instrumentation, и их можно
+спокойно использовать после закрытия сессии.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+
+
+@dataclass(slots=True, frozen=True)
+class ReminderView:
+    id: int
+    user_id: int
+    reminder_type: str          # once, everyday, days
+    time: str                   # HH:MM
+    days: str | None            # 'пн,ср,пт' для type='days'
+    text: str
+    job_id: str | None
+    created_at: datetime | None
+    tg_id: int                  # telegram_id владельца
+    fire_at: datetime | None = None  # для once: момент срабатывания (naive UTC)
+    tz: str | None = None       # users.timezone владельца (None — зона по умолчанию)
+    tenant: str | None = None   # users.tenant владельца — через какого бота слать
+
+
+@dataclass(slots=True, frozen=True)
+class PlanRow:
+    """Минимум полей, нужный для подсчёта плана на день."""
+    reminder_type: str
+    days: str | None
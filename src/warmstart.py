@@ -0,0 +1,222 @@
+"""
+Снимок корзин планировщика для быстрого рестарта.
+
+Без снимка при старте читаются все активные напоминания и раскладываются
+по корзинам (зона, HH:MM) — время растёт с числом напоминаний. Снимок —
+бинарный файл с теми же корзинами; при старте он открывается через mmap,
+в память читается только таблица корзин (по ней ставятся cron-job'ы), а
+участники корзины разбираются, когда она впервые срабатывает или меняется.
+Потом дочитываются только изменения: напоминания и пользователи из событий
+после сохранённого events.id.
+
+Снимок годится, если совпадают версия формата, зона по умолчанию и
+событие с сохранённым id (та же база, не откаченная из бэкапа). Разовые и
+отложенные сюда не входят: разовые грузятся запросом по окну fire_at, у
+отложенных свой снимок (snooze.py).
+
+Формат (little-endian, области выровнены на 8 байт):
+
+    заголовок   HEADER + зона по умолчанию
+    корзины     BUCKET + имя зоны, по одной на корзину
+    данные      на корзину: id напоминаний (q × count), затем записи
+                MEMBER + арендатор + текст в том же порядке
+    индекс      все id по возрастанию (q × n) и номера их корзин (I × n)
+"""
+from bisect import bisect_left
+from datetime import datetime
+from typing import Iterable, NamedTuple
+import logging
+import mmap
+import os
+import struct
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"WBSN"
+VERSION = 2
+# magic, version, -, events.id, его at, saved_at, корзин, напоминаний, смещение индекса, длина зоны
+HEADER = struct.Struct("<4sHHqdqIIQH")
+BUCKET = struct.Struct("<BBHQIH")        # hour, minute, -, offset, count, tz_len
+MEMBER = struct.Struct("<qBBBI")         # tg_id, type, weekday mask, tenant_len, text_len
+
+TYPES = ("everyday", "days")
+EVERY_DAY = 0x80                         # в маске: weekdays=None
+
+
+class Member(NamedTuple):
+    reminder_id: int
+    tg_id: int
+    reminder_type: str
+    weekdays: frozenset[int] | None
+    text: str
+    tenant: str | None = None
+
+
+def _pad(n: int) -> int:
+    return -n % 8
+
+
+def _mask(weekdays) -> int:
+    if weekdays is None:
+        return EVERY_DAY
+    m = 0
+    for d in weekdays:
+        m |= 1 << d
+    return m
+
+
+def _weekdays(mask: int) -> frozenset[int] | None:
+    if mask & EVERY_DAY:
+        return None
+    return frozenset(d for d in range(7) if mask >> d & 1)
+
+
+def _timestamp(at: datetime | None) -> float:
+    return (at - datetime(1970, 1, 1)).total_seconds() if at else 0.0
+
+
+def encode_members(members: Iterable[Member]) -> tuple[list[int], bytes]:
+    """Корзина -> (id в порядке записей, байты записей)."""
+    ids, parts = [], []
+    for m in members:
+        tenant = (m.tenant or "").encode()
+        text = m.text.encode("utf-8")
+        ids.append(m.reminder_id)
+        parts.append(MEMBER.pack(m.tg_id, TYPES.index(m.reminder_type), _mask(m.weekdays),
+                                 len(tenant), len(text)))
+        parts.append(tenant + text)
+    return ids, b"".join(parts)
+
+
+class Snapshot:
+    """Открытый снимок: таблица корзин — в памяти, участники и индекс id — в mmap."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._parse()
+        except Exception as e:
+            self.close()
+            if isinstance(e, struct.error):
+                raise ValueError(f"снимок повреждён: {e}") from e
+            raise
+
+    def _parse(self) -> None:
+        mm = self._mm
+        (magic, version, _, self.event_id, self.event_at, saved_at, n_buckets, self.size,
+         index_offset, tz_len) = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("не тот формат снимка")
+        self.saved_at = datetime.utcfromtimestamp(saved_at)
+        pos = HEADER.size
+        self.default_tz = mm[pos:pos + tz_len].decode()
+        pos += tz_len + _pad(HEADER.size + tz_len)
+
+        # (зона, 'HH:MM'), смещение данных, число участников
+        self.keys: list[tuple[str, str]] = []
+        self._regions: list[tuple[int, int]] = []
+        for _ in range(n_buckets):
+            hour, minute, _, offset, count, name_len = BUCKET.unpack_from(mm, pos)
+            pos += BUCKET.size
+            self.keys.append((mm[pos:pos + name_len].decode(), f"{hour:02d}:{minute:02d}"))
+            pos += name_len
+            self._regions.append((offset, count))
+
+        n = self.size
+        if len(mm) != index_offset + 12 * n:
+            raise ValueError("снимок обрезан")
+        view = memoryview(mm)
+        self._ids = view[index_offset:index_offset + 8 * n].cast("q")
+        self._bucket_nos = view[index_offset + 8 * n:index_offset + 12 * n].cast("I")
+
+    def close(self) -> None:
+        for attr in ("_ids", "_bucket_nos"):
+            if hasattr(self, attr):
+                getattr(self, attr).release()
+        self._mm.close()
+
+    def matches(self, default_tz: str, event_at: datetime | None) -> bool:
+        """Та же база и та же зона по умолчанию: событие event_id на месте и с тем же at."""
+        return (self.default_tz == default_tz and self.event_id > 0 and event_at is not None
+                and _timestamp(event_at) == self.event_at)
+
+    def count(self, bucket_no: int) -> int:
+        return self._regions[bucket_no][1]
+
+    def bucket_of(self, reminder_id: int) -> int | None:
+        """Номер корзины напоминания (бинарный поиск по индексу) или None."""
+        i = bisect_left(self._ids, reminder_id)
+        if i < len(self._ids) and self._ids[i] == reminder_id:
+            return self._bucket_nos[i]
+        return None
+
+    def raw(self, bucket_no: int) -> tuple[list[int], bytes]:
+        """id и байты записей корзины как есть — для пересохранения без разбора."""
+        offset, count = self._regions[bucket_no]
+        ids = self._mm[offset:offset + 8 * count]
+        start = offset + 8 * count
+        pos = start
+        for _ in range(count):
+            _, _, _, tenant_len, text_len = MEMBER.unpack_from(self._mm, pos)
+            pos += MEMBER.size + tenant_len + text_len
+        return list(struct.unpack(f"<{count}q", ids)), self._mm[start:pos]
+
+    def read(self, bucket_no: int) -> list[Member]:
+        offset, count = self._regions[bucket_no]
+        mm = self._mm
+        ids = struct.unpack_from(f"<{count}q", mm, offset)
+        pos = offset + 8 * count
+        out = []
+        for rid in ids:
+            tg_id, type_no, mask, tenant_len, text_len = MEMBER.unpack_from(mm, pos)
+            pos += MEMBER.size
+            tenant = mm[pos:pos + tenant_len].decode() or None
+            pos += tenant_len
+            out.append(Member(rid, tg_id, TYPES[type_no], _weekdays(mask),
+                              mm[pos:pos + text_len].decode("utf-8"), tenant))
+            pos += text_len
+        return out
+
+
+def write(path: str, event_id: int, event_at: datetime | None, default_tz: str,
+          buckets: Iterable[tuple[tuple[str, str], list[int], bytes]]) -> int:
+    """
+    Записать снимок атомарно (tmp + os.replace). buckets — (ключ, id, байты записей),
+    см. encode_members и Snapshot.raw. Возвращает размер файла.
+    """
+    buckets = [b for b in buckets if b[1]]
+    tz = default_tz.encode()
+    head_len = HEADER.size + len(tz)
+    table_len = sum(BUCKET.size + len(key[0].encode()) for key, _, _ in buckets)
+    data_start = head_len + _pad(head_len) + table_len
+    data_start += _pad(data_start)
+
+    table, data, index = [], [], []
+    offset = data_start
+    for no, (key, ids, records) in enumerate(buckets):
+        hour, minute = map(int, key[1].split(":"))
+        name = key[0].encode()
+        table.append(BUCKET.pack(hour, minute, 0, offset, len(ids), len(name)) + name)
+        chunk = struct.pack(f"<{len(ids)}q", *ids) + records
+        chunk += b"\0" * _pad(len(chunk))
+        data.append(chunk)
+        offset += len(chunk)
+        index.extend((rid, no) for rid in ids)
+    index.sort()
+
+    header = HEADER.pack(MAGIC, VERSION, 0, event_id, _timestamp(event_at),
+                         int(_timestamp(datetime.utcnow())), len(buckets), len(index), offset, len(tz))
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(header + tz + b"\0" * _pad(head_len))
+        f.write(b"".join(table))
+        f.seek(data_start)          # выравнивание добивается нулями
+        for chunk in data:
+            f.write(chunk)
+        f.write(struct.pack(f"<{len(index)}q", *(rid for rid, _ in index)))
+        f.write(struct.pack(f"<{len(index)}I", *(no for _, no in index)))
+        size = f.tell()
+    os.replace(tmp, path)
+    return size
@@ -0,0 +1,20 @@
+"""
+Тесты работают на временной SQLite-базе: окружение задаётся до импорта src
+(config читает его при импорте).
+"""
+import os
+import tempfile
+
+import pytest
+
+_tmp = tempfile.mkdtemp(prefix="workout-bot-tests-")
+os.environ["BOT_TOKEN"] = "42:test"
+os.environ.pop("BOT_TOKENS", None)
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+
+
+@pytest.fixture(scope="session", autouse=True)
+def db():
+    from src.db import init_db
+
+    init_db()
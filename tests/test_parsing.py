@@ -0,0 +1,22 @@
+"""Разбор времени разовых напоминаний (/add)."""
+from datetime import datetime
+
+import pytest
+import pytz
+
+from src.parsing import parse_once_when
+
+NOW = pytz.timezone("Europe/Moscow").localize(datetime(2026, 10, 18, 12, 0, 30))
+
+
+@pytest.mark.parametrize("tokens", [["+0m"], ["+0h"], ["+0d", "13:00"], ["12:00"]])
+def test_rejects_now_and_past(tokens):
+    with pytest.raises(ValueError):
+        parse_once_when(tokens, NOW)
+
+
+def test_relative_is_in_future():
+    target, consumed = parse_once_when(["+1m"], NOW)
+    assert consumed == 1
+    assert target > NOW
+    assert (target.hour, target.minute) == (12, 1)
@@ -0,0 +1,64 @@
+"""Проекции: догон по частям даёт то же, что пересборка с нуля."""
+from datetime import datetime, timedelta
+
+from src import projections
+from src.db import _append_events, _event, get_db
+from src.models import ProjDaily, ProjReminder, ProjUser, ProjWeekly
+
+USER, OTHER = 9001, 9002
+
+
+def _log(events: list[dict]) -> None:
+    with get_db() as db:
+        _append_events(db, events)
+        db.commit()
+
+
+def _tables() -> dict:
+    with get_db() as db:
+        return {
+            model.__tablename__: sorted(
+                tuple(getattr(row, c.name) for c in model.__table__.columns)
+                for row in db.query(model).filter(model.user_id.in_((USER, OTHER)))
+            )
+            for model in (ProjReminder, ProjUser, ProjDaily, ProjWeekly)
+        }
+
+
+def test_catch_up_matches_rebuild():
+    now = datetime.utcnow()
+    start = now.replace(hour=9, minute=0, second=0, microsecond=0) - timedelta(days=10)
+    at = lambda days, hours=0: start + timedelta(days=days, hours=hours)
+
+    _log([
+        _event("reminder_created", USER, 901, at(0), reminder_type="everyday", time="07:00", text="Бег"),
+        _event("reminder_created", USER, 902, at(0, 1), reminder_type="days", time="19:00",
+               days="пн,ср,пт", text="Зал"),
+        _event("reminder_created", OTHER, 903, at(1), reminder_type="everyday", time="08:00", text="Йога"),
+        _event("reminder_sent", USER, 901, at(1)),
+        _event("workout_completed", USER, 901, at(1, 1)),
+        _event("reminder_sent", OTHER, 903, at(2)),
+        _event("timezone_changed", USER, None, at(2, 12), tz="America/New_York"),
+        _event("reminder_renamed", USER, 901, at(3), text="Бег 5 км"),
+        _event("reminder_sent", USER, 902, at(4, 10)),
+        _event("reminder_deleted", OTHER, 903, at(5)),
+    ])
+    projections.catch_up(batch=4)
+
+    # журнал хронологический: продолжение — уже после первого догона
+    _log([
+        _event("workout_completed", USER, 902, now - timedelta(minutes=3)),
+        _event("reminder_deactivated", USER, 902, now - timedelta(minutes=2)),
+        _event("reminder_created", OTHER, 904, now - timedelta(minutes=1), reminder_type="days",
+               time="06:00", days="вт,чт", text="Плавание"),
+    ])
+    projections.catch_up(batch=4)
+    incremental = _tables()
+
+    projections.rebuild(batch=4)
+    assert _tables() == incremental
+
+    planned, sent, done = (sum(row[i] for row in incremental["proj_daily"] if row[0] == USER)
+                           for i in (2, 3, 4))
+    assert planned > 0 and sent == 2 and done == 2
+    assert [row[2] for row in incremental["proj_users"] if row[0] == USER] == ["America/New_York"]
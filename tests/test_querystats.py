@@ -0,0 +1,91 @@
+"""Бюджеты SQL-запросов горячих путей и учёт запросов по апдейтам."""
+import asyncio
+from datetime import datetime, timedelta
+from itertools import count
+
+import pytest
+from aiogram.types import Chat, Message, Update, User as TgUser
+
+from src import challenges, querystats, streaks
+from src.db import (
+    bulk_create_reminders, finalize_past_weeks, get_db, get_or_create_user,
+    get_reminder_by_id, mark_workout_completed
+)
+from src.middlewares import QueryStatsMiddleware
+from src.models import CompletedWorkout
+from src.parsing import ReminderSpec
+
+_telegram_ids = count(1000)
+
+
+def _user_with_reminder() -> tuple[int, int, int]:
+    tg_id = next(_telegram_ids)
+    user_id, (reminder_id,) = bulk_create_reminders(
+        tg_id, [ReminderSpec("everyday", "07:00", "Бег", None, None)], first_name="Тест"
+    )
+    return tg_id, user_id, reminder_id
+
+
+def _done(tg_id: int, reminder_id: int) -> None:
+    """То же, что делает /done и кнопка «✅» (без Telegram)."""
+    user = get_or_create_user(telegram_id=tg_id, first_name="Тест")
+    reminder = get_reminder_by_id(reminder_id, user_id=user.id)
+    mark_workout_completed(reminder_id, user.id, reminder.text)
+    streaks.on_workout_completed(user.id, user.timezone)
+    challenges.on_workout_completed(user.id)
+
+
+def test_done_query_budget():
+    tg_id, _, reminder_id = _user_with_reminder()
+    _done(tg_id, reminder_id)          # первая отметка создаёт текст и серию
+    with querystats.assert_max_queries(7):
+        _done(tg_id, reminder_id)
+
+
+def test_finalize_past_weeks_query_budget():
+    _, user_id, reminder_id = _user_with_reminder()
+    with get_db() as db:
+        for days in (8, 15, 22):
+            db.add(CompletedWorkout(user_id=user_id, reminder_id=reminder_id,
+                                    completed_at=datetime.utcnow() - timedelta(days=days)))
+        db.commit()
+    assert finalize_past_weeks(user_id) > 0
+    # всё уже сведено: только чтение границ и сохранённых недель
+    with querystats.assert_max_queries(4):
+        assert finalize_past_weeks(user_id) == 0
+
+
+def test_assert_max_queries_fails_over_budget():
+    _, user_id, _ = _user_with_reminder()
+    with pytest.raises(AssertionError, match="Expected at most 1 queries"):
+        with querystats.assert_max_queries(1):
+            finalize_past_weeks(user_id)
+
+
+def _message(tg_id: int, text: str) -> Update:
+    return Update(update_id=1, message=Message(
+        message_id=1, date=datetime.now(), chat=Chat(id=tg_id, type="private"),
+        from_user=TgUser(id=tg_id, is_bot=False, first_name="Тест"), text=text,
+    ))
+
+
+def test_middleware_counts_statements_and_sessions():
+    tg_id, _, reminder_id = _user_with_reminder()
+    querystats.reset_aggregates()
+
+    async def handler(event, data):
+        user = get_or_create_user(telegram_id=tg_id, first_name="Тест")
+        get_reminder_by_id(reminder_id, user_id=user.id)
+
+    middleware = QueryStatsMiddleware(slow_ms=10_000)
+    for _ in range(2):
+        asyncio.run(middleware(handler, _message(tg_id, "привет"), {}))
+    asyncio.run(middleware(handler, _message(tg_id, "/nosuchcommand"), {}))
+
+    aggs = querystats.get_aggregates()
+    assert set(aggs) == {"message", "/other"}
+    message = aggs["message"]
+    assert message["updates"] == 2
+    assert message["sessions"] == 4
+    assert message["statements"] >= 4
+    assert message["max_statements"] == message["statements"] // 2
@@ -0,0 +1,30 @@
+"""Ежечасное закрытие дней серий: выбираются только пользователи с закончившимся днём."""
+from datetime import datetime, timedelta
+
+from src import querystats, streaks
+from src.db import bulk_create_reminders, get_db, get_streak, set_user_timezone
+from src.models import User
+from src.parsing import ReminderSpec
+
+
+def _user(tg_id: int, tz: str) -> int:
+    user_id, _ = bulk_create_reminders(tg_id, [ReminderSpec("everyday", "07:00", "Бег", None, None)])
+    set_user_timezone(user_id, tz)
+    with get_db() as db:
+        db.query(User).filter(User.id == user_id).update(
+            {User.created_at: datetime.utcnow() - timedelta(days=3)})
+        db.commit()
+    return user_id
+
+
+def test_close_yesterday_is_incremental():
+    ids = [_user(2001, "Pacific/Kiritimati"), _user(2002, "Pacific/Pago_Pago"), _user(2003, "Europe/Moscow")]
+    streaks.close_yesterday()
+    for uid in ids:
+        st = get_streak(uid)
+        assert st["last_evaluated_date"] is not None
+        assert st["current"] == 0
+
+    # дни уже закрыты во всех зонах: зоны + одна пустая страница, никого не обновляем
+    with querystats.assert_max_queries(2):
+        assert streaks.close_yesterday() == 0
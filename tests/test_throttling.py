@@ -0,0 +1,43 @@
+"""Троттлинг раздельный для каждого бота (арендатора)."""
+import asyncio
+from datetime import datetime
+
+from aiogram.types import Chat, Message, User as TgUser
+
+from src import tenants
+from src.middlewares import ThrottlingMiddleware
+from src.ratelimit import BucketRegistry
+
+
+class _Message(Message):
+    async def answer(self, text, **kwargs):
+        replies.append(text)
+
+
+replies: list[str] = []
+
+
+def _message(text: str) -> Message:
+    return _Message(message_id=1, date=datetime.now(), chat=Chat(id=7, type="private"),
+                    from_user=TgUser(id=7, is_bot=False, first_name="Тест"), text=text)
+
+
+def test_buckets_are_per_tenant():
+    middleware = ThrottlingMiddleware(
+        heavy_commands={"/stats"},
+        cheap=BucketRegistry(0.001, 1), heavy=BucketRegistry(0.001, 1),
+    )
+    handled = []
+
+    async def handler(event, data):
+        handled.append(tenants.current())
+
+    async def run():
+        for name in ("main", "main", "gym2"):
+            with tenants.use(name):
+                await middleware(handler, _message("/stats"), {})
+
+    asyncio.run(run())
+    # второй /stats в main упёрся в лимит, у того же человека в gym2 — свой bucket
+    assert handled == ["main", "gym2"]
+    assert len(replies) == 1
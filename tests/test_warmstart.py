@@ -0,0 +1,61 @@
+"""Снимок корзин: что записано через write, то же читается из Snapshot."""
+from datetime import datetime
+
+import pytest
+
+from src import warmstart
+from src.warmstart import Member, Snapshot, encode_members
+
+
+def _buckets():
+    moscow = [
+        Member(7, 1001, "everyday", None, "Бег", "main"),
+        Member(3, 1002, "days", frozenset({0, 2, 4}), "Присед 5×5", None),
+    ]
+    kiritimati = [Member(12, 1003, "days", frozenset({6}), "", "gym2")]
+    return {("Europe/Moscow", "07:30"): moscow, ("Pacific/Kiritimati", "23:05"): kiritimati}
+
+
+def test_write_read_round_trip(tmp_path):
+    path = str(tmp_path / "buckets.snap")
+    at = datetime(2026, 3, 1, 12, 0, 0)
+    buckets = _buckets()
+    warmstart.write(path, 42, at, "Asia/Almaty",
+                    ((key, *encode_members(members)) for key, members in buckets.items()))
+
+    snap = Snapshot(path)
+    try:
+        assert snap.event_id == 42
+        assert snap.matches("Asia/Almaty", at)
+        assert not snap.matches("Europe/Moscow", at)
+        assert snap.keys == list(buckets)
+        for no, members in enumerate(buckets.values()):
+            assert snap.count(no) == len(members)
+            assert snap.read(no) == members
+            for m in members:
+                assert snap.bucket_of(m.reminder_id) == no
+        assert snap.bucket_of(5) is None
+        assert snap.bucket_of(100) is None
+
+        # raw → write без разбора даёт те же корзины
+        again = str(tmp_path / "again.snap")
+        warmstart.write(again, 43, at, "Asia/Almaty",
+                        ((key, *snap.raw(no)) for no, key in enumerate(snap.keys)))
+    finally:
+        snap.close()
+
+    copy = Snapshot(again)
+    try:
+        assert [copy.read(no) for no in range(len(copy.keys))] == list(buckets.values())
+    finally:
+        copy.close()
+
+
+def test_truncated_snapshot_is_rejected(tmp_path):
+    path = str(tmp_path / "buckets.snap")
+    warmstart.write(path, 1, datetime(2026, 3, 1), "Asia/Almaty",
+                    ((key, *encode_members(members)) for key, members in _buckets().items()))
+    with open(path, "r+b") as f:
+        f.truncate(f.seek(0, 2) - 4)
+    with pytest.raises(ValueError):
+        Snapshot(path)